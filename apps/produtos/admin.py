@@ -1,5 +1,14 @@
-from django.contrib import admin
-from .models import Produto
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import ERROR_FLAG, IGNORED_PARAMS, PAGE_VAR, SEARCH_VAR
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, Http404
+from django.template.response import TemplateResponse
+from django.urls import path
+
+from .arquivamento import arquivar, restaurar
+from .contagens import PaginadorContagem
+from .models import HistoricoProduto, Produto, ProdutoArquivado
+from .perfilamento import caminho_captura, configuracao, listar_capturas
 
 # Register your models here.
 
@@ -17,6 +26,9 @@ class ProdutoAdmin(admin.ModelAdmin):
     ]
     search_fields = ['nome', 'categoria_terapeutica']
     readonly_fields = ['data_criacao', 'data_atualizacao', 'tem_risco', 'explicacao_risco']
+    actions = ['arquivar_selecionados']
+    # O total vem do PaginadorContagem; sem filtros ele já é o total geral
+    show_full_result_count = False
     
     fieldsets = (
         ('Informações Básicas', {
@@ -41,3 +53,120 @@ class ProdutoAdmin(admin.ModelAdmin):
         return obj.tem_risco
     tem_risco.boolean = True
     tem_risco.short_description = 'Tem Risco'
+    
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        """
+        Paginador com o total vindo das contagens por combinação, em vez de `COUNT(*)`.
+
+        Os filtros da lateral (categoria, status, espectro) dão um total exato;
+        a busca e os demais filtros, um total estimado.
+        """
+        filtros = {
+            parametro: valor for parametro, valor in request.GET.items()
+            if parametro not in (*IGNORED_PARAMS, PAGE_VAR, ERROR_FLAG)
+        }
+        if request.GET.get(SEARCH_VAR):
+            filtros[SEARCH_VAR] = request.GET[SEARCH_VAR]
+        return PaginadorContagem(
+            queryset, per_page, filtros=filtros, orphans=orphans, allow_empty_first_page=allow_empty_first_page
+        )
+    
+    @admin.action(description='Arquivar produtos selecionados')
+    def arquivar_selecionados(self, request, queryset):
+        """
+        Move os produtos selecionados para o arquivo.
+        """
+        quantidade = arquivar(list(queryset.values_list('pk', flat=True)))
+        self.message_user(request, f"{quantidade} produto(s) arquivado(s).", messages.SUCCESS)
+    
+    def get_urls(self):
+        """
+        Adiciona as páginas de perfis de requisições capturados.
+        """
+        urls = [
+            path('perfis/', self.admin_site.admin_view(self.perfis_view), name='produtos_perfis'),
+            path(
+                'perfis/<str:nome>/<str:extensao>/',
+                self.admin_site.admin_view(self.perfil_download_view),
+                name='produtos_perfil_download',
+            ),
+        ]
+        return urls + super().get_urls()
+    
+    def verificar_acesso_perfis(self, request):
+        """
+        Só superusuários veem os perfis: trazem o SQL e os parâmetros das requisições.
+        """
+        if not request.user.is_superuser:
+            raise PermissionDenied
+    
+    def perfis_view(self, request):
+        """
+        Lista os perfis capturados pelo PerfilamentoMiddleware.
+        """
+        self.verificar_acesso_perfis(request)
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Perfis de Requisições',
+            'opts': self.model._meta,
+            'capturas': listar_capturas(),
+            'configuracao': configuracao(),
+        }
+        return TemplateResponse(request, 'admin/produtos/perfis.html', context)
+    
+    def perfil_download_view(self, request, nome, extensao):
+        """
+        Download de um perfil (.prof do cProfile ou .json com as consultas).
+        """
+        self.verificar_acesso_perfis(request)
+        caminho = caminho_captura(nome, extensao)
+        if caminho is None:
+            raise Http404("Perfil não encontrado.")
+        return FileResponse(open(caminho, 'rb'), as_attachment=True, filename=caminho.name)
+
+
+@admin.register(HistoricoProduto)
+class HistoricoProdutoAdmin(admin.ModelAdmin):
+    """
+    Consulta do histórico de alterações (somente leitura).
+    """
+    list_display = ['produto_id', 'operacao', 'momento', 'alteracoes']
+    list_filter = ['operacao', 'momento']
+    search_fields = ['=produto_id']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ProdutoArquivado)
+class ProdutoArquivadoAdmin(admin.ModelAdmin):
+    """
+    Consulta dos produtos arquivados, com ação para restaurá-los ao catálogo ativo.
+    """
+    list_display = [
+        'id', 'nome', 'tipo_espectro', 'thc_percentual', 'cbd_percentual',
+        'categoria_terapeutica', 'status_anvisa', 'data_atualizacao', 'data_arquivamento'
+    ]
+    list_filter = ['categoria_terapeutica', 'status_anvisa', 'data_arquivamento']
+    search_fields = ['nome', '=id']
+    actions = ['restaurar_selecionados']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    @admin.action(description='Restaurar para o catálogo ativo')
+    def restaurar_selecionados(self, request, queryset):
+        """
+        Devolve os produtos selecionados à tabela ativa.
+        """
+        quantidade = restaurar(list(queryset.values_list('pk', flat=True)))
+        self.message_user(request, f"{quantidade} produto(s) restaurado(s).", messages.SUCCESS)
@@ -0,0 +1,419 @@
+"""
+Controle de admissão e descarte de carga da API.
+
+O `AdmissaoMiddleware` protege as rotas em `ADMISSAO['PREFIXOS']` em duas
+etapas, antes que as requisições se acumulem na fila do SQLite:
+
+- limite de taxa por cliente (IP), com um balde de fichas: `TAXA_POR_CLIENTE`
+  requisições por segundo, com rajadas de até `RAJADA_POR_CLIENTE`. Acima
+  disso a resposta é 429 com `Retry-After`. Os baldes ficam na memória do
+  processo (`BACKEND = 'local'`) ou em um arquivo mapeado em memória
+  compartilhado pelos workers (`'compartilhado'`, com `flock`);
+- limite de concorrência por endpoint: no máximo `CONCORRENCIA_POR_ENDPOINT`
+  requisições executando ao mesmo tempo em cada view (ajustável por view em
+  `LIMITES_ENDPOINT`). As excedentes esperam na fila até `ALVO_LATENCIA`
+  segundos; se a espera estimada já passa do alvo, ou o prazo se esgota, a
+  resposta é 503 com `Retry-After`, na hora.
+
+O cliente é o `REMOTE_ADDR`. Atrás de um proxy reverso todos os clientes
+chegam com o endereço do proxy e dividem um único balde: nesse caso ligue
+`CONFIAR_X_FORWARDED_FOR` (só se o proxy sobrescreve o cabeçalho), ou o
+limite de taxa passa a valer para o tráfego inteiro. O middleware registra
+um aviso na primeira requisição com `X-Forwarded-For` ignorado.
+
+Nas views com `coalescer_leituras`, a vaga de um GET só é ocupada pela
+requisição que de fato executa a view (a líder); as seguidoras, que apenas
+aguardam a resposta da líder, não ocupam vaga (veja `ocupar_vaga`).
+"""
+import hashlib
+import logging
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.http import JsonResponse
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Peso da última duração na média móvel do tempo de atendimento de cada endpoint
+PESO_MEDIA_ATENDIMENTO = 0.2
+
+# Clientes lembrados pelo backend local (os menos recentes são descartados)
+MAXIMO_CLIENTES_LOCAIS = 10000
+
+
+def configuracao():
+    """
+    Configuração do controle de admissão, com valores padrão para chaves ausentes.
+    """
+    return {
+        'ATIVO': True,
+        'PREFIXOS': ['/api/'],
+        'TAXA_POR_CLIENTE': 20.0,
+        'RAJADA_POR_CLIENTE': 40,
+        'BACKEND': 'local',
+        'ARQUIVO_COMPARTILHADO': '',
+        'POSICOES_COMPARTILHADAS': 8192,
+        'CONFIAR_X_FORWARDED_FOR': False,
+        'CONCORRENCIA_POR_ENDPOINT': 8,
+        'LIMITES_ENDPOINT': {},
+        'ALVO_LATENCIA': 0.5,
+        **getattr(settings, 'ADMISSAO', {}),
+    }
+
+
+def _espera_por_ficha(fichas, taxa):
+    """
+    Segundos até o balde ter uma ficha inteira.
+    """
+    return (1 - fichas) / taxa
+
+
+class BaldesLocais:
+    """
+    Baldes de fichas por cliente, na memória deste processo.
+    """
+
+    def __init__(self, taxa, rajada, maximo_clientes=MAXIMO_CLIENTES_LOCAIS):
+        self.taxa = taxa
+        self.rajada = rajada
+        self.maximo_clientes = maximo_clientes
+        self._baldes = OrderedDict()
+        self._trava = threading.Lock()
+
+    def consumir(self, cliente):
+        """
+        Consome uma ficha do cliente.
+
+        Retorna 0 se a requisição foi admitida ou, se o balde está vazio, os
+        segundos até a próxima ficha.
+        """
+        agora = time.monotonic()
+        with self._trava:
+            fichas, ultimo = self._baldes.pop(cliente, (self.rajada, agora))
+            fichas = min(self.rajada, fichas + (agora - ultimo) * self.taxa)
+            espera = 0.0
+            if fichas >= 1:
+                fichas -= 1
+            else:
+                espera = _espera_por_ficha(fichas, self.taxa)
+            self._baldes[cliente] = (fichas, agora)
+            if len(self._baldes) > self.maximo_clientes:
+                self._baldes.popitem(last=False)
+        return espera
+
+
+class BaldesCompartilhados:
+    """
+    Baldes de fichas em um arquivo mapeado em memória, compartilhado pelos
+    processos da mesma máquina.
+
+    O arquivo é uma tabela de `posicoes` registros (hash do cliente, fichas,
+    instante); cada cliente ocupa a posição do seu hash. Em uma colisão, o
+    cliente novo assume a posição com o balde cheio. Leitura e escrita de um
+    registro acontecem sob `flock` exclusivo no arquivo.
+    """
+    REGISTRO = struct.Struct('<Qdd')
+
+    def __init__(self, caminho, taxa, rajada, posicoes):
+        if fcntl is None:
+            raise ImproperlyConfigured("O backend compartilhado de admissão requer fcntl (Unix).")
+        self.taxa = taxa
+        self.rajada = rajada
+        self.posicoes = posicoes
+        self._trava = threading.Lock()
+
+        tamanho = self.REGISTRO.size * posicoes
+        descritor = os.open(caminho, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(descritor).st_size < tamanho:
+                os.ftruncate(descritor, tamanho)
+            self._memoria = mmap.mmap(descritor, tamanho)
+        except BaseException:
+            os.close(descritor)
+            raise
+        self._descritor = descritor
+
+    def consumir(self, cliente):
+        """
+        Consome uma ficha do cliente (mesmo retorno de `BaldesLocais.consumir`).
+        """
+        chave = int.from_bytes(hashlib.blake2b(cliente.encode(), digest_size=8).digest(), 'little') or 1
+        deslocamento = (chave % self.posicoes) * self.REGISTRO.size
+        agora = time.time()
+        with self._trava:
+            fcntl.flock(self._descritor, fcntl.LOCK_EX)
+            try:
+                dono, fichas, ultimo = self.REGISTRO.unpack_from(self._memoria, deslocamento)
+                if dono != chave:
+                    fichas, ultimo = self.rajada, agora
+                fichas = min(self.rajada, fichas + max(0.0, agora - ultimo) * self.taxa)
+                espera = 0.0
+                if fichas >= 1:
+                    fichas -= 1
+                else:
+                    espera = _espera_por_ficha(fichas, self.taxa)
+                self.REGISTRO.pack_into(self._memoria, deslocamento, chave, fichas, agora)
+            finally:
+                fcntl.flock(self._descritor, fcntl.LOCK_UN)
+        return espera
+
+
+def _arquivo_compartilhado_padrao():
+    diretorio = Path('/dev/shm')
+    if not diretorio.is_dir():
+        diretorio = Path(tempfile.gettempdir())
+    return diretorio / f'produtos-admissao-{Path(settings.BASE_DIR).name}'
+
+
+class LimiteConcorrencia:
+    """
+    Limite de requisições simultâneas de um endpoint, com fila de espera curta.
+    """
+
+    def __init__(self, limite):
+        self.limite = limite
+        self.em_execucao = 0
+        self.na_fila = 0
+        self.tempo_medio = 0.0
+        self._condicao = threading.Condition()
+
+    def _espera_estimada(self):
+        # Cada vaga libera, em média, uma requisição a cada tempo_medio segundos
+        return (self.na_fila + 1) * self.tempo_medio / self.limite
+
+    def entrar(self, alvo):
+        """
+        Ocupa uma vaga, esperando no máximo `alvo` segundos.
+
+        Retorna None se a requisição foi admitida ou, se foi rejeitada, a
+        espera estimada em segundos.
+        """
+        with self._condicao:
+            if self.em_execucao < self.limite and not self.na_fila:
+                self.em_execucao += 1
+                return None
+            estimada = self._espera_estimada()
+            if estimada > alvo:
+                return estimada
+
+            prazo = time.monotonic() + alvo
+            self.na_fila += 1
+            try:
+                while self.em_execucao >= self.limite:
+                    restante = prazo - time.monotonic()
+                    if restante <= 0:
+                        return max(estimada, alvo)
+                    self._condicao.wait(restante)
+                self.em_execucao += 1
+                return None
+            finally:
+                self.na_fila -= 1
+
+    def sair(self, duracao):
+        """
+        Libera a vaga e atualiza o tempo médio de atendimento.
+        """
+        with self._condicao:
+            self.em_execucao -= 1
+            if self.tempo_medio:
+                self.tempo_medio += PESO_MEDIA_ATENDIMENTO * (duracao - self.tempo_medio)
+            else:
+                self.tempo_medio = duracao
+            self._condicao.notify()
+
+    def estatisticas(self):
+        with self._condicao:
+            return {
+                'limite': self.limite,
+                'em_execucao': self.em_execucao,
+                'na_fila': self.na_fila,
+                'tempo_medio_ms': round(self.tempo_medio * 1000, 3),
+            }
+
+
+class ControleAdmissao:
+    """
+    Baldes por cliente, limites por endpoint e contadores de decisões.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        if config['BACKEND'] == 'compartilhado':
+            self.baldes = BaldesCompartilhados(
+                config['ARQUIVO_COMPARTILHADO'] or _arquivo_compartilhado_padrao(),
+                config['TAXA_POR_CLIENTE'],
+                config['RAJADA_POR_CLIENTE'],
+                config['POSICOES_COMPARTILHADAS'],
+            )
+        elif config['BACKEND'] == 'local':
+            self.baldes = BaldesLocais(config['TAXA_POR_CLIENTE'], config['RAJADA_POR_CLIENTE'])
+        else:
+            raise ImproperlyConfigured(f"Backend de admissão desconhecido: {config['BACKEND']!r}")
+        self._limites = {}
+        self._trava = threading.Lock()
+        self.admitidas = 0
+        self.limitadas = 0
+        self.descartadas = 0
+
+    def limite(self, endpoint):
+        with self._trava:
+            limite = self._limites.get(endpoint)
+            if limite is None:
+                maximo = self.config['LIMITES_ENDPOINT'].get(
+                    endpoint, self.config['CONCORRENCIA_POR_ENDPOINT']
+                )
+                limite = self._limites[endpoint] = LimiteConcorrencia(maximo)
+            return limite
+
+    def contar(self, decisao):
+        with self._trava:
+            setattr(self, decisao, getattr(self, decisao) + 1)
+
+    def estatisticas(self):
+        with self._trava:
+            limites = dict(self._limites)
+            contadores = {
+                'admitidas': self.admitidas,
+                'limitadas': self.limitadas,
+                'descartadas': self.descartadas,
+            }
+        return {
+            **contadores,
+            'backend': self.config['BACKEND'],
+            'endpoints': {endpoint: limite.estatisticas() for endpoint, limite in limites.items()},
+        }
+
+
+# Controle do middleware ativo neste processo (None se desligado)
+controle = None
+
+
+def estatisticas():
+    """
+    Contadores do controle de admissão deste processo, ou None se desligado.
+    """
+    return controle.estatisticas() if controle is not None else None
+
+
+def _resposta_rejeitada(status, mensagem, espera):
+    segundos = max(1, math.ceil(espera))
+    resposta = JsonResponse({'detail': mensagem.format(segundos=segundos)}, status=status)
+    resposta['Retry-After'] = str(segundos)
+    return resposta
+
+
+def endereco_cliente(request, config=None):
+    """
+    Endereço do cliente: o `REMOTE_ADDR`, ou o primeiro do `X-Forwarded-For`
+    com `CONFIAR_X_FORWARDED_FOR`.
+    """
+    config = config or configuracao()
+    if config['CONFIAR_X_FORWARDED_FOR']:
+        encaminhado = request.META.get('HTTP_X_FORWARDED_FOR', '')
+        if encaminhado:
+            return encaminhado.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def ocupar_vaga(request):
+    """
+    Ocupa a vaga de concorrência adiada pelo middleware para uma leitura coalescível.
+
+    Chamada pela coalescência apenas quando a requisição vai executar a view.
+    Retorna a resposta 503 se a requisição foi descartada, ou None.
+    """
+    adiada = getattr(request, '_admissao_adiada', None)
+    if adiada is None:
+        return None
+    del request._admissao_adiada
+    middleware, limite = adiada
+    return middleware.ocupar(request, limite)
+
+
+class AdmissaoMiddleware:
+    """
+    Middleware de limite de taxa por cliente e de concorrência por endpoint.
+
+    Fica desligado (`MiddlewareNotUsed`) se `ADMISSAO['ATIVO']` for falso.
+    """
+
+    def __init__(self, get_response):
+        global controle
+        config = configuracao()
+        if not config['ATIVO']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.config = config
+        self.controle = controle = ControleAdmissao(config)
+        self._avisou_proxy = False
+
+    def _protegida(self, request):
+        return request.path.startswith(tuple(self.config['PREFIXOS']))
+
+    def _cliente(self, request):
+        if (
+            not self.config['CONFIAR_X_FORWARDED_FOR'] and not self._avisou_proxy
+            and 'HTTP_X_FORWARDED_FOR' in request.META
+        ):
+            self._avisou_proxy = True
+            logger.warning(
+                "Requisição com X-Forwarded-For, mas ADMISSAO['CONFIAR_X_FORWARDED_FOR'] está desligado: "
+                "atrás de um proxy, todos os clientes dividem o balde do endereço do proxy."
+            )
+        return endereco_cliente(request, self.config)
+
+    def __call__(self, request):
+        if not self._protegida(request):
+            return self.get_response(request)
+
+        espera = self.controle.baldes.consumir(self._cliente(request))
+        if espera:
+            self.controle.contar('limitadas')
+            return _resposta_rejeitada(
+                429, "Limite de requisições excedido. Tente novamente em {segundos}s.", espera
+            )
+
+        try:
+            return self.get_response(request)
+        finally:
+            ocupada = getattr(request, '_admissao_limite', None)
+            if ocupada is not None:
+                limite, inicio = ocupada
+                limite.sair(time.monotonic() - inicio)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not self._protegida(request) or request.resolver_match is None:
+            return None
+        limite = self.controle.limite(request.resolver_match.view_name)
+        if request.method == 'GET' and getattr(view_func, 'coalescer_leituras', False):
+            request._admissao_adiada = (self, limite)
+            return None
+        return self.ocupar(request, limite)
+
+    def ocupar(self, request, limite):
+        """
+        Ocupa uma vaga do endpoint; retorna a resposta 503 se a requisição foi descartada.
+        """
+        espera = limite.entrar(self.config['ALVO_LATENCIA'])
+        if espera is not None:
+            self.controle.contar('descartadas')
+            return _resposta_rejeitada(
+                503, "Serviço sobrecarregado. Tente novamente em {segundos}s.", espera
+            )
+        self.controle.contar('admitidas')
+        request._admissao_limite = (limite, time.monotonic())
+        return None
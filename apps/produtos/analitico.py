@@ -0,0 +1,265 @@
+"""
+Análises estatísticas de THC/CBD sobre um instantâneo colunar do catálogo.
+
+As colunas numéricas e categóricas dos produtos são carregadas uma única vez
+em arrays NumPy (`Instantaneo`) e reaproveitadas enquanto a versão do
+catálogo não mudar. Percentis, histogramas e a distribuição da razão THC:CBD
+são calculados de forma vetorizada, por categoria terapêutica e por tipo de
+espectro, sem instanciar nem serializar um `Produto` sequer.
+"""
+import threading
+
+import numpy as np
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+
+from .models import Produto
+
+# Percentis reportados para THC e CBD
+PERCENTIS = (5, 25, 50, 75, 95)
+
+# Intervalos padrão e máximo dos histogramas
+INTERVALOS_PADRAO = 10
+INTERVALOS_MAXIMO = 100
+
+# Faixas da razão THC:CBD (limites superiores abertos); CBD zero fica em 'sem_cbd'
+FAIXAS_RAZAO = (
+    ('cbd_dominante', 1 / 20),     # abaixo de 1:20
+    ('cbd_predominante', 1 / 2),   # de 1:20 a 1:2
+    ('equilibrado', 2.0),          # de 1:2 a 2:1
+    ('thc_predominante', np.inf),  # acima de 2:1
+)
+SEM_CBD = 'sem_cbd'
+
+# Limite de THC para aprovação pela ANVISA (mesma regra do serializer)
+LIMITE_THC = 0.3
+
+CASAS_DECIMAIS = 4
+
+
+def _codigos(choices):
+    """
+    Valores de um campo com choices, na ordem dos códigos usados nos arrays.
+    """
+    return [valor for valor, _ in choices]
+
+
+ESPECTROS = _codigos(Produto.TIPO_ESPECTRO_CHOICES)
+CATEGORIAS = _codigos(Produto.CATEGORIA_TERAPEUTICA_CHOICES)
+STATUS = _codigos(Produto.STATUS_ANVISA_CHOICES)
+
+
+class Instantaneo:
+    """
+    Colunas do catálogo em arrays NumPy, associadas a uma versão do catálogo.
+
+    Valores categóricos são guardados como códigos inteiros (índice nos
+    choices do modelo); valores fora dos choices recebem -1.
+    """
+
+    def __init__(self, versao, thc, cbd, espectro, categoria, status):
+        self.versao = versao
+        self.thc = thc
+        self.cbd = cbd
+        self.espectro = espectro
+        self.categoria = categoria
+        self.status = status
+
+    def __len__(self):
+        return len(self.thc)
+
+    @classmethod
+    def carregar(cls, versao):
+        """
+        Lê as colunas de todos os produtos em uma única consulta.
+        """
+        linhas = Produto.objects.order_by().values_list(
+            Cast(F('thc_percentual'), FloatField()),
+            Cast(F('cbd_percentual'), FloatField()),
+            'tipo_espectro',
+            'categoria_terapeutica',
+            'status_anvisa',
+        )
+        colunas = list(zip(*linhas)) or [(), (), (), (), ()]
+        thc, cbd, espectros, categorias, status = colunas
+        return cls(
+            versao,
+            thc=np.array(thc, dtype=np.float64),
+            cbd=np.array(cbd, dtype=np.float64),
+            espectro=_codificar(espectros, ESPECTROS),
+            categoria=_codificar(categorias, CATEGORIAS),
+            status=_codificar(status, STATUS),
+        )
+
+
+def _codificar(valores, choices):
+    """
+    Converte valores categóricos em códigos int8 (posição nos choices).
+    """
+    indices = {valor: codigo for codigo, valor in enumerate(choices)}
+    return np.fromiter((indices.get(valor, -1) for valor in valores), dtype=np.int8, count=len(valores))
+
+
+_instantaneo = None
+_trava = threading.Lock()
+
+
+def instantaneo_atual(versao):
+    """
+    Instantâneo da versão informada do catálogo, recarregado só quando ela muda.
+
+    A trava garante que requisições simultâneas após uma escrita disparem uma
+    única recarga.
+    """
+    global _instantaneo
+    atual = _instantaneo
+    if atual is not None and atual.versao == versao:
+        return atual
+    with _trava:
+        if _instantaneo is None or _instantaneo.versao != versao:
+            _instantaneo = Instantaneo.carregar(versao)
+        return _instantaneo
+
+
+def invalidar_instantaneo():
+    """
+    Descarta o instantâneo em memória; a próxima consulta o recarrega do banco.
+    """
+    global _instantaneo
+    with _trava:
+        _instantaneo = None
+
+
+def _arredondar(valores):
+    return [round(float(valor), CASAS_DECIMAIS) for valor in valores]
+
+
+def _resumo(valores, bordas):
+    """
+    Estatísticas de uma coluna: contagem, média, extremos, percentis e histograma.
+    """
+    if not len(valores):
+        return {
+            'quantidade': 0,
+            'media': None,
+            'minimo': None,
+            'maximo': None,
+            'percentis': {f'p{p}': None for p in PERCENTIS},
+            'histograma': [0] * (len(bordas) - 1),
+        }
+    percentis = np.percentile(valores, PERCENTIS)
+    histograma, _ = np.histogram(valores, bins=bordas)
+    return {
+        'quantidade': int(len(valores)),
+        'media': round(float(valores.mean()), CASAS_DECIMAIS),
+        'minimo': round(float(valores.min()), CASAS_DECIMAIS),
+        'maximo': round(float(valores.max()), CASAS_DECIMAIS),
+        'percentis': dict(zip((f'p{p}' for p in PERCENTIS), _arredondar(percentis))),
+        'histograma': histograma.tolist(),
+    }
+
+
+def _faixas_razao(thc, cbd):
+    """
+    Código da faixa da razão THC:CBD de cada produto (o último é 'sem_cbd').
+    """
+    com_cbd = cbd > 0
+    razao = np.divide(thc, cbd, out=np.zeros_like(thc), where=com_cbd)
+    limites = np.array([limite for _, limite in FAIXAS_RAZAO[:-1]])
+    faixas = np.searchsorted(limites, razao, side='right')
+    faixas[~com_cbd] = len(FAIXAS_RAZAO)
+    return faixas, razao, com_cbd
+
+
+def _grupos(instantaneo, mascara, codigos, nomes, bordas_thc, bordas_cbd, faixas, razao, com_cbd):
+    """
+    Estatísticas de cada grupo de um campo categórico.
+
+    A contagem das faixas de razão por grupo sai de um único `bincount`
+    sobre o par (grupo, faixa).
+    """
+    rotulos_faixas = [nome for nome, _ in FAIXAS_RAZAO] + [SEM_CBD]
+    codigos = codigos[mascara]
+    validos = codigos >= 0
+    contagem_faixas = np.bincount(
+        codigos[validos] * len(rotulos_faixas) + faixas[mascara][validos],
+        minlength=len(nomes) * len(rotulos_faixas),
+    ).reshape(len(nomes), len(rotulos_faixas))
+
+    thc = instantaneo.thc[mascara]
+    cbd = instantaneo.cbd[mascara]
+    razao = razao[mascara]
+    com_cbd = com_cbd[mascara]
+
+    grupos = {}
+    for codigo, nome in enumerate(nomes):
+        do_grupo = codigos == codigo
+        razoes = razao[do_grupo & com_cbd]
+        grupos[nome] = {
+            'quantidade': int(do_grupo.sum()),
+            'thc': _resumo(thc[do_grupo], bordas_thc),
+            'cbd': _resumo(cbd[do_grupo], bordas_cbd),
+            'razao_thc_cbd': {
+                'mediana': round(float(np.median(razoes)), CASAS_DECIMAIS) if len(razoes) else None,
+                'faixas': dict(zip(rotulos_faixas, contagem_faixas[codigo].tolist())),
+            },
+        }
+    return grupos
+
+
+def _bordas(valores, intervalos):
+    """
+    Bordas comuns do histograma, de zero até o maior valor do catálogo.
+    """
+    maximo = float(valores.max()) if len(valores) else 0.0
+    return np.linspace(0.0, maximo or 1.0, intervalos + 1)
+
+
+def analisar(instantaneo, intervalos=INTERVALOS_PADRAO, status_anvisa=None):
+    """
+    Distribuições de THC/CBD do catálogo, no geral e por categoria e espectro.
+
+    Os histogramas de todos os grupos usam as mesmas bordas, para que sejam
+    comparáveis entre si. `status_anvisa` restringe a análise a um status.
+    """
+    mascara = np.ones(len(instantaneo), dtype=bool)
+    if status_anvisa:
+        mascara &= instantaneo.status == STATUS.index(status_anvisa)
+
+    thc = instantaneo.thc[mascara]
+    cbd = instantaneo.cbd[mascara]
+    bordas_thc = _bordas(thc, intervalos)
+    bordas_cbd = _bordas(cbd, intervalos)
+    faixas, razao, com_cbd = _faixas_razao(instantaneo.thc, instantaneo.cbd)
+    argumentos = (bordas_thc, bordas_cbd, faixas, razao, com_cbd)
+
+    rotulos_faixas = [nome for nome, _ in FAIXAS_RAZAO] + [SEM_CBD]
+    razoes = razao[mascara & com_cbd]
+    return {
+        'versao_catalogo': instantaneo.versao,
+        'status_anvisa': status_anvisa,
+        'quantidade': int(mascara.sum()),
+        'acima_limite_thc': int((thc > LIMITE_THC).sum()),
+        'percentis': list(PERCENTIS),
+        'bordas_histograma': {
+            'thc': _arredondar(bordas_thc),
+            'cbd': _arredondar(bordas_cbd),
+        },
+        'geral': {
+            'thc': _resumo(thc, bordas_thc),
+            'cbd': _resumo(cbd, bordas_cbd),
+            'razao_thc_cbd': {
+                'mediana': round(float(np.median(razoes)), CASAS_DECIMAIS) if len(razoes) else None,
+                'faixas': dict(zip(
+                    rotulos_faixas,
+                    np.bincount(faixas[mascara], minlength=len(rotulos_faixas)).tolist(),
+                )),
+            },
+        },
+        'por_categoria_terapeutica': _grupos(
+            instantaneo, mascara, instantaneo.categoria, CATEGORIAS, *argumentos
+        ),
+        'por_tipo_espectro': _grupos(
+            instantaneo, mascara, instantaneo.espectro, ESPECTROS, *argumentos
+        ),
+    }
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ProdutosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.produtos'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,125 @@
+"""
+Arquivamento de produtos antigos (partição quente/fria do catálogo).
+
+Produtos que se enquadram na política de `ARQUIVAMENTO` (status e tempo
+sem atualização) são movidos em lotes da tabela ativa (`Produto`) para a
+tabela de arquivo (`ProdutoArquivado`), mantendo id e datas. As listagens
+padrão consultam só a tabela ativa; `?incluir_arquivados=true` inclui o
+arquivo. A movimentação é registrada no histórico e não altera o estado do
+produto nas consultas `as_of`. As contagens por combinação (`contagens.py`)
+acompanham só a tabela ativa.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .catalogo import incrementar_versao
+from .contagens import ajustar, combinacao
+from .historico import em_lote, registrar_em_lote, registros_movimentacao_em_lote
+from .models import Produto, ProdutoArquivado, ProdutoBase
+
+# Campos copiados entre a tabela ativa e o arquivo
+CAMPOS_PRODUTO = tuple(
+    campo.name for campo in ProdutoBase._meta.get_fields() if campo.concrete
+) + ('id',)
+
+
+def politica():
+    """
+    Política de arquivamento, com valores padrão para chaves ausentes.
+    """
+    return {
+        'STATUS': ['reprovado'],
+        'IDADE_DIAS': 365,
+        'TAMANHO_LOTE': 500,
+        **getattr(settings, 'ARQUIVAMENTO', {}),
+    }
+
+
+def elegiveis(status=None, idade_dias=None):
+    """
+    Produtos ativos que se enquadram na política de arquivamento.
+    """
+    config = politica()
+    status = config['STATUS'] if status is None else status
+    idade_dias = config['IDADE_DIAS'] if idade_dias is None else idade_dias
+    limite = timezone.now() - timedelta(days=idade_dias)
+    return Produto.objects.filter(status_anvisa__in=status, data_atualizacao__lt=limite)
+
+
+def _copiar(origem, modelo, **extras):
+    return modelo(**{campo: getattr(origem, campo) for campo in CAMPOS_PRODUTO}, **extras)
+
+
+def arquivar(produto_ids):
+    """
+    Move os produtos informados para o arquivo, em uma transação.
+
+    Retorna a quantidade arquivada.
+    """
+    agora = timezone.now()
+    with transaction.atomic(), em_lote():
+        produtos = list(Produto.objects.filter(pk__in=produto_ids).order_by())
+        if not produtos:
+            return 0
+        ProdutoArquivado.objects.bulk_create(
+            [_copiar(produto, ProdutoArquivado, data_arquivamento=agora) for produto in produtos]
+        )
+        ids = [produto.pk for produto in produtos]
+        Produto.objects.filter(pk__in=ids).delete()
+        removidos = Counter(combinacao(produto) for produto in produtos)
+        ajustar({chave: -quantidade for chave, quantidade in removidos.items()})
+        registrar_em_lote(registros_movimentacao_em_lote(ids, 'arquivamento', agora))
+        incrementar_versao()
+    return len(produtos)
+
+
+def restaurar(produto_ids):
+    """
+    Devolve produtos arquivados à tabela ativa, com o id e as datas originais.
+
+    Retorna a quantidade restaurada.
+    """
+    agora = timezone.now()
+    with transaction.atomic(), em_lote():
+        arquivados = list(ProdutoArquivado.objects.filter(pk__in=produto_ids).order_by())
+        if not arquivados:
+            return 0
+        produtos = [_copiar(arquivado, Produto) for arquivado in arquivados]
+        # bulk_create aplica auto_now/auto_now_add; as datas originais voltam com bulk_update
+        datas = [(produto.data_criacao, produto.data_atualizacao) for produto in produtos]
+        Produto.objects.bulk_create(produtos)
+        for produto, (data_criacao, data_atualizacao) in zip(produtos, datas):
+            produto.data_criacao = data_criacao
+            produto.data_atualizacao = data_atualizacao
+        Produto.objects.bulk_update(produtos, ['data_criacao', 'data_atualizacao'])
+
+        ids = [arquivado.pk for arquivado in arquivados]
+        ProdutoArquivado.objects.filter(pk__in=ids).delete()
+        ajustar(Counter(combinacao(produto) for produto in produtos))
+        registrar_em_lote(registros_movimentacao_em_lote(ids, 'restauracao', agora))
+        incrementar_versao()
+    return len(arquivados)
+
+
+def arquivar_elegiveis(status=None, idade_dias=None, tamanho_lote=None, ao_concluir_lote=None):
+    """
+    Arquiva todos os produtos elegíveis, um lote (e uma transação) por vez.
+
+    Lotes curtos mantêm as transações de escrita breves, sem bloquear a API.
+    Retorna o total arquivado.
+    """
+    tamanho_lote = tamanho_lote or politica()['TAMANHO_LOTE']
+    total = 0
+    while True:
+        ids = list(
+            elegiveis(status, idade_dias).order_by('pk').values_list('pk', flat=True)[:tamanho_lote]
+        )
+        if not ids:
+            return total
+        total += arquivar(ids)
+        if ao_concluir_lote:
+            ao_concluir_lote(total)
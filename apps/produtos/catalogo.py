@@ -0,0 +1,46 @@
+"""
+Versão do catálogo de produtos.
+
+Toda escrita em `Produto` incrementa a versão mantida em `VersaoCatalogo`.
+Quem precisa saber se o catálogo mudou (requisições condicionais, caches,
+índices em memória) compara versões em vez de consultar a tabela inteira.
+"""
+from django.db.models import F
+from django.utils import timezone
+
+from .models import VersaoCatalogo
+
+VERSAO_PK = 1
+
+
+def versao_atual():
+    """
+    Retorna o registro de versão do catálogo, criando-o se necessário.
+    """
+    registro = VersaoCatalogo.objects.filter(pk=VERSAO_PK).first()
+    if registro is None:
+        registro, _ = VersaoCatalogo.objects.get_or_create(pk=VERSAO_PK)
+    return registro
+
+
+def versao_da_requisicao(request):
+    """
+    Versão do catálogo memorizada na requisição, para consultá-la uma única vez.
+    """
+    registro = getattr(request, '_versao_catalogo', None)
+    if registro is None:
+        registro = versao_atual()
+        request._versao_catalogo = registro
+    return registro
+
+
+def incrementar_versao():
+    """
+    Incrementa atomicamente a versão do catálogo.
+    """
+    atualizados = VersaoCatalogo.objects.filter(pk=VERSAO_PK).update(
+        versao=F('versao') + 1,
+        atualizado_em=timezone.now(),
+    )
+    if not atualizados:
+        VersaoCatalogo.objects.get_or_create(pk=VERSAO_PK, defaults={'versao': 1})
@@ -0,0 +1,170 @@
+"""
+Coalescência de leituras idênticas e concorrentes ("single-flight").
+
+Quando várias requisições GET iguais (mesmo caminho, parâmetros, formato,
+versão do catálogo e usuário) chegam ao mesmo tempo, apenas a primeira executa a
+consulta e a serialização; as demais aguardam e recebem os mesmos bytes
+já renderizados. Respostas em HTML (BrowsableAPI), que trazem o token CSRF
+e o usuário de cada requisição, nunca são compartilhadas.
+
+As seguidoras não ocupam vaga no controle de admissão: só quem executa a
+view (a líder, uma seguidora que desistiu de esperar ou uma leitura não
+coalescível) ocupa, por
+`admissao.ocupar_vaga`. Se a líder é descartada com 503, as seguidoras
+recebem o mesmo 503.
+"""
+import threading
+from functools import wraps
+
+from django.http import HttpResponse
+
+from . import admissao
+from .catalogo import versao_da_requisicao
+
+# Tempo máximo que uma requisição espera pela líder antes de executar sozinha
+TEMPO_MAXIMO_ESPERA = 30
+
+
+class _Chamada:
+    """
+    Computação em andamento compartilhada por uma líder e suas seguidoras.
+    """
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.falhou = False
+
+
+class GrupoCoalescencia:
+    """
+    Agrupa computações concorrentes pela chave, executando uma por vez por chave.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._em_andamento = {}
+        self.lideres = 0
+        self.coalescidas = 0
+
+    def executar(self, chave, funcao):
+        """
+        Executa `funcao` ou aguarda a execução em andamento para a mesma chave.
+
+        Retorna a tupla (resultado, coalescida). Se a líder falhar ou demorar
+        além do limite, a seguidora executa a função por conta própria.
+        """
+        with self._lock:
+            chamada = self._em_andamento.get(chave)
+            lider = chamada is None
+            if lider:
+                chamada = _Chamada()
+                self._em_andamento[chave] = chamada
+                self.lideres += 1
+
+        if lider:
+            try:
+                chamada.resultado = funcao()
+            except BaseException:
+                chamada.falhou = True
+                raise
+            finally:
+                with self._lock:
+                    del self._em_andamento[chave]
+                chamada.evento.set()
+            return chamada.resultado, False
+
+        if not chamada.evento.wait(TEMPO_MAXIMO_ESPERA) or chamada.falhou:
+            return funcao(), False
+
+        with self._lock:
+            self.coalescidas += 1
+        return chamada.resultado, True
+
+    def estatisticas(self):
+        """
+        Contadores de requisições executadas e coalescidas neste processo.
+        """
+        with self._lock:
+            return {
+                'executadas': self.lideres,
+                'coalescidas': self.coalescidas,
+                'em_andamento': len(self._em_andamento),
+            }
+
+
+grupo_leituras = GrupoCoalescencia()
+
+
+# Formatos (`?format=`) cujo corpo não depende de quem pediu
+FORMATOS_COALESCIVEIS = ('json', 'cbor')
+
+
+def _coalescivel(request):
+    """
+    Só leituras cujo corpo é o mesmo para qualquer cliente são coalescidas.
+
+    A BrowsableAPI (HTML) inclui o token CSRF e o usuário da requisição: ela é
+    escolhida com `?format=api` ou com `text/html` (ou `text/*`) no Accept.
+    """
+    if request.method != 'GET':
+        return False
+    formato = request.GET.get('format')
+    if formato is not None:
+        return formato in FORMATOS_COALESCIVEIS
+    aceito = request.META.get('HTTP_ACCEPT', '')
+    return 'text/html' not in aceito and 'text/*' not in aceito
+
+
+def _chave(request):
+    """
+    Identifica leituras equivalentes: caminho, parâmetros, formato, versão e usuário.
+    """
+    usuario = getattr(request, 'user', None)
+    return (
+        request.path,
+        tuple(sorted((nome, tuple(valores)) for nome, valores in request.GET.lists())),
+        request.META.get('HTTP_ACCEPT', ''),
+        versao_da_requisicao(request).versao,
+        usuario.pk if usuario is not None and usuario.is_authenticated else None,
+    )
+
+
+def coalescer_leituras(view):
+    """
+    Decorator que coalesce requisições GET idênticas e concorrentes
+    (exceto as renderizadas em HTML, veja `_coalescivel`).
+
+    A líder renderiza a resposta e guarda um instantâneo (status, cabeçalhos
+    e corpo); as seguidoras recebem uma nova resposta com os mesmos bytes.
+    """
+
+    @wraps(view)
+    def _view(request, *args, **kwargs):
+        if not _coalescivel(request):
+            return admissao.ocupar_vaga(request) or view(request, *args, **kwargs)
+
+        resposta_lider = []
+
+        def computar():
+            resposta = admissao.ocupar_vaga(request) or view(request, *args, **kwargs)
+            if callable(getattr(resposta, 'render', None)):
+                resposta.render()
+            resposta_lider.append(resposta)
+            return resposta.status_code, list(resposta.items()), resposta.content
+
+        (status_code, cabecalhos, conteudo), coalescida = grupo_leituras.executar(
+            _chave(request), computar
+        )
+        if not coalescida:
+            return resposta_lider[0]
+
+        resposta = HttpResponse(conteudo, status=status_code)
+        for nome, valor in cabecalhos:
+            resposta[nome] = valor
+        resposta['X-Coalescida'] = '1'
+        return resposta
+
+    # Sinaliza ao AdmissaoMiddleware que a vaga de um GET é ocupada só pela líder
+    _view.coalescer_leituras = True
+    return _view
@@ -0,0 +1,303 @@
+"""
+Totais de produtos sem `COUNT(*)` na tabela inteira.
+
+`ContagemProduto` guarda quantos produtos ativos há em cada combinação de
+categoria terapêutica, status ANVISA, tipo de espectro e THC acima de 0.3%
+(no máximo algumas dezenas de linhas). Toda escrita em `Produto` ajusta as
+contagens na mesma transação:
+
+- criação, alteração e exclusão individuais, pelos signals;
+- operações em massa (transição de status, arquivamento, restauração e
+  importação), que chamam `ajustar` com a diferença do lote.
+
+`contar` soma as linhas que atendem aos filtros. Filtros que não se reduzem
+a essas colunas (busca por nome, datas...) recebem uma estimativa: o total
+exato da parte redutível multiplicado pela fração de uma amostra que atende
+ao restante. A amostra são ids sorteados entre o menor e o maior, para
+cerca de `TAMANHO_AMOSTRA` produtos: cada um é buscado pelo índice da chave
+primária (`id IN (...)`), em uma consulta agregada, sem varrer a tabela, e o
+sorteio não se alinha a padrões periódicos de ids ou nomes como uma amostra
+"um a cada N ids". O `PaginadorContagem` usa o serviço no changelist do admin.
+"""
+import json
+from collections import Counter
+from decimal import Decimal
+
+import numpy as np
+from django.core.paginator import Paginator
+from django.db import IntegrityError, connection, transaction
+from django.db.models import BooleanField, Case, Count, F, Q, Sum, Value, When
+from django.db.models.expressions import RawSQL
+from django.utils.functional import cached_property
+
+from .models import ContagemProduto, Produto
+
+LIMITE_THC = Decimal('0.3')
+
+CATEGORIAS_RISCO = ['neurologia', 'pediatria']
+
+# Colunas da combinação, na ordem das chaves usadas em `ajustar`
+CAMPOS_COMBINACAO = ('categoria_terapeutica', 'status_anvisa', 'tipo_espectro', 'acima_limite_thc')
+
+# Linhas examinadas para estimar a fração de filtros arbitrários (abaixo
+# disso, a contagem é exata)
+TAMANHO_AMOSTRA = 2000
+
+# Buscar um id pelo índice custa bem mais que ler uma linha na varredura: se
+# a amostra sortearia mais que esta fração dos ids, contar tudo sai mais barato
+FRACAO_MAXIMA_AMOSTRA = 0.1
+
+# Filtros da listagem de risco (também usados pela página inicial)
+FILTRO_RISCO = {
+    'thc_percentual__gt': LIMITE_THC,
+    'categoria_terapeutica__in': CATEGORIAS_RISCO,
+}
+
+
+def combinacao(produto):
+    """
+    Chave da combinação de um produto (ou dicionário de valores), na ordem de `CAMPOS_COMBINACAO`.
+    """
+    valores = produto if isinstance(produto, dict) else produto.__dict__
+    return (
+        valores['categoria_terapeutica'],
+        valores['status_anvisa'],
+        valores['tipo_espectro'],
+        Decimal(str(valores['thc_percentual'])) > LIMITE_THC,
+    )
+
+
+def combinacao_original(produto):
+    """
+    Combinação do produto como foi lido do banco, ou None se os valores
+    originais não estão disponíveis (instância não lida ou com campos adiados).
+    """
+    field_names, values = getattr(produto, '_valores_originais', ((), ()))
+    originais = dict(zip(field_names, values))
+    try:
+        return combinacao(originais)
+    except KeyError:
+        return None
+
+
+def valores_no_banco(produto_id):
+    """
+    Valores gravados das colunas da combinação de um produto, lidos com
+    bloqueio da linha, ou None se ele não existe. Usados quando a instância
+    não traz os valores originais.
+    """
+    return (
+        Produto.objects.select_for_update().filter(pk=produto_id).order_by()
+        .values('categoria_terapeutica', 'status_anvisa', 'tipo_espectro', 'thc_percentual')
+        .first()
+    )
+
+
+def _anotar_limite(queryset):
+    return queryset.annotate(acima_limite_thc=Case(
+        When(thc_percentual__gt=LIMITE_THC, then=Value(True)),
+        default=Value(False),
+        output_field=BooleanField(),
+    ))
+
+
+def contagens_por_combinacao(queryset):
+    """
+    Quantidade de produtos do queryset por combinação, em uma consulta agrupada.
+    """
+    return Counter({
+        tuple(linha[campo] for campo in CAMPOS_COMBINACAO): linha['quantidade']
+        for linha in _anotar_limite(queryset.order_by())
+        .values(*CAMPOS_COMBINACAO)
+        .annotate(quantidade=Count('pk'))
+    })
+
+
+def ajustar(diferencas):
+    """
+    Soma as diferenças {combinação: quantidade} às contagens.
+
+    Um UPDATE para todas as combinações que já têm linha; só combinações
+    novas custam um INSERT cada. Deve ser chamada na mesma transação da
+    escrita que as causou.
+    """
+    diferencas = {chave: diferenca for chave, diferenca in diferencas.items() if diferenca}
+    if not diferencas:
+        return
+    filtros = {chave: Q(**dict(zip(CAMPOS_COMBINACAO, chave))) for chave in diferencas}
+    combinacoes = ContagemProduto.objects.filter(Q(*filtros.values(), _connector=Q.OR))
+    atualizadas = combinacoes.update(quantidade=F('quantidade') + Case(
+        *[When(filtros[chave], then=Value(diferenca)) for chave, diferenca in diferencas.items()],
+        default=Value(0),
+    ))
+    if atualizadas == len(diferencas):
+        return
+
+    existentes = set(combinacoes.values_list(*CAMPOS_COMBINACAO))
+    for chave, diferenca in diferencas.items():
+        if chave in existentes:
+            continue
+        filtro = dict(zip(CAMPOS_COMBINACAO, chave))
+        try:
+            with transaction.atomic():
+                ContagemProduto.objects.create(quantidade=diferenca, **filtro)
+        except IntegrityError:
+            # Criada por outra transação depois do UPDATE
+            ContagemProduto.objects.filter(**filtro).update(quantidade=F('quantidade') + diferenca)
+
+
+def diferenca_status(queryset, status_alvo):
+    """
+    Diferenças de uma mudança de status de todos os produtos do queryset,
+    calculadas antes do UPDATE.
+    """
+    diferencas = Counter()
+    for (categoria, status, espectro, acima), quantidade in contagens_por_combinacao(queryset).items():
+        diferencas[(categoria, status, espectro, acima)] -= quantidade
+        diferencas[(categoria, status_alvo, espectro, acima)] += quantidade
+    return diferencas
+
+
+def recalcular():
+    """
+    Refaz todas as contagens a partir da tabela de produtos (uma varredura).
+
+    Retorna as diferenças encontradas em relação às contagens anteriores.
+    """
+    with transaction.atomic():
+        anteriores = Counter({
+            tuple(linha[:-1]): linha[-1]
+            for linha in ContagemProduto.objects.values_list(*CAMPOS_COMBINACAO, 'quantidade')
+        })
+        atuais = contagens_por_combinacao(Produto.objects.all())
+        ContagemProduto.objects.all().delete()
+        ContagemProduto.objects.bulk_create([
+            ContagemProduto(quantidade=quantidade, **dict(zip(CAMPOS_COMBINACAO, chave)))
+            for chave, quantidade in atuais.items()
+        ])
+    diferencas = Counter(atuais)
+    diferencas.subtract(anteriores)
+    return {chave: diferenca for chave, diferenca in diferencas.items() if diferenca}
+
+
+def _limite_thc(valor):
+    try:
+        return Decimal(str(valor)) == LIMITE_THC
+    except ArithmeticError:
+        return False
+
+
+def _filtro_combinacao(filtros):
+    """
+    Separa os filtros que se reduzem às colunas de `ContagemProduto`.
+
+    Retorna (filtro sobre ContagemProduto, filtros restantes sobre Produto).
+    Aceita também os valores em texto da query string do admin.
+    """
+    redutivel, restante = {}, {}
+    for lookup, valor in filtros.items():
+        campo, _, operador = lookup.partition('__')
+        if campo in ('categoria_terapeutica', 'status_anvisa', 'tipo_espectro') and operador in ('', 'exact'):
+            redutivel[campo] = valor
+        elif campo in ('categoria_terapeutica', 'status_anvisa', 'tipo_espectro') and operador == 'in':
+            redutivel[f'{campo}__in'] = valor.split(',') if isinstance(valor, str) else valor
+        elif campo == 'thc_percentual' and operador in ('gt', 'lte') and _limite_thc(valor):
+            redutivel['acima_limite_thc'] = operador == 'gt'
+        else:
+            restante[lookup] = valor
+    return redutivel, restante
+
+
+def contar(filtros=None, queryset=None):
+    """
+    Total de produtos ativos que atendem a `filtros` (lookups sobre `Produto`).
+
+    Retorna a tupla (total, exato). Se os filtros se reduzem às colunas da
+    combinação e nenhum `queryset` é informado, o total é exato e custa uma
+    consulta na tabela de contagens. Senão, é estimado pela amostra descrita
+    no módulo, ou contado quando a parte redutível tem até `TAMANHO_AMOSTRA`
+    produtos ou a amostra não sairia mais barata que a contagem. `queryset`,
+    se informado, é o conjunto de fato listado (ex.: com busca por nome) e
+    substitui os filtros restantes.
+    """
+    filtros = filtros or {}
+    redutivel, restante = _filtro_combinacao(filtros)
+    base = ContagemProduto.objects.filter(**redutivel).aggregate(total=Sum('quantidade'))['total'] or 0
+    if not restante and queryset is None:
+        return base, True
+
+    parte_exata = _anotar_limite(Produto.objects).filter(**redutivel)
+    listados = parte_exata.filter(**restante) if queryset is None else _anotar_limite(queryset).filter(**redutivel)
+    if base <= TAMANHO_AMOSTRA:
+        return listados.count(), True
+
+    sorteados = _ids_amostra(base)
+    if sorteados is None:
+        return listados.count(), True
+    sorteados = lista_ids(sorteados)
+    if queryset is None:
+        amostra = parte_exata.filter(pk__in=sorteados).order_by().aggregate(
+            tamanho=Count('pk'), encontrados=Count('pk', filter=Q(**restante)),
+        )
+        tamanho, encontrados = amostra['tamanho'], amostra['encontrados']
+    else:
+        tamanho = parte_exata.filter(pk__in=sorteados).order_by().count()
+        encontrados = listados.filter(pk__in=sorteados).order_by().count() if tamanho else 0
+    return round(base * encontrados / tamanho) if tamanho else 0, False
+
+
+def lista_ids(ids):
+    """
+    Valor para um lookup `pk__in` com muitos ids.
+
+    No SQLite, os ids vão em um único parâmetro JSON (`json_each`): como
+    lista, o ORM prepara cada id separadamente, o que custa mais que a consulta.
+    """
+    if connection.vendor == 'sqlite':
+        return RawSQL('SELECT value FROM json_each(%s)', (json.dumps(ids),))
+    return ids
+
+
+def _ids_amostra(base):
+    """
+    Ids sorteados para a amostra de uma parte redutível com `base` produtos.
+
+    Divide os ids entre o menor e o maior em estratos e sorteia um id em cada
+    um, com estratos suficientes para acertar cerca de `TAMANHO_AMOSTRA`
+    produtos da parte redutível; ids excluídos ou fora da parte simplesmente
+    não entram na amostra. A semente é a própria base, para que o total não
+    mude entre requisições enquanto o catálogo não muda. Retorna None se a
+    amostra sortearia mais que `FRACAO_MAXIMA_AMOSTRA` dos ids.
+    """
+    ids = Produto.objects.order_by('pk').values_list('pk', flat=True)
+    minimo, maximo = ids.first(), ids.last()
+    if minimo is None:
+        return []
+    extensao = maximo - minimo + 1
+    quantidade = -(-TAMANHO_AMOSTRA * extensao // base)
+    if quantidade > FRACAO_MAXIMA_AMOSTRA * extensao:
+        return None
+    estrato = extensao / quantidade
+    deslocamentos = np.random.default_rng(base).random(quantidade)
+    return (minimo + ((np.arange(quantidade) + deslocamentos) * estrato).astype(np.int64)).tolist()
+
+
+class PaginadorContagem(Paginator):
+    """
+    Paginador cujo total vem do serviço de contagens, e não de `COUNT(*)`.
+
+    `filtros` são os parâmetros da listagem (lookups sobre `Produto`, ou
+    qualquer outra chave, como a busca, que torna o total estimado). Com um
+    total estimado, a última página pode vir incompleta.
+    """
+
+    def __init__(self, object_list, per_page, filtros=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.filtros = filtros or {}
+
+    @cached_property
+    def count(self):
+        _, restante = _filtro_combinacao(self.filtros)
+        exatos = {lookup: valor for lookup, valor in self.filtros.items() if lookup not in restante}
+        total, self.total_exato = contar(exatos, self.object_list if restante else None)
+        return total
@@ -0,0 +1,272 @@
+"""
+Detecção de nomes de produtos possivelmente duplicados.
+
+Os nomes são normalizados (sem acentos, minúsculos, só letras e dígitos) e
+decompostos em trigramas; a semelhança entre dois nomes é o índice de
+Jaccard dos seus conjuntos de trigramas. Assim, "Óleo CBD Premium" e
+"Oleo CBD  premium" são idênticos e "Óleo CBD Premiun" fica acima do limiar.
+
+- `IndiceNomes` é um índice invertido trigrama -> produtos, em memória e
+  sincronizado com o catálogo, usado na criação e na importação. É carregado
+  no aquecimento do worker; na criação, só é sincronizado incrementalmente.
+- `agrupar_duplicados` agrupa os duplicados de uma lista de nomes inteira
+  sem comparar todos os pares (MinHash com LSH + union-find).
+"""
+import math
+import re
+import unicodedata
+import zlib
+from collections import Counter, defaultdict
+
+from .catalogo import versao_atual
+from .indices import IndiceIncremental
+
+# Semelhança (Jaccard de trigramas) a partir da qual dois nomes são considerados duplicados
+LIMIAR_SIMILARIDADE = 0.6
+
+# Máximo de possíveis duplicados informados por produto
+MAXIMO_DUPLICADOS = 10
+
+PADRAO_NAO_ALFANUMERICO = re.compile(r'[^a-z0-9]+')
+
+# MinHash/LSH do agrupamento: 30 bandas de 4 funções de hash
+BANDAS_MINHASH = 30
+LINHAS_POR_BANDA = 4
+PRIMO_MINHASH = (1 << 31) - 1
+MULTIPLICADOR_CHAVE = 1000003
+SEMENTE_MINHASH = 20240601
+
+# Trigramas presentes em mais desta fração dos nomes (e em mais de
+# MINIMO_TRIGRAMAS_COMUNS nomes) ficam fora das assinaturas
+FRACAO_TRIGRAMAS_COMUNS = 0.01
+MINIMO_TRIGRAMAS_COMUNS = 100
+
+
+def normalizar(nome):
+    """
+    Remove acentos, pontuação e diferenças de caixa e espaçamento.
+    """
+    sem_acentos = unicodedata.normalize('NFKD', nome).encode('ascii', 'ignore').decode('ascii')
+    return PADRAO_NAO_ALFANUMERICO.sub(' ', sem_acentos.lower()).strip()
+
+
+def trigramas(nome):
+    """
+    Conjunto de trigramas do nome normalizado, com cada palavra delimitada
+    por espaços (como no pg_trgm), para que palavras curtas também contem.
+    """
+    conjunto = set()
+    for palavra in normalizar(nome).split():
+        delimitada = f'  {palavra} '
+        conjunto.update(delimitada[i:i + 3] for i in range(len(delimitada) - 2))
+    return frozenset(conjunto)
+
+
+def similaridade(a, b):
+    """
+    Índice de Jaccard entre dois conjuntos de trigramas.
+    """
+    if not a or not b:
+        return 0.0
+    comuns = len(a & b)
+    return comuns / (len(a) + len(b) - comuns)
+
+
+def _tamanho_prefixo(tamanho, limiar):
+    """
+    Quantos dos trigramas mais raros de um nome bastam para encontrar
+    qualquer outro nome com semelhança >= limiar (filtragem por prefixo).
+    """
+    return tamanho - math.ceil(limiar * tamanho) + 1
+
+
+class IndiceNomes(IndiceIncremental):
+    """
+    Índice invertido de trigramas dos nomes do catálogo.
+    """
+    campos = ('nome',)
+
+    def __len__(self):
+        return len(self.nomes)
+
+    def limpar(self):
+        self.nomes = {}
+        self.postagens = defaultdict(set)
+
+    def inserir(self, produto_id, nome):
+        """
+        Insere ou atualiza o nome de um produto.
+        """
+        if produto_id in self.nomes:
+            self.remover(produto_id)
+        conjunto = trigramas(nome)
+        self.nomes[produto_id] = (nome, conjunto)
+        for trigrama in conjunto:
+            self.postagens[trigrama].add(produto_id)
+
+    def remover(self, produto_id):
+        """
+        Remove um produto, se estiver no índice.
+        """
+        registro = self.nomes.pop(produto_id, None)
+        if registro is None:
+            return
+        for trigrama in registro[1]:
+            produtos = self.postagens[trigrama]
+            produtos.discard(produto_id)
+            if not produtos:
+                del self.postagens[trigrama]
+
+    def buscar(self, nome, excluir=None, limiar=LIMIAR_SIMILARIDADE, limite=MAXIMO_DUPLICADOS):
+        """
+        Produtos com nome semelhante, como dicionários {id, nome, similaridade},
+        do mais para o menos semelhante.
+
+        Só as listas dos trigramas mais raros do nome são percorridas: um nome
+        com semelhança >= limiar tem de compartilhar ao menos um deles.
+        """
+        conjunto = trigramas(nome)
+        if not conjunto:
+            return []
+        with self.trava:
+            raros = sorted(conjunto, key=lambda trigrama: len(self.postagens.get(trigrama, ())))
+            candidatos = set()
+            for trigrama in raros[:_tamanho_prefixo(len(conjunto), limiar)]:
+                candidatos.update(self.postagens.get(trigrama, ()))
+            candidatos.discard(excluir)
+
+            encontrados = []
+            for produto_id in candidatos:
+                outro_nome, outro_conjunto = self.nomes[produto_id]
+                valor = similaridade(conjunto, outro_conjunto)
+                if valor >= limiar:
+                    encontrados.append((valor, produto_id, outro_nome))
+
+        encontrados.sort(key=lambda item: (-item[0], item[1]))
+        return [
+            {'id': produto_id, 'nome': outro_nome, 'similaridade': round(valor, 3)}
+            for valor, produto_id, outro_nome in encontrados[:limite]
+        ]
+
+
+def _assinaturas_minhash(conjuntos):
+    """
+    Assinaturas MinHash (uma linha por conjunto) calculadas de forma vetorizada.
+
+    Cada trigrama vira um inteiro (crc32) e cada função de hash é uma
+    permutação (a * x + b) mod p; o mínimo por conjunto sai de um `reduceat`
+    sobre todos os trigramas concatenados.
+    """
+    # NumPy só é importado aqui, para não pesar na inicialização dos workers
+    import numpy as np
+
+    tamanhos = np.fromiter((len(conjunto) for conjunto in conjuntos), dtype=np.int64, count=len(conjuntos))
+    valores = np.fromiter(
+        (zlib.crc32(trigrama.encode()) for conjunto in conjuntos for trigrama in conjunto),
+        dtype=np.uint64,
+        count=int(tamanhos.sum()),
+    ) % PRIMO_MINHASH
+    inicios = np.concatenate(([0], np.cumsum(tamanhos)[:-1]))
+
+    funcoes = BANDAS_MINHASH * LINHAS_POR_BANDA
+    gerador = np.random.default_rng(SEMENTE_MINHASH)
+    coeficientes_a = gerador.integers(1, PRIMO_MINHASH, size=funcoes, dtype=np.uint64)
+    coeficientes_b = gerador.integers(0, PRIMO_MINHASH, size=funcoes, dtype=np.uint64)
+
+    assinaturas = np.empty((len(conjuntos), funcoes), dtype=np.uint64)
+    for funcao in range(funcoes):
+        permutados = (coeficientes_a[funcao] * valores + coeficientes_b[funcao]) % PRIMO_MINHASH
+        assinaturas[:, funcao] = np.minimum.reduceat(permutados, inicios)
+    return assinaturas
+
+
+def _baldes(assinaturas):
+    """
+    Grupos de posições com a mesma faixa de assinatura, banda por banda.
+    """
+    import numpy as np
+
+    for banda in range(BANDAS_MINHASH):
+        colunas = assinaturas[:, banda * LINHAS_POR_BANDA:(banda + 1) * LINHAS_POR_BANDA]
+        chaves = np.zeros(len(assinaturas), dtype=np.uint64)
+        for coluna in colunas.T:
+            chaves = chaves * np.uint64(MULTIPLICADOR_CHAVE) + coluna
+        ordem = np.argsort(chaves, kind='stable')
+        ordenadas = chaves[ordem]
+
+        # Só os baldes com mais de um nome interessam: descarta os unitários antes de dividir
+        novo_balde = np.concatenate(([True], ordenadas[1:] != ordenadas[:-1]))
+        baldes = np.cumsum(novo_balde) - 1
+        compartilhados = np.bincount(baldes)[baldes] > 1
+        ordem, novo_balde = ordem[compartilhados], novo_balde[compartilhados]
+        for balde in np.split(ordem, np.flatnonzero(novo_balde)[1:]):
+            yield balde.tolist()
+
+
+def agrupar_duplicados(nomes, limiar=LIMIAR_SIMILARIDADE):
+    """
+    Agrupa os ids cujos nomes são semelhantes (direta ou transitivamente).
+
+    `nomes` é um iterável de (id, nome). Comparar todos os pares é
+    quadrático; aqui os candidatos saem de MinHash com LSH (bandas) sobre os
+    trigramas que distinguem os nomes: só nomes que coincidem em alguma banda
+    da assinatura são comparados, e a semelhança de cada candidato é
+    conferida exatamente. O agrupamento é aproximado: a chance de um par
+    acima do limiar escapar cai rapidamente conforme os nomes são mais
+    parecidos. Retorna a lista de grupos (listas de ids) com mais de um produto.
+    """
+    registros = [(produto_id, trigramas(nome)) for produto_id, nome in nomes]
+    registros = [(produto_id, conjunto) for produto_id, conjunto in registros if conjunto]
+    if not registros:
+        return []
+    conjuntos = [conjunto for _, conjunto in registros]
+
+    # Trigramas muito comuns ("oleo", "cbd", "mg") juntariam nomes sem relação
+    # nos mesmos baldes; as assinaturas usam só os demais (a conferência, todos)
+    frequencia = Counter(trigrama for conjunto in conjuntos for trigrama in conjunto)
+    maximo = max(MINIMO_TRIGRAMAS_COMUNS, int(FRACAO_TRIGRAMAS_COMUNS * len(conjuntos)))
+    distintivos = [
+        frozenset(trigrama for trigrama in conjunto if frequencia[trigrama] <= maximo) or conjunto
+        for conjunto in conjuntos
+    ]
+
+    pais = list(range(len(registros)))
+
+    def raiz(posicao):
+        while pais[posicao] != posicao:
+            pais[posicao] = pais[pais[posicao]]
+            posicao = pais[posicao]
+        return posicao
+
+    for balde in _baldes(_assinaturas_minhash(distintivos)):
+        for indice, posicao in enumerate(balde):
+            for outra in balde[:indice]:
+                raiz_posicao, raiz_outra = raiz(posicao), raiz(outra)
+                if raiz_posicao == raiz_outra:
+                    continue
+                if similaridade(conjuntos[posicao], conjuntos[outra]) >= limiar:
+                    pais[raiz_outra] = raiz_posicao
+
+    grupos = defaultdict(list)
+    for posicao, (produto_id, _) in enumerate(registros):
+        grupos[raiz(posicao)].append(produto_id)
+    return sorted(
+        (sorted(grupo) for grupo in grupos.values() if len(grupo) > 1),
+        key=lambda grupo: (-len(grupo), grupo[0]),
+    )
+
+
+# Índice compartilhado pelas requisições deste processo
+indice_nomes = IndiceNomes()
+
+
+def possiveis_duplicados(produto):
+    """
+    Produtos do catálogo com nome semelhante ao de um produto recém-criado.
+
+    Chamada nas requisições: só sincroniza o índice de forma incremental.
+    Retorna None se o índice não foi carregado no aquecimento do worker.
+    """
+    if not indice_nomes.sincronizar(versao_atual().versao, reconstruir=False):
+        return None
+    return indice_nomes.buscar(produto.nome, excluir=produto.pk)
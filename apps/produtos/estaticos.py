@@ -0,0 +1,178 @@
+"""
+Arquivos estáticos com impressão digital (hash no nome) e pré-comprimidos.
+
+- `ManifestGzipStaticFilesStorage` gera nomes com hash e variantes `.gz`
+  durante o `collectstatic`.
+- `servir_estatico` serve o `STATIC_ROOT` sem depender de um servidor web
+  externo, com cache imutável para nomes com hash e negociação de gzip.
+
+Com `DEBUG` ligado, o `runserver` do `django.contrib.staticfiles` atende
+`STATIC_URL` antes do URLconf, direto das pastas de origem: a view só é
+usada em produção (ou com `runserver --nostatic`).
+"""
+import gzip
+import mimetypes
+import os
+import re
+from urllib.parse import unquote, urlsplit
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+# Extensões que compensam comprimir
+EXTENSOES_COMPRIMIVEIS = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.map', '.xml')
+
+# Arquivos menores que isso não ganham com a compressão
+TAMANHO_MINIMO_GZIP = 256
+
+# Nomes gerados pelo ManifestStaticFilesStorage: nome.<12 hex>.ext
+PADRAO_NOME_COM_HASH = re.compile(r'\.[0-9a-f]{12}\.[^/]+$')
+
+CACHE_IMUTAVEL = 'public, max-age=31536000, immutable'
+CACHE_REVALIDAR = 'public, max-age=0, must-revalidate'
+
+
+class ManifestGzipStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Storage de estáticos com hash no nome e variantes `.gz` pré-comprimidas.
+
+    Arquivos sem entrada no manifesto (ex.: antes do primeiro `collectstatic`)
+    usam o nome original, sem hash: o `{% static %}` não gera erro nem aponta
+    para um nome com hash que não existe. Em produção, o `collectstatic` é
+    obrigatório para os estáticos existirem no `STATIC_ROOT`.
+    """
+    manifest_strict = False
+
+    def stored_name(self, name):
+        nome_limpo = urlsplit(unquote(name)).path.strip()
+        if self.hash_key(nome_limpo) not in self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        processados = set()
+        for nome, nome_com_hash, processado in super().post_process(paths, dry_run, **options):
+            if nome_com_hash and not isinstance(processado, Exception):
+                processados.add(nome)
+            yield nome, nome_com_hash, processado
+
+        if dry_run:
+            return
+
+        for nome in sorted(processados):
+            self._comprimir(nome)
+            self._comprimir(self.stored_name(nome))
+
+    def _comprimir(self, nome):
+        """
+        Grava `nome.gz` quando o arquivo é comprimível e a compressão compensa.
+        """
+        if not nome.endswith(EXTENSOES_COMPRIMIVEIS) or not self.exists(nome):
+            return
+
+        with self.open(nome) as arquivo:
+            conteudo = arquivo.read()
+        if len(conteudo) < TAMANHO_MINIMO_GZIP:
+            return
+
+        comprimido = gzip.compress(conteudo, compresslevel=9, mtime=0)
+        if len(comprimido) >= len(conteudo):
+            return
+
+        nome_gz = f'{nome}.gz'
+        if self.exists(nome_gz):
+            self.delete(nome_gz)
+        self._save(nome_gz, ContentFile(comprimido))
+
+
+def _qualidade(parametros):
+    """
+    Valor de `q` dos parâmetros de um item do Accept-Encoding (1 se ausente).
+    """
+    for parametro in parametros.split(';'):
+        nome, _, valor = parametro.partition('=')
+        if nome.strip().lower() == 'q':
+            try:
+                return float(valor)
+            except ValueError:
+                return 0.0
+    return 1.0
+
+
+def _aceita_gzip(request):
+    """
+    Verifica se o cliente aceita gzip, pelos valores `q` do Accept-Encoding.
+
+    Uma menção explícita a gzip prevalece sobre `*`; `q=0` recusa.
+    """
+    qualidades = {}
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        codificacao, _, parametros = item.partition(';')
+        codificacao = codificacao.strip().lower()
+        if codificacao:
+            qualidades[codificacao] = _qualidade(parametros)
+    for codificacao in ('gzip', 'x-gzip', '*'):
+        if codificacao in qualidades:
+            return qualidades[codificacao] > 0
+    return False
+
+
+def _resposta_arquivo(caminho, content_type):
+    """
+    FileResponse sem Content-Disposition (que o Django inclui a partir do
+    nome do arquivo aberto): estáticos são exibidos, não baixados.
+    """
+    resposta = FileResponse(open(caminho, 'rb'), content_type=content_type)
+    if 'Content-Disposition' in resposta:
+        del resposta['Content-Disposition']
+    return resposta
+
+
+def servir_estatico(request, caminho):
+    """
+    Serve um arquivo do STATIC_ROOT.
+
+    Nomes com hash recebem cache imutável de um ano; os demais são
+    revalidados via Last-Modified. Se existir a variante `.gz` e o cliente
+    aceitar gzip, ela é servida com `Content-Encoding: gzip`.
+    """
+    if not settings.STATIC_ROOT:
+        raise Http404("STATIC_ROOT não configurado")
+    try:
+        arquivo = safe_join(settings.STATIC_ROOT, caminho)
+    except SuspiciousFileOperation:
+        raise Http404("Caminho inválido")
+    if caminho.endswith('.gz') or not os.path.isfile(arquivo):
+        raise Http404("Arquivo estático não encontrado")
+
+    stat = os.stat(arquivo)
+    imutavel = bool(PADRAO_NOME_COM_HASH.search(caminho))
+
+    if not imutavel and not was_modified_since(
+        request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime
+    ):
+        resposta = HttpResponseNotModified()
+    else:
+        content_type, encoding = mimetypes.guess_type(arquivo)
+        content_type = content_type or 'application/octet-stream'
+
+        comprimido = f'{arquivo}.gz'
+        if encoding is None and _aceita_gzip(request) and os.path.isfile(comprimido):
+            resposta = _resposta_arquivo(comprimido, content_type)
+            resposta['Content-Encoding'] = 'gzip'
+        else:
+            resposta = _resposta_arquivo(arquivo, content_type)
+            if encoding:
+                resposta['Content-Encoding'] = encoding
+
+    resposta['Last-Modified'] = http_date(stat.st_mtime)
+    resposta['Cache-Control'] = CACHE_IMUTAVEL if imutavel else CACHE_REVALIDAR
+    patch_vary_headers(resposta, ('Accept-Encoding',))
+    return resposta
@@ -0,0 +1,290 @@
+"""
+Histórico de alterações de produtos e consultas no tempo (`as_of`).
+
+O histórico é append-only: a criação registra todos os campos, cada
+alteração registra só os campos que mudaram e a exclusão registra apenas
+o evento. O estado de um produto em um momento é reconstruído aplicando,
+em ordem, os registros até aquele momento. Arquivamento e restauração só
+movem o produto entre tabelas e não alteram o seu estado.
+
+Custo das consultas no tempo: um produto lê só o próprio histórico, pelo
+índice (produto_id, momento). A listagem lê todo o histórico anterior ao
+momento (todos os produtos, todas as alterações): cresce com o número de
+alterações, não de produtos. Por isso ela para, com `HistoricoExtenso`,
+depois de `HISTORICO['LIMITE_REGISTROS_LISTAGEM']` registros.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import HistoricoProduto, Produto
+
+# Campos cujo valor é registrado no histórico
+CAMPOS_RASTREADOS = (
+    'nome', 'tipo_espectro', 'thc_percentual', 'cbd_percentual',
+    'categoria_terapeutica', 'status_anvisa', 'data_criacao',
+)
+
+# Tamanho dos lotes de inserção nas operações em massa
+TAMANHO_LOTE = 500
+
+# Operações que não mudam o estado do produto (movimentação entre tabelas)
+OPERACOES_MOVIMENTACAO = ('arquivamento', 'restauracao')
+
+_local = threading.local()
+
+
+class HistoricoExtenso(Exception):
+    """
+    A reconstrução da listagem passaria do limite de registros lidos.
+    """
+
+    def __init__(self, limite):
+        super().__init__(f"A reconstrução passaria de {limite} registros de histórico.")
+        self.limite = limite
+
+
+def configuracao():
+    """
+    Configuração das consultas no tempo, com valores padrão para chaves ausentes.
+    """
+    return {
+        'LIMITE_REGISTROS_LISTAGEM': 200000,
+        **getattr(settings, 'HISTORICO', {}),
+    }
+
+
+@contextmanager
+def em_lote():
+    """
+    Suspende o registro automático (signals) de histórico e versão do catálogo.
+
+    Para operações em massa que gravam o histórico com `registrar_em_lote`
+    e incrementam a versão uma única vez.
+    """
+    anterior = getattr(_local, 'em_lote', False)
+    _local.em_lote = True
+    try:
+        yield
+    finally:
+        _local.em_lote = anterior
+
+
+def registro_automatico_suspenso():
+    """
+    Indica se o código atual está dentro de `em_lote()`.
+    """
+    return getattr(_local, 'em_lote', False)
+
+
+def _texto(campo, valor):
+    """
+    Converte o valor de um campo para o formato texto guardado no histórico.
+    """
+    if valor is None:
+        return None
+    if campo == 'data_criacao':
+        return valor.isoformat()
+    return str(valor)
+
+
+def valores_rastreados(produto):
+    """
+    Valores atuais dos campos rastreados, em formato texto.
+
+    Campos não carregados (ex.: via `.only()`) ficam de fora.
+    """
+    carregados = produto.__dict__
+    return {
+        campo: _texto(campo, carregados[campo])
+        for campo in CAMPOS_RASTREADOS
+        if campo in carregados
+    }
+
+
+def registro_criacao(produto, momento=None):
+    """
+    Monta (sem salvar) o registro de criação de um produto.
+    """
+    return HistoricoProduto(
+        produto_id=produto.pk,
+        momento=momento or produto.data_atualizacao or timezone.now(),
+        operacao='criacao',
+        alteracoes=valores_rastreados(produto),
+    )
+
+
+def registro_alteracao(produto, alteracoes, momento=None):
+    """
+    Monta (sem salvar) o registro de alteração de um produto.
+    """
+    return HistoricoProduto(
+        produto_id=produto.pk,
+        momento=momento or produto.data_atualizacao or timezone.now(),
+        operacao='alteracao',
+        alteracoes=alteracoes,
+    )
+
+
+def _alteracoes(produto):
+    """
+    Campos rastreados que mudaram desde a leitura do produto no banco.
+
+    Sem os valores originais (instância não lida do banco), todos os campos
+    são considerados alterados.
+    """
+    field_names, values = getattr(produto, '_valores_originais', ((), ()))
+    originais = dict(zip(field_names, values))
+    carregados = produto.__dict__
+    return {
+        campo: _texto(campo, carregados[campo])
+        for campo in CAMPOS_RASTREADOS
+        if campo in carregados
+        and (campo not in originais or originais[campo] != carregados[campo])
+    }
+
+
+def registrar_salvamento(produto, criado):
+    """
+    Registra a criação ou alteração de um produto recém-salvo.
+    """
+    if criado:
+        registro = registro_criacao(produto)
+    else:
+        alteracoes = _alteracoes(produto)
+        registro = registro_alteracao(produto, alteracoes) if alteracoes else None
+
+    if registro is not None:
+        registro.save()
+
+    campos = tuple(campo for campo in CAMPOS_RASTREADOS if campo in produto.__dict__)
+    produto._valores_originais = (campos, tuple(produto.__dict__[campo] for campo in campos))
+    return registro
+
+
+def registrar_exclusao(produto):
+    """
+    Registra a exclusão de um produto.
+    """
+    return HistoricoProduto.objects.create(produto_id=produto.pk, operacao='exclusao')
+
+
+def registros_movimentacao_em_lote(produto_ids, operacao, momento):
+    """
+    Monta (sem salvar) registros de arquivamento ou restauração.
+    """
+    return [
+        HistoricoProduto(produto_id=produto_id, momento=momento, operacao=operacao)
+        for produto_id in produto_ids
+    ]
+
+
+def registrar_em_lote(registros):
+    """
+    Grava registros de histórico montados previamente, em lotes.
+    """
+    return HistoricoProduto.objects.bulk_create(registros, batch_size=TAMANHO_LOTE)
+
+
+def registrar_alteracao_em_conjunto(produtos, alteracoes, momento):
+    """
+    Registra a mesma alteração para todos os produtos de um queryset.
+
+    Um único INSERT ... SELECT: os ids não passam pelo Python, e o custo não
+    depende do tamanho da seleção. Retorna a quantidade de registros gravados.
+    """
+    selecao, parametros = produtos.order_by().values('pk').query.sql_with_params()
+    opcoes = HistoricoProduto._meta
+    colunas = ', '.join(
+        connection.ops.quote_name(opcoes.get_field(campo).column)
+        for campo in ('produto_id', 'momento', 'operacao', 'alteracoes')
+    )
+    valores = [
+        opcoes.get_field('momento').get_db_prep_value(momento, connection),
+        'alteracao',
+        opcoes.get_field('alteracoes').get_db_prep_value(alteracoes, connection),
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {connection.ops.quote_name(opcoes.db_table)} ({colunas}) '
+            f'SELECT selecao.{connection.ops.quote_name(Produto._meta.pk.column)}, %s, %s, %s '
+            f'FROM ({selecao}) selecao',
+            [*valores, *parametros],
+        )
+        return cursor.rowcount
+
+
+def estados_em(momento, produto_ids=None):
+    """
+    Reconstrói os campos dos produtos existentes em `momento`.
+
+    Retorna um dicionário {produto_id: {campo: valor em texto}}. Com
+    `produto_ids`, lê só o histórico desses produtos, pelo índice
+    (produto_id, momento). Sem eles, percorre uma vez todo o histórico até
+    `momento` e levanta `HistoricoExtenso` se ele tem mais registros que
+    `LIMITE_REGISTROS_LISTAGEM`.
+    """
+    registros = HistoricoProduto.objects.filter(momento__lte=momento)
+    limite = None
+    if produto_ids is not None:
+        registros = registros.filter(produto_id__in=produto_ids)
+    else:
+        limite = configuracao()['LIMITE_REGISTROS_LISTAGEM']
+
+    estados = {}
+    for lidos, (produto_id, operacao, alteracoes, momento_registro) in enumerate(
+        registros.order_by('produto_id', 'momento', 'id')
+        .values_list('produto_id', 'operacao', 'alteracoes', 'momento')
+        .iterator(chunk_size=2000),
+        start=1,
+    ):
+        if limite is not None and lidos > limite:
+            raise HistoricoExtenso(limite)
+        if operacao in OPERACOES_MOVIMENTACAO:
+            continue
+        if operacao == 'exclusao':
+            estados.pop(produto_id, None)
+            continue
+        if operacao == 'criacao':
+            estados[produto_id] = {}
+        estado = estados.setdefault(produto_id, {})
+        estado.update(alteracoes)
+        estado['data_atualizacao'] = momento_registro
+
+    return estados
+
+
+def _produto_de_estado(produto_id, estado):
+    """
+    Instancia (sem salvar) um produto a partir do estado reconstruído.
+    """
+    campos = {}
+    for campo, valor in estado.items():
+        if campo == 'data_atualizacao':
+            campos[campo] = valor
+        else:
+            campos[campo] = Produto._meta.get_field(campo).to_python(valor)
+    return Produto(id=produto_id, **campos)
+
+
+def produtos_em(momento, produto_ids=None):
+    """
+    Produtos como estavam em `momento`, na ordenação padrão da listagem.
+    """
+    produtos = [
+        _produto_de_estado(produto_id, estado)
+        for produto_id, estado in estados_em(momento, produto_ids).items()
+    ]
+    produtos.sort(key=lambda produto: (produto.data_criacao, produto.pk), reverse=True)
+    return produtos
+
+
+def produto_em(produto_id, momento):
+    """
+    Um produto como estava em `momento`, ou None se não existia.
+    """
+    produtos = produtos_em(momento, [produto_id])
+    return produtos[0] if produtos else None
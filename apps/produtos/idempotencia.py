@@ -0,0 +1,243 @@
+"""
+Chaves de idempotência (`Idempotency-Key`) para requisições de escrita.
+
+Integrações repetem POSTs quando a resposta demora; sem chave, cada
+repetição cria outro produto. Com o decorator `idempotente`, a primeira
+requisição com uma chave registra a chave (`ChaveIdempotencia`), executa a
+view e guarda a resposta. A chave vale por view e por cliente (veja
+`escopo`): clientes diferentes podem usar a mesma chave. Repetições com a
+mesma chave:
+
+- recebem a resposta guardada (com `Idempotency-Replayed: true`), sem
+  validar nem escrever de novo;
+- se a primeira ainda está executando, aguardam até `ESPERA_MAXIMA`
+  segundos por ela (depois, 409 com `Retry-After`);
+- se o corpo for diferente do da primeira, recebem 422.
+
+Respostas 5xx e exceções não são guardadas: a chave é liberada para uma nova
+tentativa. As chaves expiram após `VALIDADE_HORAS` e são apagadas pelo
+`manage.py limpar_idempotencia`.
+"""
+import hashlib
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .admissao import endereco_cliente
+from .models import ChaveIdempotencia
+
+CABECALHO = 'HTTP_IDEMPOTENCY_KEY'
+
+# Intervalo entre consultas enquanto outra requisição com a mesma chave executa
+INTERVALO_ESPERA = 0.05
+
+TAMANHO_MAXIMO_CHAVE = 255
+
+METODOS_ESCRITA = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+def configuracao():
+    """
+    Configuração das chaves de idempotência, com valores padrão para chaves ausentes.
+    """
+    return {
+        'VALIDADE_HORAS': 24,
+        'ESPERA_MAXIMA': 10,
+        'TEMPO_ABANDONO': 60,
+        **getattr(settings, 'IDEMPOTENCIA', {}),
+    }
+
+
+def impressao(request):
+    """
+    Resumo (SHA-256) do método, caminho e corpo da requisição.
+
+    Formulários e uploads são resumidos pelos campos e arquivos já
+    interpretados, pois a fronteira do multipart muda a cada envio.
+    """
+    resumo = hashlib.sha256(f'{request.method} {request.get_full_path()}\n'.encode())
+    if request.content_type in ('multipart/form-data', 'application/x-www-form-urlencoded'):
+        for campo, valores in sorted(request.POST.lists()):
+            resumo.update(repr((campo, valores)).encode())
+        for campo, arquivos in sorted(request.FILES.lists()):
+            for arquivo in arquivos:
+                resumo.update(repr((campo, arquivo.name, arquivo.size)).encode())
+                for pedaco in arquivo.chunks():
+                    resumo.update(pedaco)
+                arquivo.seek(0)
+    else:
+        resumo.update(request.body)
+    return resumo.hexdigest()
+
+
+def escopo(request):
+    """
+    Escopo da chave: a view e o cliente que a chamou.
+
+    O cliente é o usuário autenticado na sessão; sem ele, a credencial do
+    cabeçalho `Authorization` (resumida), que o DRF só autentica depois deste
+    decorator; sem credencial, o endereço do cliente (como na admissão).
+    """
+    view = request.resolver_match.view_name if request.resolver_match else request.path
+    usuario = getattr(request, 'user', None)
+    if usuario is not None and usuario.is_authenticated:
+        cliente = f'usuario:{usuario.pk}'
+    elif request.META.get('HTTP_AUTHORIZATION'):
+        credencial = hashlib.sha256(request.META['HTTP_AUTHORIZATION'].encode()).hexdigest()
+        cliente = f'credencial:{credencial[:32]}'
+    else:
+        cliente = f'ip:{endereco_cliente(request)}'
+    return f'{view} {cliente}'
+
+
+def _resposta_guardada(registro):
+    resposta = HttpResponse(bytes(registro.conteudo_resposta), status=registro.status_resposta)
+    for nome, valor in registro.cabecalhos_resposta:
+        resposta[nome] = valor
+    resposta['Idempotency-Replayed'] = 'true'
+    return resposta
+
+
+def _reservar(escopo, chave, assinatura, config):
+    """
+    Registra a chave como em execução por esta requisição.
+
+    Retorna a tupla (marca, registro): se a reserva foi feita, `marca` é a
+    data de criação gravada (identifica a reserva) e `registro` é None; senão,
+    `marca` é None e `registro` é o registro existente da chave.
+    Registros expirados ou abandonados (em execução há mais de
+    `TEMPO_ABANDONO`) são assumidos por esta requisição.
+    """
+    agora = timezone.now()
+    novo = {
+        'impressao': assinatura,
+        'status_resposta': None,
+        'cabecalhos_resposta': [],
+        'conteudo_resposta': b'',
+        'data_criacao': agora,
+        'expira_em': agora + timedelta(hours=config['VALIDADE_HORAS']),
+    }
+    try:
+        with transaction.atomic():
+            ChaveIdempotencia.objects.create(escopo=escopo, chave=chave, **novo)
+        return agora, None
+    except IntegrityError:
+        pass
+
+    registro = ChaveIdempotencia.objects.filter(escopo=escopo, chave=chave).first()
+    if registro is None:
+        # Apagada pela limpeza entre o INSERT e a leitura
+        return _reservar(escopo, chave, assinatura, config)
+
+    abandonado = (
+        registro.status_resposta is None
+        and registro.data_criacao < agora - timedelta(seconds=config['TEMPO_ABANDONO'])
+    )
+    if registro.expira_em <= agora or abandonado:
+        # Só uma requisição assume: a condição inclui o estado lido
+        assumido = ChaveIdempotencia.objects.filter(
+            pk=registro.pk,
+            data_criacao=registro.data_criacao,
+            status_resposta=registro.status_resposta,
+        ).update(**novo)
+        if assumido:
+            return agora, None
+    return None, registro
+
+
+def _aguardar(registro, espera_maxima):
+    """
+    Aguarda a requisição que detém a chave concluir; retorna o registro atualizado
+    (ou None, se ela falhou e liberou a chave).
+    """
+    prazo = time.monotonic() + espera_maxima
+    while registro is not None and registro.status_resposta is None and time.monotonic() < prazo:
+        time.sleep(INTERVALO_ESPERA)
+        registro = ChaveIdempotencia.objects.filter(pk=registro.pk).first()
+    return registro
+
+
+def idempotente(view):
+    """
+    Decorator que torna idempotentes as requisições de escrita com `Idempotency-Key`.
+
+    Requisições sem o cabeçalho, ou de leitura, seguem direto para a view.
+    """
+
+    @wraps(view)
+    def _view(request, *args, **kwargs):
+        chave = request.META.get(CABECALHO)
+        if chave is None or request.method not in METODOS_ESCRITA:
+            return view(request, *args, **kwargs)
+        if not chave or len(chave) > TAMANHO_MAXIMO_CHAVE:
+            return JsonResponse(
+                {'detail': f"Idempotency-Key deve ter entre 1 e {TAMANHO_MAXIMO_CHAVE} caracteres."},
+                status=400,
+            )
+
+        config = configuracao()
+        escopo_chave = escopo(request)
+        assinatura = impressao(request)
+
+        prazo = time.monotonic() + config['ESPERA_MAXIMA']
+        while True:
+            marca, registro = _reservar(escopo_chave, chave, assinatura, config)
+            if marca is not None:
+                break
+            if registro.impressao != assinatura:
+                return JsonResponse(
+                    {'detail': "Idempotency-Key já usada com outra requisição."}, status=422
+                )
+            registro = _aguardar(registro, max(0.0, prazo - time.monotonic()))
+            if registro is not None and registro.status_resposta is not None:
+                return _resposta_guardada(registro)
+            if registro is not None:
+                resposta = JsonResponse(
+                    {'detail': "Uma requisição com esta Idempotency-Key ainda está em execução."},
+                    status=409,
+                )
+                resposta['Retry-After'] = '1'
+                return resposta
+            # A primeira falhou e liberou a chave: tenta reservá-la
+
+        # A reserva pode ter sido assumida por outra requisição (abandono ou expiração)
+        reserva = ChaveIdempotencia.objects.filter(escopo=escopo_chave, chave=chave, data_criacao=marca)
+        try:
+            resposta = view(request, *args, **kwargs)
+            if callable(getattr(resposta, 'render', None)):
+                resposta.render()
+        except BaseException:
+            reserva.delete()
+            raise
+
+        if resposta.status_code >= 500 or getattr(resposta, 'streaming', False):
+            reserva.delete()
+        else:
+            reserva.update(
+                status_resposta=resposta.status_code,
+                cabecalhos_resposta=list(resposta.items()),
+                conteudo_resposta=resposta.content,
+            )
+        return resposta
+
+    return _view
+
+
+def limpar_expiradas(tamanho_lote=1000):
+    """
+    Apaga as chaves expiradas em lotes curtos; retorna quantas foram apagadas.
+    """
+    total = 0
+    while True:
+        ids = list(
+            ChaveIdempotencia.objects.filter(expira_em__lte=timezone.now())
+            .order_by().values_list('pk', flat=True)[:tamanho_lote]
+        )
+        if not ids:
+            return total
+        total += ChaveIdempotencia.objects.filter(pk__in=ids).delete()[0]
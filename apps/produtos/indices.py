@@ -0,0 +1,131 @@
+"""
+Base dos índices em memória sincronizados com o catálogo.
+
+Um `IndiceIncremental` é carregado por inteiro na primeira consulta e, a
+cada nova versão do catálogo, relê apenas os produtos citados no histórico
+(`HistoricoProduto`) desde o último registro aplicado. Como toda escrita em
+produtos gera histórico na mesma transação, o id do último registro serve
+de cursor da sincronização.
+
+A carga completa é feita no aquecimento do worker (`inicializacao.aquecer`)
+e pelos trabalhadores de tarefas. No caminho das requisições, a sincronização
+é chamada com `reconstruir=False` e nunca lê o catálogo inteiro.
+"""
+import threading
+from abc import ABC, abstractmethod
+
+from django.db.models import Max, Q
+
+from .historico import OPERACOES_MOVIMENTACAO
+from .models import HistoricoProduto, Produto
+
+# Acima desta quantidade de registros pendentes no histórico, o índice é reconstruído
+LIMITE_SINCRONIZACAO_INCREMENTAL = 50000
+
+# Ids por consulta ao reler produtos alterados (abaixo do limite de parâmetros do SQLite)
+TAMANHO_LOTE_IDS = 500
+
+
+class IndiceIncremental(ABC):
+    """
+    Índice em memória de alguns campos de `Produto`.
+
+    Subclasses definem `campos` (lidos do banco e passados a `inserir`, nessa
+    ordem, depois do id), `limpar`, `inserir` e `remover`. Consultas devem ser
+    feitas segurando `trava`.
+    """
+    campos = ()
+
+    def __init__(self):
+        self.versao = None
+        self.ultimo_historico = 0
+        self.trava = threading.Lock()
+        self.limpar()
+
+    @abstractmethod
+    def limpar(self):
+        """
+        Esvazia o índice.
+        """
+
+    @abstractmethod
+    def inserir(self, produto_id, *valores):
+        """
+        Insere ou reposiciona um produto, com os valores de `campos`.
+        """
+
+    @abstractmethod
+    def remover(self, produto_id):
+        """
+        Remove um produto, se estiver no índice.
+        """
+
+    def invalidar(self):
+        """
+        Força a reconstrução completa na próxima sincronização.
+        """
+        with self.trava:
+            self.versao = None
+
+    def sincronizar(self, versao, reconstruir=True):
+        """
+        Atualiza o índice para a versão informada do catálogo.
+
+        A primeira chamada carrega todos os produtos; as seguintes releem só
+        os produtos com registros no histórico posteriores ao último aplicado.
+
+        Com `reconstruir` falso (requisições), só a sincronização incremental
+        é feita, mesmo com muitos registros pendentes; um índice ainda não
+        carregado continua vazio. Retorna se o índice está na versão pedida.
+        """
+        if self.versao == versao:
+            return True
+        with self.trava:
+            if self.versao == versao:
+                return True
+            if self.versao is None and not reconstruir:
+                return False
+            pendentes = HistoricoProduto.objects.filter(pk__gt=self.ultimo_historico)
+            if self.versao is None or (
+                reconstruir and pendentes.count() > LIMITE_SINCRONIZACAO_INCREMENTAL
+            ):
+                self._reconstruir()
+            else:
+                self._aplicar(pendentes)
+            self.versao = versao
+        return True
+
+    def _reconstruir(self):
+        """
+        Recarrega o índice inteiro a partir da tabela de produtos.
+        """
+        # O cursor é lido antes dos produtos: o que mudar no meio é reaplicado depois
+        ultimo = HistoricoProduto.objects.aggregate(ultimo=Max('pk'))['ultimo'] or 0
+        self.limpar()
+        for linha in Produto.objects.order_by().values_list('pk', *self.campos).iterator(chunk_size=5000):
+            self.inserir(*linha)
+        self.ultimo_historico = ultimo
+
+    def _aplicar(self, pendentes):
+        """
+        Reposiciona ou remove os produtos afetados pelos registros pendentes.
+        """
+        ultimo = pendentes.aggregate(ultimo=Max('pk'))['ultimo'] or self.ultimo_historico
+        afetados = sorted(set(
+            pendentes.filter(pk__lte=ultimo)
+            .filter(
+                Q(operacao__in=['criacao', 'exclusao', *OPERACOES_MOVIMENTACAO])
+                | Q(alteracoes__has_any_keys=list(self.campos))
+            )
+            .values_list('produto_id', flat=True)
+        ))
+
+        for inicio in range(0, len(afetados), TAMANHO_LOTE_IDS):
+            lote = afetados[inicio:inicio + TAMANHO_LOTE_IDS]
+            encontrados = set()
+            for linha in Produto.objects.filter(pk__in=lote).values_list('pk', *self.campos):
+                self.inserir(*linha)
+                encontrados.add(linha[0])
+            for produto_id in set(lote) - encontrados:
+                self.remover(produto_id)
+        self.ultimo_historico = ultimo
@@ -0,0 +1,186 @@
+"""
+Inicialização rápida dos workers: medição do tempo de partida e aquecimento.
+
+- `medir_inicializacao` cronometra, em um interpretador novo, cada etapa da
+  partida do Django (configurações, importação, modelos e `ready()` de cada
+  app, URLconf, middlewares) seguida do aquecimento. É usada pelo
+  `manage.py tempo_inicializacao`, que roda a medição em um subprocesso.
+- `aquecer` prepara o worker antes de ele aceitar tráfego: carrega as URLs,
+  compila os templates do projeto, abre a conexão com o banco, renderiza as
+  páginas configuradas (preenchendo o cache de fragmentos) e carrega os
+  índices em memória. O `setup/wsgi.py` chama `aquecer_se_ativo`.
+
+Este módulo não importa nada do Django no topo, para que `medir_inicializacao`
+cronometre também a importação do próprio framework.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def _cronometro(tempos, etapa):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        tempos[etapa] = tempos.get(etapa, 0.0) + time.perf_counter() - inicio
+
+
+def configuracao():
+    """
+    Configuração do aquecimento, com valores padrão para chaves ausentes.
+    """
+    from django.conf import settings
+
+    return {
+        'ATIVO': True,
+        'PAGINAS': ['/', '/cadastro/'],
+        'INDICES': True,
+        **getattr(settings, 'AQUECIMENTO', {}),
+    }
+
+
+def templates_do_projeto():
+    """
+    Nomes dos templates nos diretórios de templates do próprio projeto
+    (os do Django e de pacotes instalados ficam de fora).
+    """
+    from django.conf import settings
+    from django.template import engines
+
+    base = Path(settings.BASE_DIR).resolve()
+    nomes = set()
+    for engine in engines.all():
+        for diretorio in getattr(engine, 'template_dirs', ()):
+            diretorio = Path(diretorio).resolve()
+            if not diretorio.is_dir() or base not in diretorio.parents:
+                continue
+            nomes.update(
+                arquivo.relative_to(diretorio).as_posix()
+                for arquivo in diretorio.rglob('*.html')
+            )
+    return sorted(nomes)
+
+
+def aquecer(config=None):
+    """
+    Executa o aquecimento e retorna a duração de cada etapa, em segundos.
+
+    Falhas em uma etapa são registradas no log e não impedem as demais: um
+    worker sem aquecimento só fica mais lento na primeira requisição.
+    """
+    from django.db import connections
+    from django.template.loader import get_template
+    from django.test import RequestFactory
+    from django.urls import get_resolver, resolve
+
+    from .catalogo import versao_atual
+
+    config = config or configuracao()
+    tempos = {}
+
+    def etapa(nome, funcao):
+        try:
+            with _cronometro(tempos, nome):
+                funcao()
+        except Exception:
+            logger.exception("Falha no aquecimento (%s)", nome)
+
+    def paginas():
+        fabrica = RequestFactory()
+        for url in config['PAGINAS']:
+            correspondencia = resolve(url)
+            correspondencia.func(fabrica.get(url), *correspondencia.args, **correspondencia.kwargs)
+
+    def indices():
+        from .duplicados import indice_nomes
+        from .similares import indice_similares
+
+        versao = versao_atual().versao
+        indice_nomes.sincronizar(versao)
+        indice_similares.sincronizar(versao)
+
+    etapa('urls', lambda: get_resolver().reverse_dict)
+    etapa('templates', lambda: [get_template(nome) for nome in templates_do_projeto()])
+    etapa('banco', versao_atual)
+    etapa('paginas', paginas)
+    if config['INDICES']:
+        etapa('indices', indices)
+
+    # Conexões abertas aqui não devem ser herdadas por processos filhos (preload)
+    connections.close_all()
+    return tempos
+
+
+def aquecer_se_ativo():
+    """
+    Aquece o worker se `AQUECIMENTO['ATIVO']`; chamado pelo `setup/wsgi.py`.
+    """
+    config = configuracao()
+    if not config['ATIVO']:
+        return None
+    inicio = time.perf_counter()
+    tempos = aquecer(config)
+    logger.info(
+        "Worker aquecido em %.0fms (%s)",
+        (time.perf_counter() - inicio) * 1000,
+        ', '.join(f'{etapa} {segundos * 1000:.0f}ms' for etapa, segundos in tempos.items()),
+    )
+    return tempos
+
+
+def medir_inicializacao():
+    """
+    Cronometra a partida do Django neste processo, que ainda não pode tê-la feito.
+
+    Retorna {'etapas': {etapa: segundos}, 'apps': {app: {importacao, modelos, ready}}}.
+    """
+    tempos = {}
+    with _cronometro(tempos, 'importar_django'):
+        import django
+        from django.apps.config import AppConfig
+        from django.conf import settings
+
+    with _cronometro(tempos, 'configuracoes'):
+        settings.INSTALLED_APPS
+
+    # Cada AppConfig criado pelo registro tem import_models/ready cronometrados
+    apps = {}
+    criar_original = AppConfig.create.__func__
+
+    def cronometrado(registro, chave, metodo):
+        def executar():
+            with _cronometro(registro, chave):
+                return metodo()
+        return executar
+
+    def criar(cls, entrada):
+        registro = apps.setdefault(entrada, {})
+        with _cronometro(registro, 'importacao'):
+            app_config = criar_original(cls, entrada)
+        app_config.import_models = cronometrado(registro, 'modelos', app_config.import_models)
+        app_config.ready = cronometrado(registro, 'ready', app_config.ready)
+        return app_config
+
+    AppConfig.create = classmethod(criar)
+    try:
+        with _cronometro(tempos, 'django_setup'):
+            django.setup()
+    finally:
+        AppConfig.create = classmethod(criar_original)
+
+    from django.core.wsgi import get_wsgi_application
+    from django.urls import get_resolver
+
+    with _cronometro(tempos, 'urlconf'):
+        get_resolver().reverse_dict
+    with _cronometro(tempos, 'middlewares'):
+        get_wsgi_application()
+
+    aquecimento = aquecer()
+    tempos.update({f'aquecimento_{etapa}': segundos for etapa, segundos in aquecimento.items()})
+    return {'etapas': tempos, 'apps': apps}
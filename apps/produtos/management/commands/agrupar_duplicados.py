@@ -0,0 +1,49 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.produtos.duplicados import LIMIAR_SIMILARIDADE, agrupar_duplicados
+from apps.produtos.models import Produto
+
+
+class Command(BaseCommand):
+    help = "Agrupa os produtos do catálogo com nomes possivelmente duplicados."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limiar', type=float, default=LIMIAR_SIMILARIDADE,
+            help=f"Semelhança mínima (Jaccard de trigramas, 0 a 1; padrão: {LIMIAR_SIMILARIDADE}).",
+        )
+        parser.add_argument(
+            '--saida',
+            help="Grava os grupos em um arquivo JSON em vez de listá-los.",
+        )
+
+    def handle(self, *args, **options):
+        limiar = options['limiar']
+        if not 0 < limiar <= 1:
+            raise CommandError("O limiar deve estar entre 0 e 1.")
+
+        inicio = time.perf_counter()
+        nomes = dict(Produto.objects.order_by().values_list('pk', 'nome').iterator(chunk_size=5000))
+        grupos = agrupar_duplicados(nomes.items(), limiar=limiar)
+        decorrido = time.perf_counter() - inicio
+
+        if options['saida']:
+            with open(options['saida'], 'w', encoding='utf-8') as saida:
+                json.dump(
+                    [[{'id': produto_id, 'nome': nomes[produto_id]} for produto_id in grupo] for grupo in grupos],
+                    saida, ensure_ascii=False, indent=2,
+                )
+        else:
+            for numero, grupo in enumerate(grupos, start=1):
+                self.stdout.write(f"\nGrupo {numero} ({len(grupo)} produtos):")
+                for produto_id in grupo:
+                    self.stdout.write(f"  #{produto_id} {nomes[produto_id]}")
+
+        duplicados = sum(len(grupo) for grupo in grupos)
+        self.stdout.write(self.style.SUCCESS(
+            f"\n{len(grupos)} grupo(s) com {duplicados} produto(s) entre {len(nomes)} "
+            f"analisados em {decorrido:.2f}s (limiar {limiar})."
+        ))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from apps.produtos.arquivamento import arquivar_elegiveis, elegiveis, politica
+from apps.produtos.models import Produto
+
+
+class Command(BaseCommand):
+    help = "Move para o arquivo os produtos que se enquadram na política de arquivamento."
+
+    def add_arguments(self, parser):
+        config = politica()
+        parser.add_argument(
+            '--status', nargs='+', choices=[valor for valor, _ in Produto.STATUS_ANVISA_CHOICES],
+            help=f"Status ANVISA arquiváveis (padrão: {' '.join(config['STATUS'])}).",
+        )
+        parser.add_argument(
+            '--idade-dias', type=int,
+            help=f"Dias sem atualização para arquivar (padrão: {config['IDADE_DIAS']}).",
+        )
+        parser.add_argument(
+            '--lote', type=int,
+            help=f"Produtos por transação (padrão: {config['TAMANHO_LOTE']}).",
+        )
+        parser.add_argument(
+            '--simular', action='store_true',
+            help="Apenas informa quantos produtos seriam arquivados.",
+        )
+
+    def handle(self, *args, **options):
+        status, idade_dias = options['status'], options['idade_dias']
+        quantidade = elegiveis(status, idade_dias).count()
+        if options['simular'] or not quantidade:
+            self.stdout.write(f"{quantidade} produto(s) elegível(is) para arquivamento.")
+            return
+
+        self.stdout.write(f"Arquivando {quantidade} produto(s)...")
+        total = arquivar_elegiveis(
+            status, idade_dias, options['lote'],
+            ao_concluir_lote=lambda total: self.stdout.write(f"  {total}/{quantidade}"),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} produto(s) arquivado(s); {Produto.objects.count()} no catálogo ativo."
+        ))
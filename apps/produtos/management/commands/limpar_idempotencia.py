@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from apps.produtos.idempotencia import limpar_expiradas
+from apps.produtos.models import ChaveIdempotencia
+
+
+class Command(BaseCommand):
+    help = "Apaga as chaves de idempotência expiradas."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote', type=int, default=1000,
+            help="Chaves apagadas por transação (padrão: 1000).",
+        )
+
+    def handle(self, *args, **options):
+        apagadas = limpar_expiradas(max(1, options['lote']))
+        self.stdout.write(self.style.SUCCESS(
+            f"{apagadas} chave(s) expirada(s) apagada(s); {ChaveIdempotencia.objects.count()} restante(s)."
+        ))
@@ -0,0 +1,151 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from apps.produtos.manutencao import (
+    ETAPAS,
+    MODOS_CHECKPOINT,
+    ativar_vacuum_incremental,
+    configuracao,
+    executar,
+    relatorio,
+)
+
+# Tabelas e índices listados no relatório em texto (o JSON traz todos)
+MAIORES_OBJETOS = 12
+
+
+def _tamanho(quantidade):
+    for unidade in ('B', 'KB', 'MB'):
+        if quantidade < 1024:
+            return f"{quantidade:.0f}{unidade}" if unidade == 'B' else f"{quantidade:.1f}{unidade}"
+        quantidade /= 1024
+    return f"{quantidade:.1f}GB"
+
+
+class Command(BaseCommand):
+    help = (
+        "Manutenção do banco SQLite em passos curtos: verificação de integridade, vacuum "
+        "incremental, ANALYZE e checkpoint do WAL, com relatório de tamanhos, fragmentação "
+        "e planos das consultas de produtos antes e depois."
+    )
+
+    def add_arguments(self, parser):
+        config = configuracao()
+        parser.add_argument(
+            '--etapas', nargs='+', choices=ETAPAS, default=list(ETAPAS),
+            help=f"Etapas a executar (padrão: {' '.join(ETAPAS)}).",
+        )
+        parser.add_argument(
+            '--tempo-maximo', type=float,
+            help=f"Segundos disponíveis para a manutenção (padrão: {config['TEMPO_MAXIMO']}).",
+        )
+        parser.add_argument(
+            '--checkpoint', choices=[modo.lower() for modo in MODOS_CHECKPOINT],
+            help=f"Modo do checkpoint do WAL (padrão: {config['CHECKPOINT'].lower()}).",
+        )
+        parser.add_argument(
+            '--somente-relatorio', action='store_true',
+            help="Apenas mostra o relatório, sem executar a manutenção.",
+        )
+        parser.add_argument(
+            '--ativar-vacuum-incremental', action='store_true',
+            help="Passa o banco para auto_vacuum INCREMENTAL com um VACUUM completo "
+                 "(bloqueia as escritas enquanto dura; faça uma vez, em janela de manutenção).",
+        )
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help="Banco de dados (padrão: default).",
+        )
+        parser.add_argument(
+            '--json', action='store_true',
+            help="Imprime o relatório em JSON.",
+        )
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        if connections[alias].vendor != 'sqlite':
+            raise CommandError("A manutenção só se aplica a bancos SQLite.")
+
+        config = configuracao()
+        if options['tempo_maximo'] is not None:
+            config['TEMPO_MAXIMO'] = options['tempo_maximo']
+        if options['checkpoint']:
+            config['CHECKPOINT'] = options['checkpoint']
+        if config['CHECKPOINT'].upper() not in MODOS_CHECKPOINT:
+            raise CommandError(f"Modo de checkpoint inválido: {config['CHECKPOINT']!r}")
+
+        antes = relatorio(alias)
+        if options['somente_relatorio']:
+            if options['json']:
+                self.stdout.write(json.dumps({'antes': antes}, indent=2))
+            else:
+                self._relatorio(antes)
+            return
+
+        if not options['json']:
+            self._relatorio(antes, "Antes")
+        if options['ativar_vacuum_incremental']:
+            modo = ativar_vacuum_incremental(alias)
+            if not options['json']:
+                self.stdout.write(f"auto_vacuum: {modo}")
+
+        def ao_concluir_etapa(etapa, resultado):
+            if not options['json']:
+                self._etapa(etapa, resultado)
+
+        if not options['json']:
+            self.stdout.write(self.style.MIGRATE_HEADING("\nManutenção"))
+        resultados = executar(options['etapas'], alias, config, ao_concluir_etapa)
+        depois = relatorio(alias)
+
+        if options['json']:
+            self.stdout.write(json.dumps({'antes': antes, 'etapas': resultados, 'depois': depois}, indent=2))
+        else:
+            self._relatorio(depois, "\nDepois", antes)
+
+        integridade = resultados.get('integridade', {})
+        if integridade and not integridade.get('pulada') and not integridade['ok']:
+            raise CommandError("A verificação de integridade encontrou problemas.")
+
+    def _etapa(self, etapa, resultado):
+        if resultado.get('pulada'):
+            self.stdout.write(self.style.WARNING(f"  {etapa:<14} pulada (tempo esgotado)"))
+            return
+        detalhes = ', '.join(
+            f"{chave}={valor}" for chave, valor in resultado.items() if chave not in ('segundos', 'aviso')
+        )
+        self.stdout.write(f"  {etapa:<14} {resultado['segundos'] * 1000:8.1f}ms  {detalhes}")
+        if resultado.get('aviso'):
+            self.stdout.write(self.style.WARNING(f"  {'':<14} {resultado['aviso']}"))
+
+    def _relatorio(self, dados, titulo="Relatório", anterior=None):
+        arquivo = dados['arquivo']
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{titulo}: {arquivo['caminho']}"))
+        self.stdout.write(
+            f"  {_tamanho(arquivo['bytes'])} ({arquivo['paginas']} páginas de {arquivo['tamanho_pagina']}B), "
+            f"WAL {_tamanho(arquivo.get('bytes_wal', 0))}, journal {arquivo['modo_journal']}, "
+            f"auto_vacuum {arquivo['auto_vacuum']}"
+        )
+        self.stdout.write(
+            f"  páginas livres: {arquivo['paginas_livres']} ({arquivo['fragmentacao']:.1%} do arquivo)"
+        )
+
+        if dados['objetos'] is None:
+            self.stdout.write("  (tamanhos por tabela indisponíveis: SQLite sem a tabela virtual dbstat)")
+        else:
+            self.stdout.write(f"  {'maiores tabelas e índices':<56} {'tamanho':>9} {'preench.':>9}")
+            for objeto in dados['objetos'][:MAIORES_OBJETOS]:
+                nome = objeto['nome'] if objeto['tipo'] == 'tabela' else f"  {objeto['nome']}"
+                self.stdout.write(
+                    f"  {nome[:56]:<56} {_tamanho(objeto['bytes']):>9} {objeto['preenchimento']:>9.1%}"
+                )
+
+        self.stdout.write("  planos:")
+        for consulta, plano in dados['planos'].items():
+            mudou = anterior is not None and anterior['planos'].get(consulta) != plano
+            marca = self.style.WARNING(' (mudou)') if mudou else ''
+            self.stdout.write(f"    {consulta}{marca}")
+            for linha in plano:
+                self.stdout.write(f"      {linha}")
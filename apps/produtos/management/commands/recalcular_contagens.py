@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from apps.produtos.contagens import recalcular
+
+
+class Command(BaseCommand):
+    help = (
+        "Refaz as contagens de produtos por combinação a partir da tabela de produtos "
+        "e informa as divergências encontradas."
+    )
+
+    def handle(self, *args, **options):
+        diferencas = recalcular()
+        if not diferencas:
+            self.stdout.write(self.style.SUCCESS("Contagens conferidas: nenhuma divergência."))
+            return
+        for (categoria, status, espectro, acima), diferenca in sorted(diferencas.items()):
+            limite = 'THC > 0.3%' if acima else 'THC <= 0.3%'
+            self.stdout.write(f"  {categoria}/{status}/{espectro} ({limite}): {diferenca:+d}")
+        self.stdout.write(self.style.WARNING(f"{len(diferencas)} combinação(ões) corrigida(s)."))
@@ -0,0 +1,73 @@
+import multiprocessing
+import os
+
+import django
+from django.apps import apps as registro_apps
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+def _trabalhador(intervalo, uma_vez):
+    """
+    Ponto de entrada de cada processo trabalhador.
+
+    Com o método `spawn` (padrão no Windows e no macOS), o processo filho
+    reimporta este módulo sem o Django configurado: a configuração e a
+    importação dos módulos do app acontecem aqui.
+    """
+    if not registro_apps.ready:
+        django.setup()
+    from apps.produtos.tarefas import processar_fila
+
+    try:
+        processar_fila(intervalo=intervalo, uma_vez=uma_vez)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Executa as tarefas enfileiradas (importações, exportações e auditorias) em um pool de processos."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concorrencia', type=int, default=os.cpu_count() or 1,
+            help="Número de processos trabalhadores (padrão: número de CPUs).",
+        )
+        parser.add_argument(
+            '--intervalo', type=float, default=1.0,
+            help="Segundos entre consultas à fila quando não há tarefas.",
+        )
+        parser.add_argument(
+            '--uma-vez', action='store_true',
+            help="Encerra quando a fila estiver vazia, em vez de aguardar novas tarefas.",
+        )
+
+    def handle(self, *args, **options):
+        concorrencia = max(1, options['concorrencia'])
+        self.stdout.write(f"Iniciando {concorrencia} trabalhador(es)...")
+
+        # Conexões abertas não podem ser herdadas pelos processos filhos
+        connections.close_all()
+
+        processos = [
+            multiprocessing.Process(
+                target=_trabalhador,
+                args=(options['intervalo'], options['uma_vez']),
+                name=f'trabalhador-{numero}',
+            )
+            for numero in range(1, concorrencia + 1)
+        ]
+        for processo in processos:
+            processo.start()
+
+        try:
+            for processo in processos:
+                processo.join()
+        except KeyboardInterrupt:
+            self.stdout.write("Interrompido; aguardando os trabalhadores encerrarem...")
+            for processo in processos:
+                processo.join()
+
+        self.stdout.write(self.style.SUCCESS("Trabalhadores encerrados."))
@@ -0,0 +1,97 @@
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Executado em um interpretador novo: este processo já fez a partida do Django
+MEDICAO = (
+    "import json; "
+    "from apps.produtos.inicializacao import medir_inicializacao; "
+    "print(json.dumps(medir_inicializacao()))"
+)
+
+
+def _importacoes(saida_erro):
+    """
+    Lê a saída de `python -X importtime`: [(módulo, próprio_us, acumulado_us)].
+    """
+    modulos = []
+    for linha in saida_erro.splitlines():
+        if not linha.startswith('import time:') or 'self [us]' in linha:
+            continue
+        proprio, acumulado, modulo = linha[len('import time:'):].split('|')
+        modulos.append((modulo.strip(), int(proprio), int(acumulado)))
+    return modulos
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede o tempo de partida de um worker: importação, modelos e ready() de cada app, "
+        "URLconf, middlewares, aquecimento e os módulos mais lentos de importar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--modulos', type=int, default=15,
+            help="Quantos módulos mais lentos de importar listar (padrão: 15).",
+        )
+        parser.add_argument(
+            '--json', action='store_true',
+            help="Imprime o relatório em JSON.",
+        )
+
+    def handle(self, *args, **options):
+        processo = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', MEDICAO],
+            cwd=settings.BASE_DIR,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'setup.settings')},
+            capture_output=True,
+            text=True,
+        )
+        if processo.returncode:
+            raise CommandError(f"A medição falhou:\n{processo.stderr[-2000:]}")
+        medicao = json.loads(processo.stdout.strip().splitlines()[-1])
+
+        # Avisos da partida (ex.: falhas no aquecimento) chegam misturados ao importtime
+        avisos = [linha for linha in processo.stderr.splitlines() if not linha.startswith('import time:')]
+        if avisos:
+            self.stderr.write('\n'.join(avisos))
+
+        importacoes = _importacoes(processo.stderr)
+        por_pacote = defaultdict(int)
+        for modulo, proprio, _ in importacoes:
+            por_pacote[modulo.split('.')[0]] += proprio
+        mais_lentos = sorted(importacoes, key=lambda item: item[1], reverse=True)[:options['modulos']]
+
+        if options['json']:
+            self.stdout.write(json.dumps({
+                **medicao,
+                'pacotes_ms': {pacote: round(us / 1000, 3) for pacote, us in por_pacote.items()},
+                'modulos_ms': {modulo: round(proprio / 1000, 3) for modulo, proprio, _ in mais_lentos},
+            }, indent=2))
+            return
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Etapas da partida"))
+        etapas = medicao['etapas']
+        for etapa, segundos in etapas.items():
+            self.stdout.write(f"  {etapa:<28} {segundos * 1000:9.1f}ms")
+        self.stdout.write(self.style.SUCCESS(f"  {'total':<28} {sum(etapas.values()) * 1000:9.1f}ms"))
+
+        self.stdout.write(self.style.MIGRATE_HEADING("\nApps (importação / modelos / ready)"))
+        for app, tempos in medicao['apps'].items():
+            colunas = ' '.join(
+                f"{tempos.get(chave, 0) * 1000:8.1f}ms" for chave in ('importacao', 'modelos', 'ready')
+            )
+            self.stdout.write(f"  {app:<40} {colunas}")
+
+        self.stdout.write(self.style.MIGRATE_HEADING("\nImportação por pacote (tempo próprio)"))
+        for pacote, us in sorted(por_pacote.items(), key=lambda item: item[1], reverse=True)[:10]:
+            self.stdout.write(f"  {pacote:<40} {us / 1000:8.1f}ms")
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\n{len(mais_lentos)} módulos mais lentos"))
+        for modulo, proprio, acumulado in mais_lentos:
+            self.stdout.write(f"  {modulo:<50} {proprio / 1000:8.1f}ms (acumulado {acumulado / 1000:.1f}ms)")
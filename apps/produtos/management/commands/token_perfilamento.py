@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from apps.produtos.perfilamento import configuracao, gerar_token
+
+
+class Command(BaseCommand):
+    help = "Gera um token assinado para o cabeçalho X-Perfilar."
+
+    def handle(self, *args, **options):
+        if not configuracao()['ATIVO']:
+            self.stderr.write(self.style.WARNING(
+                "Perfilamento desativado: defina PERFILAMENTO_ATIVO=True para o token ter efeito."
+            ))
+        self.stdout.write(gerar_token())
@@ -0,0 +1,261 @@
+"""
+Manutenção periódica do banco SQLite (`manage.py manutencao_db`).
+
+Cada etapa é feita em passos curtos, cada um em sua própria transação, com
+uma pausa entre eles para que as escritas da API e dos workers não esperem
+muito pelo lock; quando o tempo total (`TEMPO_MAXIMO`) se esgota, as etapas
+restantes são puladas e aparecem assim no relatório.
+
+- integridade: `PRAGMA integrity_check` tabela por tabela (com os índices);
+- vacuum: `PRAGMA incremental_vacuum`, `PAGINAS_POR_PASSO` páginas livres
+  por vez (requer `auto_vacuum = INCREMENTAL`, veja `ativar_vacuum_incremental`);
+- estatisticas: `ANALYZE` tabela por tabela, com `analysis_limit`, para o
+  planejador escolher índices com dados atuais;
+- checkpoint: `PRAGMA wal_checkpoint`, por padrão PASSIVE (não bloqueia escritas).
+
+`relatorio` descreve o arquivo (tamanho, WAL, páginas livres), o tamanho e
+o preenchimento de cada tabela e índice e o plano das principais consultas
+de produtos; o comando o mostra antes e depois da manutenção.
+"""
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from .arquivamento import elegiveis
+from .contagens import FILTRO_RISCO
+from .models import ChaveIdempotencia, ContagemProduto, HistoricoProduto, Produto, Tarefa
+
+ETAPAS = ('integridade', 'vacuum', 'estatisticas', 'checkpoint')
+
+MODOS_AUTO_VACUUM = {0: 'NONE', 1: 'FULL', 2: 'INCREMENTAL'}
+
+MODOS_CHECKPOINT = ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE')
+
+
+def configuracao():
+    """
+    Configuração da manutenção do banco, com valores padrão para chaves ausentes.
+    """
+    return {
+        'TEMPO_MAXIMO': 60.0,
+        'PAUSA_ENTRE_PASSOS': 0.05,
+        'PAGINAS_POR_PASSO': 256,
+        'LIMITE_ANALISE': 1000,
+        'CHECKPOINT': 'PASSIVE',
+        **getattr(settings, 'MANUTENCAO_DB', {}),
+    }
+
+
+def consultas_principais():
+    """
+    Consultas de produtos cujo plano é acompanhado no relatório.
+    """
+    return {
+        'listagem': Produto.objects.all(),
+        'risco': Produto.objects.filter(**FILTRO_RISCO),
+        'por_status': Produto.objects.filter(status_anvisa='aprovado'),
+        'arquivamento': elegiveis().order_by('pk').values('pk'),
+        'historico_produto': HistoricoProduto.objects.filter(produto_id=1),
+        'contagens': ContagemProduto.objects.filter(categoria_terapeutica__in=FILTRO_RISCO['categoria_terapeutica__in']),
+        'fila_tarefas': Tarefa.objects.filter(status='pendente').order_by('disponivel_em'),
+        'idempotencia_expiradas': ChaveIdempotencia.objects.filter(expira_em__lte=timezone.now()),
+    }
+
+
+def _pragma(cursor, nome):
+    cursor.execute(f'PRAGMA {nome}')
+    return cursor.fetchone()[0]
+
+
+def _tabelas(cursor):
+    cursor.execute(
+        "SELECT name FROM sqlite_schema WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+    )
+    return [nome for nome, in cursor.fetchall()]
+
+
+def _objetos(cursor):
+    """
+    Tamanho e preenchimento de cada tabela e índice, pela tabela virtual `dbstat`
+    (None se o SQLite não foi compilado com ela).
+    """
+    try:
+        cursor.execute(
+            "SELECT s.name, COALESCE(m.type, 'table'), m.tbl_name, COUNT(*), SUM(s.pgsize), SUM(s.unused) "
+            "FROM dbstat AS s LEFT JOIN sqlite_schema AS m ON m.name = s.name "
+            "GROUP BY s.name ORDER BY SUM(s.pgsize) DESC"
+        )
+    except Exception:
+        return None
+    return [
+        {
+            'nome': nome,
+            'tipo': 'indice' if tipo == 'index' else 'tabela',
+            'tabela': tabela or nome,
+            'paginas': paginas,
+            'bytes': tamanho,
+            'preenchimento': round(1 - (livres / tamanho), 4) if tamanho else 0.0,
+        }
+        for nome, tipo, tabela, paginas, tamanho, livres in cursor.fetchall()
+    ]
+
+
+def relatorio(alias='default'):
+    """
+    Estado atual do banco: arquivo, tabelas e índices e planos das consultas principais.
+    """
+    conexao = connections[alias]
+    with conexao.cursor() as cursor:
+        tamanho_pagina = _pragma(cursor, 'page_size')
+        paginas = _pragma(cursor, 'page_count')
+        livres = _pragma(cursor, 'freelist_count')
+        arquivo = {
+            'caminho': str(conexao.settings_dict['NAME']),
+            'modo_journal': _pragma(cursor, 'journal_mode'),
+            'auto_vacuum': MODOS_AUTO_VACUUM.get(_pragma(cursor, 'auto_vacuum'), '?'),
+            'tamanho_pagina': tamanho_pagina,
+            'paginas': paginas,
+            'paginas_livres': livres,
+            'fragmentacao': round(livres / paginas, 4) if paginas else 0.0,
+            'bytes': paginas * tamanho_pagina,
+        }
+        objetos = _objetos(cursor)
+
+    if not conexao.is_in_memory_db():
+        wal = Path(f"{conexao.settings_dict['NAME']}-wal")
+        arquivo['bytes_wal'] = wal.stat().st_size if wal.exists() else 0
+
+    planos = {}
+    for nome, queryset in consultas_principais().items():
+        planos[nome] = queryset.using(alias).explain().splitlines()
+    return {'arquivo': arquivo, 'objetos': objetos, 'planos': planos}
+
+
+class Prazo:
+    """
+    Tempo restante da manutenção, compartilhado pelas etapas.
+    """
+
+    def __init__(self, segundos):
+        self.fim = time.monotonic() + segundos
+
+    @property
+    def esgotado(self):
+        return time.monotonic() >= self.fim
+
+
+def verificar_integridade(cursor, prazo, config):
+    """
+    `integrity_check` de cada tabela e dos seus índices; retorna {tabela: problemas}
+    (só as com problemas) e as tabelas que não couberam no prazo.
+    """
+    problemas, pendentes = {}, []
+    for tabela in _tabelas(cursor):
+        if prazo.esgotado:
+            pendentes.append(tabela)
+            continue
+        cursor.execute(f'PRAGMA integrity_check("{tabela}")')
+        mensagens = [mensagem for mensagem, in cursor.fetchall() if mensagem != 'ok']
+        if mensagens:
+            problemas[tabela] = mensagens
+        time.sleep(config['PAUSA_ENTRE_PASSOS'])
+    return {'ok': not problemas, 'problemas': problemas, 'pendentes': pendentes}
+
+
+def vacuum_incremental(cursor, prazo, config):
+    """
+    Devolve ao sistema de arquivos as páginas livres, `PAGINAS_POR_PASSO` por transação.
+    """
+    if _pragma(cursor, 'auto_vacuum') != 2:
+        return {
+            'liberadas': 0,
+            'restantes': _pragma(cursor, 'freelist_count'),
+            'aviso': "auto_vacuum não é INCREMENTAL: rode uma vez com --ativar-vacuum-incremental.",
+        }
+    inicio = _pragma(cursor, 'freelist_count')
+    livres = inicio
+    while livres and not prazo.esgotado:
+        cursor.execute(f"PRAGMA incremental_vacuum({int(config['PAGINAS_POR_PASSO'])})")
+        # Cada linha do resultado é uma página liberada: é preciso consumi-lo todo
+        cursor.fetchall()
+        livres = _pragma(cursor, 'freelist_count')
+        time.sleep(config['PAUSA_ENTRE_PASSOS'])
+    return {'liberadas': max(0, inicio - livres), 'restantes': livres}
+
+
+def atualizar_estatisticas(cursor, prazo, config):
+    """
+    `ANALYZE` de cada tabela, lendo no máximo `LIMITE_ANALISE` linhas por índice.
+    """
+    cursor.execute(f"PRAGMA analysis_limit = {int(config['LIMITE_ANALISE'])}")
+    analisadas, pendentes = [], []
+    for tabela in _tabelas(cursor):
+        if prazo.esgotado:
+            pendentes.append(tabela)
+            continue
+        cursor.execute(f'ANALYZE "{tabela}"')
+        analisadas.append(tabela)
+        time.sleep(config['PAUSA_ENTRE_PASSOS'])
+    return {'analisadas': len(analisadas), 'pendentes': pendentes}
+
+
+def checkpoint_wal(cursor, prazo, config):
+    """
+    Copia o WAL para o banco; PASSIVE não espera leitores nem bloqueia escritas,
+    TRUNCATE também zera o arquivo WAL (espera o lock de escrita).
+    """
+    if _pragma(cursor, 'journal_mode') != 'wal':
+        return {'aviso': "O banco não está em modo WAL."}
+    modo = config['CHECKPOINT'].upper()
+    cursor.execute(f'PRAGMA wal_checkpoint({modo})')
+    ocupado, paginas_wal, copiadas = cursor.fetchone()
+    return {'modo': modo, 'concluido': not ocupado, 'paginas_wal': paginas_wal, 'copiadas': copiadas}
+
+
+EXECUTORES = {
+    'integridade': verificar_integridade,
+    'vacuum': vacuum_incremental,
+    'estatisticas': atualizar_estatisticas,
+    'checkpoint': checkpoint_wal,
+}
+
+
+def executar(etapas=ETAPAS, alias='default', config=None, ao_concluir_etapa=None):
+    """
+    Executa as etapas na ordem de `ETAPAS`; retorna {etapa: resultado}.
+
+    Cada resultado traz a duração em `segundos`; etapas que não couberam no
+    prazo têm `pulada` verdadeiro.
+    """
+    config = config or configuracao()
+    prazo = Prazo(config['TEMPO_MAXIMO'])
+    resultados = {}
+    with connections[alias].cursor() as cursor:
+        for etapa in ETAPAS:
+            if etapa not in etapas:
+                continue
+            if prazo.esgotado:
+                resultados[etapa] = {'pulada': True, 'segundos': 0.0}
+            else:
+                inicio = time.perf_counter()
+                resultados[etapa] = EXECUTORES[etapa](cursor, prazo, config)
+                resultados[etapa]['segundos'] = round(time.perf_counter() - inicio, 3)
+            if ao_concluir_etapa:
+                ao_concluir_etapa(etapa, resultados[etapa])
+    return resultados
+
+
+def ativar_vacuum_incremental(alias='default'):
+    """
+    Passa o banco para `auto_vacuum = INCREMENTAL`.
+
+    Exige um VACUUM completo, que reescreve o arquivo e bloqueia as escritas
+    enquanto dura: deve ser feito uma vez, em janela de manutenção.
+    """
+    with connections[alias].cursor() as cursor:
+        cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        cursor.execute('VACUUM')
+        return MODOS_AUTO_VACUUM.get(_pragma(cursor, 'auto_vacuum'), '?')
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-19 11:10
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def criar_versao_inicial(apps, schema_editor):
+    VersaoCatalogo = apps.get_model('produtos', 'VersaoCatalogo')
+    VersaoCatalogo.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produtos', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersaoCatalogo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('versao', models.PositiveBigIntegerField(default=0, verbose_name='Versão')),
+                ('atualizado_em', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Atualizado em')),
+            ],
+            options={
+                'verbose_name': 'Versão do Catálogo',
+                'verbose_name_plural': 'Versão do Catálogo',
+            },
+        ),
+        migrations.RunPython(criar_versao_inicial, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.7 on 2026-10-19 11:13
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def registrar_produtos_existentes(apps, schema_editor):
+    """
+    Cria o registro de criação dos produtos já cadastrados.
+
+    O estado anterior não é conhecido: o estado atual é registrado na data de criação.
+    """
+    Produto = apps.get_model('produtos', 'Produto')
+    HistoricoProduto = apps.get_model('produtos', 'HistoricoProduto')
+    registros = [
+        HistoricoProduto(
+            produto_id=produto.pk,
+            momento=produto.data_criacao,
+            operacao='criacao',
+            alteracoes={
+                'nome': produto.nome,
+                'tipo_espectro': produto.tipo_espectro,
+                'thc_percentual': str(produto.thc_percentual),
+                'cbd_percentual': str(produto.cbd_percentual),
+                'categoria_terapeutica': produto.categoria_terapeutica,
+                'status_anvisa': produto.status_anvisa,
+                'data_criacao': produto.data_criacao.isoformat(),
+            },
+        )
+        for produto in Produto.objects.iterator()
+    ]
+    HistoricoProduto.objects.bulk_create(registros, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produtos', '0002_versao_catalogo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistoricoProduto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('produto_id', models.BigIntegerField(verbose_name='Produto')),
+                ('momento', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Momento')),
+                ('operacao', models.CharField(choices=[('criacao', 'Criação'), ('alteracao', 'Alteração'), ('exclusao', 'Exclusão')], max_length=10, verbose_name='Operação')),
+                ('alteracoes', models.JSONField(blank=True, default=dict, verbose_name='Alterações')),
+            ],
+            options={
+                'verbose_name': 'Histórico de Produto',
+                'verbose_name_plural': 'Histórico de Produtos',
+                'ordering': ['produto_id', 'momento', 'id'],
+                'indexes': [models.Index(fields=['produto_id', 'momento'], name='historico_produto_momento')],
+            },
+        ),
+        migrations.RunPython(registrar_produtos_existentes, migrations.RunPython.noop),
+    ]
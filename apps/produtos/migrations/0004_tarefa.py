@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-19 11:15
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produtos', '0003_historico_produto'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tarefa',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('importacao', 'Importação de Produtos'), ('exportacao', 'Exportação do Catálogo'), ('auditoria', 'Auditoria do Catálogo')], max_length=20, verbose_name='Tipo')),
+                ('parametros', models.JSONField(blank=True, default=dict, verbose_name='Parâmetros')),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('executando', 'Executando'), ('concluida', 'Concluída'), ('falhou', 'Falhou')], default='pendente', max_length=12, verbose_name='Status')),
+                ('progresso', models.PositiveSmallIntegerField(default=0, verbose_name='Progresso (%)')),
+                ('mensagem', models.CharField(blank=True, max_length=255, verbose_name='Mensagem')),
+                ('tentativas', models.PositiveSmallIntegerField(default=0, verbose_name='Tentativas')),
+                ('max_tentativas', models.PositiveSmallIntegerField(default=3, verbose_name='Máximo de Tentativas')),
+                ('disponivel_em', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Disponível em')),
+                ('resultado', models.JSONField(blank=True, default=dict, verbose_name='Resultado')),
+                ('arquivo_resultado', models.CharField(blank=True, max_length=255, verbose_name='Arquivo de Resultado')),
+                ('erro', models.TextField(blank=True, verbose_name='Erro')),
+                ('data_criacao', models.DateTimeField(auto_now_add=True, verbose_name='Data de Criação')),
+                ('data_inicio', models.DateTimeField(blank=True, null=True, verbose_name='Data de Início')),
+                ('data_atualizacao', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Última Atualização')),
+                ('data_conclusao', models.DateTimeField(blank=True, null=True, verbose_name='Data de Conclusão')),
+            ],
+            options={
+                'verbose_name': 'Tarefa',
+                'verbose_name_plural': 'Tarefas',
+                'ordering': ['-data_criacao'],
+                'indexes': [models.Index(fields=['status', 'disponivel_em'], name='tarefa_fila')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-19 11:47
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produtos', '0004_tarefa'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProdutoArquivado',
+            fields=[
+                ('nome', models.CharField(max_length=200, verbose_name='Nome do Produto')),
+                ('tipo_espectro', models.CharField(choices=[('sativa', 'Sativa'), ('indica', 'Indica'), ('hibrida', 'Híbrida')], max_length=10, verbose_name='Tipo de Espectro')),
+                ('thc_percentual', models.DecimalField(decimal_places=2, max_digits=5, verbose_name='Percentual de THC (%)')),
+                ('cbd_percentual', models.DecimalField(decimal_places=2, max_digits=5, verbose_name='Percentual de CBD (%)')),
+                ('categoria_terapeutica', models.CharField(choices=[('neurologia', 'Neurologia'), ('pediatria', 'Pediatria'), ('oncologia', 'Oncologia'), ('dermatologia', 'Dermatologia'), ('outros', 'Outros')], max_length=20, verbose_name='Categoria Terapêutica')),
+                ('status_anvisa', models.CharField(choices=[('aprovado', 'Aprovado'), ('pendente', 'Pendente'), ('reprovado', 'Reprovado')], default='pendente', max_length=10, verbose_name='Status ANVISA')),
+                ('id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_criacao', models.DateTimeField(verbose_name='Data de Criação')),
+                ('data_atualizacao', models.DateTimeField(verbose_name='Data de Atualização')),
+                ('data_arquivamento', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Data de Arquivamento')),
+            ],
+            options={
+                'verbose_name': 'Produto Arquivado',
+                'verbose_name_plural': 'Produtos Arquivados',
+                'ordering': ['-data_criacao'],
+                'abstract': False,
+            },
+        ),
+        migrations.AlterField(
+            model_name='historicoproduto',
+            name='operacao',
+            field=models.CharField(choices=[('criacao', 'Criação'), ('alteracao', 'Alteração'), ('exclusao', 'Exclusão'), ('arquivamento', 'Arquivamento'), ('restauracao', 'Restauração')], max_length=12, verbose_name='Operação'),
+        ),
+    ]
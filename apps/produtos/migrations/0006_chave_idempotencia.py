@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-19 11:57
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produtos', '0005_produto_arquivado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChaveIdempotencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('escopo', models.CharField(max_length=100, verbose_name='Escopo')),
+                ('chave', models.CharField(max_length=255, verbose_name='Chave')),
+                ('impressao', models.CharField(max_length=64, verbose_name='Impressão da Requisição')),
+                ('status_resposta', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Status da Resposta')),
+                ('cabecalhos_resposta', models.JSONField(blank=True, default=list, verbose_name='Cabeçalhos da Resposta')),
+                ('conteudo_resposta', models.BinaryField(blank=True, default=b'', verbose_name='Conteúdo da Resposta')),
+                ('data_criacao', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Data de Criação')),
+                ('expira_em', models.DateTimeField(db_index=True, verbose_name='Expira em')),
+            ],
+            options={
+                'verbose_name': 'Chave de Idempotência',
+                'verbose_name_plural': 'Chaves de Idempotência',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='chaveidempotencia',
+            constraint=models.UniqueConstraint(fields=('escopo', 'chave'), name='chave_idempotencia_unica'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:02
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import BooleanField, Case, Count, Value, When
+
+
+def preencher_contagens(apps, schema_editor):
+    Produto = apps.get_model('produtos', 'Produto')
+    ContagemProduto = apps.get_model('produtos', 'ContagemProduto')
+    linhas = Produto.objects.order_by().annotate(acima_limite_thc=Case(
+        When(thc_percentual__gt=Decimal('0.3'), then=Value(True)),
+        default=Value(False),
+        output_field=BooleanField(),
+    )).values(
+        'categoria_terapeutica', 'status_anvisa', 'tipo_espectro', 'acima_limite_thc'
+    ).annotate(quantidade=Count('pk'))
+    ContagemProduto.objects.bulk_create([ContagemProduto(**linha) for linha in linhas])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produtos', '0006_chave_idempotencia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContagemProduto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('categoria_terapeutica', models.CharField(choices=[('neurologia', 'Neurologia'), ('pediatria', 'Pediatria'), ('oncologia', 'Oncologia'), ('dermatologia', 'Dermatologia'), ('outros', 'Outros')], max_length=20, verbose_name='Categoria Terapêutica')),
+                ('status_anvisa', models.CharField(choices=[('aprovado', 'Aprovado'), ('pendente', 'Pendente'), ('reprovado', 'Reprovado')], max_length=10, verbose_name='Status ANVISA')),
+                ('tipo_espectro', models.CharField(choices=[('sativa', 'Sativa'), ('indica', 'Indica'), ('hibrida', 'Híbrida')], max_length=10, verbose_name='Tipo de Espectro')),
+                ('acima_limite_thc', models.BooleanField(verbose_name='THC acima de 0.3%')),
+                ('quantidade', models.BigIntegerField(default=0, verbose_name='Quantidade')),
+            ],
+            options={
+                'verbose_name': 'Contagem de Produtos',
+                'verbose_name_plural': 'Contagens de Produtos',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='contagemproduto',
+            constraint=models.UniqueConstraint(fields=('categoria_terapeutica', 'status_anvisa', 'tipo_espectro', 'acima_limite_thc'), name='contagem_produto_combinacao'),
+        ),
+        migrations.RunPython(preencher_contagens, migrations.RunPython.noop),
+    ]
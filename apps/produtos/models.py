@@ -1,10 +1,11 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 
 # Create your models here.
 
-class Produto(models.Model):
+class ProdutoBase(models.Model):
     """
-    Modelo para representar produtos com informações sobre THC, CBD e status ANVISA.
+    Campos e regras comuns aos produtos do catálogo ativo e do arquivo.
     """
     
     # Choices para tipo_espectro
@@ -62,8 +63,7 @@ class Produto(models.Model):
     data_atualizacao = models.DateTimeField(auto_now=True, verbose_name="Data de Atualização")
     
     class Meta:
-        verbose_name = "Produto"
-        verbose_name_plural = "Produtos"
+        abstract = True
         ordering = ['-data_criacao']
     
     def __str__(self):
@@ -87,3 +87,215 @@ class Produto(models.Model):
         if self.tem_risco:
             return f"Produto com THC {self.thc_percentual}% para {self.get_categoria_terapeutica_display()} - requer atenção especial"
         return None
+
+
+class Produto(ProdutoBase):
+    """
+    Modelo para representar produtos com informações sobre THC, CBD e status ANVISA.
+    """
+    
+    class Meta(ProdutoBase.Meta):
+        verbose_name = "Produto"
+        verbose_name_plural = "Produtos"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Guarda os valores lidos do banco para o histórico registrar só o que mudou.
+        """
+        instance = super().from_db(db, field_names, values)
+        instance._valores_originais = (field_names, values)
+        return instance
+    
+    def save(self, *args, **kwargs):
+        """
+        Salva o produto; o histórico é gravado pelo post_save na mesma transação.
+        """
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class ProdutoArquivado(ProdutoBase):
+    """
+    Produto movido para o arquivo pelo `manage.py arquivar_produtos`.
+
+    Guarda o mesmo id e as mesmas datas do produto original, para que possa
+    ser consultado (`?incluir_arquivados=`) e restaurado sem perder a identidade.
+    """
+    id = models.BigIntegerField(primary_key=True, verbose_name="ID")
+    data_criacao = models.DateTimeField(verbose_name="Data de Criação")
+    data_atualizacao = models.DateTimeField(verbose_name="Data de Atualização")
+    data_arquivamento = models.DateTimeField(default=timezone.now, verbose_name="Data de Arquivamento")
+    
+    class Meta(ProdutoBase.Meta):
+        verbose_name = "Produto Arquivado"
+        verbose_name_plural = "Produtos Arquivados"
+
+
+class VersaoCatalogo(models.Model):
+    """
+    Linha única com a versão do catálogo de produtos.
+
+    É incrementada a cada criação, alteração ou exclusão de produto e serve
+    de validador barato (uma consulta por chave primária) para caches e
+    requisições condicionais.
+    """
+    versao = models.PositiveBigIntegerField(default=0, verbose_name="Versão")
+    atualizado_em = models.DateTimeField(default=timezone.now, verbose_name="Atualizado em")
+    
+    class Meta:
+        verbose_name = "Versão do Catálogo"
+        verbose_name_plural = "Versão do Catálogo"
+    
+    def __str__(self):
+        return f"Catálogo v{self.versao}"
+
+
+class HistoricoProduto(models.Model):
+    """
+    Histórico append-only das alterações de produtos.
+
+    Cada linha guarda apenas os campos alterados (a criação guarda todos).
+    Não há chave estrangeira para que o histórico sobreviva à exclusão.
+    """
+    
+    OPERACAO_CHOICES = [
+        ('criacao', 'Criação'),
+        ('alteracao', 'Alteração'),
+        ('exclusao', 'Exclusão'),
+        ('arquivamento', 'Arquivamento'),
+        ('restauracao', 'Restauração'),
+    ]
+    
+    produto_id = models.BigIntegerField(verbose_name="Produto")
+    momento = models.DateTimeField(default=timezone.now, verbose_name="Momento")
+    operacao = models.CharField(max_length=12, choices=OPERACAO_CHOICES, verbose_name="Operação")
+    alteracoes = models.JSONField(default=dict, blank=True, verbose_name="Alterações")
+    
+    class Meta:
+        verbose_name = "Histórico de Produto"
+        verbose_name_plural = "Histórico de Produtos"
+        ordering = ['produto_id', 'momento', 'id']
+        indexes = [
+            models.Index(fields=['produto_id', 'momento'], name='historico_produto_momento'),
+        ]
+    
+    def __str__(self):
+        return f"Produto {self.produto_id} - {self.get_operacao_display()} em {self.momento:%d/%m/%Y %H:%M}"
+
+
+class Tarefa(models.Model):
+    """
+    Tarefa de longa duração executada fora das requisições pelo `run_workers`.
+    """
+    
+    TIPO_CHOICES = [
+        ('importacao', 'Importação de Produtos'),
+        ('exportacao', 'Exportação do Catálogo'),
+        ('auditoria', 'Auditoria do Catálogo'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('executando', 'Executando'),
+        ('concluida', 'Concluída'),
+        ('falhou', 'Falhou'),
+    ]
+    
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES, verbose_name="Tipo")
+    parametros = models.JSONField(default=dict, blank=True, verbose_name="Parâmetros")
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default='pendente', verbose_name="Status")
+    progresso = models.PositiveSmallIntegerField(default=0, verbose_name="Progresso (%)")
+    mensagem = models.CharField(max_length=255, blank=True, verbose_name="Mensagem")
+    tentativas = models.PositiveSmallIntegerField(default=0, verbose_name="Tentativas")
+    max_tentativas = models.PositiveSmallIntegerField(default=3, verbose_name="Máximo de Tentativas")
+    disponivel_em = models.DateTimeField(default=timezone.now, verbose_name="Disponível em")
+    resultado = models.JSONField(default=dict, blank=True, verbose_name="Resultado")
+    arquivo_resultado = models.CharField(max_length=255, blank=True, verbose_name="Arquivo de Resultado")
+    erro = models.TextField(blank=True, verbose_name="Erro")
+    data_criacao = models.DateTimeField(auto_now_add=True, verbose_name="Data de Criação")
+    data_inicio = models.DateTimeField(null=True, blank=True, verbose_name="Data de Início")
+    data_atualizacao = models.DateTimeField(default=timezone.now, verbose_name="Última Atualização")
+    data_conclusao = models.DateTimeField(null=True, blank=True, verbose_name="Data de Conclusão")
+    
+    class Meta:
+        verbose_name = "Tarefa"
+        verbose_name_plural = "Tarefas"
+        ordering = ['-data_criacao']
+        indexes = [
+            models.Index(fields=['status', 'disponivel_em'], name='tarefa_fila'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_tipo_display()} #{self.pk} - {self.get_status_display()}"
+
+
+class ChaveIdempotencia(models.Model):
+    """
+    Resposta guardada de uma requisição com cabeçalho `Idempotency-Key`.
+
+    Enquanto a primeira requisição executa, `status_resposta` fica nulo;
+    repetições com a mesma chave aguardam e recebem a resposta guardada.
+    """
+    
+    escopo = models.CharField(max_length=100, verbose_name="Escopo")
+    chave = models.CharField(max_length=255, verbose_name="Chave")
+    impressao = models.CharField(max_length=64, verbose_name="Impressão da Requisição")
+    status_resposta = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name="Status da Resposta")
+    cabecalhos_resposta = models.JSONField(default=list, blank=True, verbose_name="Cabeçalhos da Resposta")
+    conteudo_resposta = models.BinaryField(default=b'', blank=True, verbose_name="Conteúdo da Resposta")
+    data_criacao = models.DateTimeField(default=timezone.now, verbose_name="Data de Criação")
+    expira_em = models.DateTimeField(db_index=True, verbose_name="Expira em")
+    
+    class Meta:
+        verbose_name = "Chave de Idempotência"
+        verbose_name_plural = "Chaves de Idempotência"
+        constraints = [
+            models.UniqueConstraint(fields=['escopo', 'chave'], name='chave_idempotencia_unica'),
+        ]
+    
+    def __str__(self):
+        return f"{self.escopo} {self.chave}"
+
+
+class ContagemProduto(models.Model):
+    """
+    Quantidade de produtos ativos por combinação de categoria, status,
+    espectro e THC acima do limite de 0.3%.
+
+    Mantida pelas próprias escritas em `Produto` (veja `contagens.py`), para
+    que os totais das listagens não precisem de `COUNT(*)` na tabela inteira.
+    """
+    categoria_terapeutica = models.CharField(
+        max_length=20,
+        choices=ProdutoBase.CATEGORIA_TERAPEUTICA_CHOICES,
+        verbose_name="Categoria Terapêutica"
+    )
+    status_anvisa = models.CharField(
+        max_length=10,
+        choices=ProdutoBase.STATUS_ANVISA_CHOICES,
+        verbose_name="Status ANVISA"
+    )
+    tipo_espectro = models.CharField(
+        max_length=10,
+        choices=ProdutoBase.TIPO_ESPECTRO_CHOICES,
+        verbose_name="Tipo de Espectro"
+    )
+    acima_limite_thc = models.BooleanField(verbose_name="THC acima de 0.3%")
+    quantidade = models.BigIntegerField(default=0, verbose_name="Quantidade")
+    
+    class Meta:
+        verbose_name = "Contagem de Produtos"
+        verbose_name_plural = "Contagens de Produtos"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['categoria_terapeutica', 'status_anvisa', 'tipo_espectro', 'acima_limite_thc'],
+                name='contagem_produto_combinacao',
+            ),
+        ]
+    
+    def __str__(self):
+        return (
+            f"{self.categoria_terapeutica}/{self.status_anvisa}/{self.tipo_espectro}"
+            f"{' THC>0.3%' if self.acima_limite_thc else ''}: {self.quantidade}"
+        )
@@ -0,0 +1,236 @@
+"""
+Perfilamento sob demanda de requisições em produção.
+
+Com `PERFILAMENTO['ATIVO']`, o `PerfilamentoMiddleware` perfila a requisição
+quando ela traz um token assinado no cabeçalho `X-Perfilar` (gerado por
+`manage.py token_perfilamento`) ou quando é sorteada pela taxa de amostragem.
+Cada captura grava dois arquivos no diretório de perfis:
+
+- `<nome>.prof`: estatísticas do cProfile (abrir com `pstats` ou snakeviz);
+- `<nome>.json`: dados da requisição e consultas SQL com tempo e origem.
+
+O diretório é rotativo: além de `MAXIMO_ARQUIVOS` capturas, as mais antigas
+são apagadas.
+"""
+import cProfile
+import json
+import random
+import re
+import time
+import traceback
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+from django.utils.text import slugify
+
+SAL_TOKEN = 'apps.produtos.perfilamento'
+
+# Nome válido de uma captura (evita acesso a arquivos fora do diretório)
+PADRAO_NOME_CAPTURA = re.compile(r'^[0-9T_a-z-]+$')
+
+# Frames da pilha guardados como origem de cada consulta SQL
+PROFUNDIDADE_ORIGEM = 3
+
+
+def configuracao():
+    """
+    Configuração de perfilamento, com valores padrão para chaves ausentes.
+    """
+    return {
+        'ATIVO': False,
+        'TAXA_AMOSTRAGEM': 0.0,
+        'DIRETORIO': Path(settings.BASE_DIR) / 'perfis',
+        'MAXIMO_ARQUIVOS': 50,
+        'VALIDADE_TOKEN': 60 * 60,
+        **getattr(settings, 'PERFILAMENTO', {}),
+    }
+
+
+def diretorio_perfis():
+    """
+    Diretório onde as capturas são gravadas.
+    """
+    diretorio = Path(configuracao()['DIRETORIO'])
+    diretorio.mkdir(parents=True, exist_ok=True)
+    return diretorio
+
+
+def gerar_token():
+    """
+    Gera um token assinado para o cabeçalho `X-Perfilar`.
+    """
+    return signing.TimestampSigner(salt=SAL_TOKEN).sign('perfilar')
+
+
+def token_valido(token):
+    """
+    Verifica a assinatura e a validade de um token de perfilamento.
+    """
+    try:
+        signing.TimestampSigner(salt=SAL_TOKEN).unsign(token, max_age=configuracao()['VALIDADE_TOKEN'])
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def _origem():
+    """
+    Últimos frames do código do projeto que originaram uma consulta.
+    """
+    base = str(settings.BASE_DIR)
+    frames = [
+        frame for frame in traceback.extract_stack()[:-2]
+        if frame.filename.startswith(base)
+        and 'site-packages' not in frame.filename
+        and not frame.filename.endswith('perfilamento.py')
+    ]
+    return [
+        f"{Path(frame.filename).relative_to(base)}:{frame.lineno} em {frame.name}"
+        for frame in frames[-PROFUNDIDADE_ORIGEM:]
+    ]
+
+
+class CapturaConsultas:
+    """
+    Wrapper de execução que registra cada consulta SQL com duração e origem.
+    """
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.consultas = []
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.consultas.append({
+                'banco': self.alias,
+                'sql': sql,
+                'duracao_ms': round((time.perf_counter() - inicio) * 1000, 3),
+                'origem': _origem(),
+            })
+
+
+def listar_capturas():
+    """
+    Capturas gravadas, da mais recente para a mais antiga.
+    """
+    capturas = []
+    for arquivo in sorted(diretorio_perfis().glob('*.json'), reverse=True):
+        try:
+            with open(arquivo, encoding='utf-8') as entrada:
+                dados = json.load(entrada)
+        except (OSError, ValueError):
+            continue
+        dados['nome'] = arquivo.stem
+        capturas.append(dados)
+    return capturas
+
+
+def caminho_captura(nome, extensao):
+    """
+    Caminho de um arquivo de captura, ou None se o nome for inválido ou não existir.
+    """
+    if not PADRAO_NOME_CAPTURA.match(nome) or extensao not in ('prof', 'json'):
+        return None
+    caminho = diretorio_perfis() / f'{nome}.{extensao}'
+    return caminho if caminho.is_file() else None
+
+
+def _rotacionar(diretorio, maximo):
+    """
+    Apaga as capturas mais antigas além do limite.
+    """
+    for antigo in sorted(diretorio.glob('*.json'), reverse=True)[maximo:]:
+        antigo.unlink(missing_ok=True)
+        antigo.with_suffix('.prof').unlink(missing_ok=True)
+
+
+class PerfilamentoMiddleware:
+    """
+    Middleware de perfilamento por requisição (cProfile + consultas SQL).
+
+    Fica desligado (`MiddlewareNotUsed`) a menos que `PERFILAMENTO['ATIVO']`.
+    """
+    CABECALHO = 'HTTP_X_PERFILAR'
+
+    def __init__(self, get_response):
+        self.config = configuracao()
+        if not self.config['ATIVO']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def _deve_perfilar(self, request):
+        token = request.META.get(self.CABECALHO)
+        if token:
+            return token_valido(token)
+        taxa = self.config['TAXA_AMOSTRAGEM']
+        return taxa > 0 and random.random() < taxa
+
+    def __call__(self, request):
+        if not self._deve_perfilar(request):
+            return self.get_response(request)
+
+        perfil = cProfile.Profile()
+        capturas = [CapturaConsultas(conexao.alias) for conexao in connections.all()]
+        wrappers = [
+            conexao.execute_wrapper(captura)
+            for conexao, captura in zip(connections.all(), capturas)
+        ]
+        for wrapper in wrappers:
+            wrapper.__enter__()
+
+        inicio = time.perf_counter()
+        try:
+            perfil.enable()
+        except ValueError:
+            # Outro profiler já ativo neste processo
+            perfil = None
+        try:
+            response = self.get_response(request)
+        finally:
+            if perfil is not None:
+                perfil.disable()
+            duracao = time.perf_counter() - inicio
+            for wrapper in reversed(wrappers):
+                wrapper.__exit__(None, None, None)
+
+        consultas = [consulta for captura in capturas for consulta in captura.consultas]
+        nome = self._gravar(request, response, perfil, duracao, consultas)
+        response['X-Perfil'] = nome
+        return response
+
+    def _gravar(self, request, response, perfil, duracao, consultas):
+        """
+        Grava a captura e aplica a rotação do diretório.
+        """
+        agora = timezone.now()
+        nome = '_'.join([
+            agora.strftime('%Y%m%dT%H%M%S%f'),
+            request.method.lower(),
+            slugify(request.path.strip('/').replace('/', '-'))[:60] or 'raiz',
+        ])
+        diretorio = diretorio_perfis()
+
+        if perfil is not None:
+            perfil.dump_stats(diretorio / f'{nome}.prof')
+        with open(diretorio / f'{nome}.json', 'w', encoding='utf-8') as saida:
+            json.dump({
+                'momento': agora.isoformat(),
+                'metodo': request.method,
+                'caminho': request.get_full_path(),
+                'status': response.status_code,
+                'duracao_ms': round(duracao * 1000, 3),
+                'total_consultas': len(consultas),
+                'tempo_consultas_ms': round(sum(consulta['duracao_ms'] for consulta in consultas), 3),
+                'tem_cprofile': perfil is not None,
+                'consultas': consultas,
+            }, saida, ensure_ascii=False, indent=2)
+
+        _rotacionar(diretorio, self.config['MAXIMO_ARQUIVOS'])
+        return nome
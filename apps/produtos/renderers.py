@@ -0,0 +1,165 @@
+"""
+Renderers adicionais para a API de produtos.
+
+O formato binário escolhido é o CBOR (RFC 8949): usa a biblioteca `cbor2`
+quando disponível e cai para um codificador puro Python caso contrário.
+Valores decimais são codificados como frações decimais (tag 4), que
+representam THC/CBD de forma exata e em poucos bytes.
+"""
+import struct
+from datetime import date, datetime
+from decimal import Decimal
+
+from rest_framework.renderers import BaseRenderer
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+
+def _cabecalho(tipo_maior, valor, saida):
+    """
+    Escreve o byte inicial de um item CBOR com o argumento `valor`.
+    """
+    tipo_maior <<= 5
+    if valor < 24:
+        saida.append(tipo_maior | valor)
+    elif valor < 0x100:
+        saida.append(tipo_maior | 24)
+        saida.append(valor)
+    elif valor < 0x10000:
+        saida.append(tipo_maior | 25)
+        saida += struct.pack('>H', valor)
+    elif valor < 0x100000000:
+        saida.append(tipo_maior | 26)
+        saida += struct.pack('>I', valor)
+    else:
+        saida.append(tipo_maior | 27)
+        saida += struct.pack('>Q', valor)
+
+
+def _codificar_inteiro(valor, saida):
+    """
+    Codifica inteiros, usando bignums (tags 2/3) além de 64 bits.
+    """
+    if valor >= 0:
+        tipo_maior, argumento, tag = 0, valor, 2
+    else:
+        tipo_maior, argumento, tag = 1, -1 - valor, 3
+
+    if argumento < 0x10000000000000000:
+        _cabecalho(tipo_maior, argumento, saida)
+    else:
+        conteudo = argumento.to_bytes((argumento.bit_length() + 7) // 8, 'big')
+        _cabecalho(6, tag, saida)
+        _cabecalho(2, len(conteudo), saida)
+        saida += conteudo
+
+
+def _codificar_float(valor, saida):
+    """
+    Codifica floats em precisão simples quando não há perda, senão em dupla.
+    """
+    try:
+        simples = struct.pack('>f', valor)
+    except OverflowError:
+        # Fora do intervalo da precisão simples
+        simples = None
+    if simples is not None and struct.unpack('>f', simples)[0] == valor:
+        saida.append(0xfa)
+        saida += simples
+    else:
+        saida.append(0xfb)
+        saida += struct.pack('>d', valor)
+
+
+def _codificar_decimal(valor, saida):
+    """
+    Codifica um Decimal como fração decimal: tag 4 + [expoente, mantissa].
+    """
+    if not valor.is_finite():
+        _codificar_float(float(valor), saida)
+        return
+
+    sinal, digitos, expoente = valor.as_tuple()
+    mantissa = int(''.join(map(str, digitos)) or '0')
+    if sinal:
+        mantissa = -mantissa
+
+    saida.append(0xc4)  # tag 4
+    saida.append(0x82)  # array de 2 itens
+    _codificar_inteiro(expoente, saida)
+    _codificar_inteiro(mantissa, saida)
+
+
+def _codificar(valor, saida):
+    """
+    Codifica recursivamente `valor` em CBOR, acumulando em `saida`.
+    """
+    if valor is None:
+        saida.append(0xf6)
+    elif valor is True:
+        saida.append(0xf5)
+    elif valor is False:
+        saida.append(0xf4)
+    elif isinstance(valor, str):
+        conteudo = valor.encode('utf-8')
+        _cabecalho(3, len(conteudo), saida)
+        saida += conteudo
+    elif isinstance(valor, int):
+        _codificar_inteiro(valor, saida)
+    elif isinstance(valor, Decimal):
+        _codificar_decimal(valor, saida)
+    elif isinstance(valor, float):
+        _codificar_float(valor, saida)
+    elif isinstance(valor, dict):
+        _cabecalho(5, len(valor), saida)
+        for chave, item in valor.items():
+            _codificar(chave, saida)
+            _codificar(item, saida)
+    elif isinstance(valor, (list, tuple)):
+        _cabecalho(4, len(valor), saida)
+        for item in valor:
+            _codificar(item, saida)
+    elif isinstance(valor, (bytes, bytearray)):
+        _cabecalho(2, len(valor), saida)
+        saida += valor
+    elif isinstance(valor, datetime):
+        saida.append(0xc0)  # tag 0: data/hora em texto
+        _codificar(valor.isoformat(), saida)
+    elif isinstance(valor, date):
+        _codificar(valor.isoformat(), saida)
+    else:
+        raise TypeError(f"Tipo não suportado pelo codificador CBOR: {type(valor).__name__}")
+
+
+def codificar_cbor(dados):
+    """
+    Serializa `dados` em CBOR, preferindo a biblioteca `cbor2` se instalada.
+    """
+    if cbor2 is not None:
+        return cbor2.dumps(dados, datetime_as_timestamp=False)
+
+    saida = bytearray()
+    _codificar(dados, saida)
+    return bytes(saida)
+
+
+class CBORRenderer(BaseRenderer):
+    """
+    Renderer CBOR para consumidores serviço-a-serviço.
+
+    Sinaliza às views que os campos decimais devem chegar como `Decimal`
+    (e não como texto), para serem codificados como frações decimais.
+    """
+    media_type = 'application/cbor'
+    format = 'cbor'
+    charset = None
+    render_style = 'binary'
+    decimal_nativo = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return codificar_cbor(data)
@@ -1,5 +1,6 @@
+from django.urls import reverse
 from rest_framework import serializers
-from .models import Produto
+from .models import Produto, ProdutoArquivado, Tarefa
 
 class ProdutoSerializer(serializers.ModelSerializer):
     """
@@ -17,6 +18,16 @@ class ProdutoSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'data_criacao', 'data_atualizacao', 'tem_risco', 'explicacao_risco']
     
+    def get_fields(self):
+        """
+        Mantém THC/CBD como Decimal quando o renderer codifica decimais nativamente.
+        """
+        fields = super().get_fields()
+        if self.context.get('decimal_nativo'):
+            for campo in ('thc_percentual', 'cbd_percentual'):
+                fields[campo].coerce_to_string = False
+        return fields
+    
     def validate(self, data):
         """
         Validação customizada: se THC > 0.3%, status ANVISA não pode ser 'aprovado'.
@@ -40,4 +51,118 @@ class ProdutoSerializer(serializers.ModelSerializer):
         data['tipo_espectro_label'] = instance.get_tipo_espectro_display()
         data['status_anvisa_label'] = instance.get_status_anvisa_display()
         data['categoria_terapeutica_label'] = instance.get_categoria_terapeutica_display()
-        return data 
\ No newline at end of file
+        data['arquivado'] = isinstance(instance, ProdutoArquivado)
+        return data 
+
+class FiltroProdutosSerializer(serializers.Serializer):
+    """
+    Critérios de seleção de produtos para operações em lote.
+    """
+    tipo_espectro = serializers.ChoiceField(choices=Produto.TIPO_ESPECTRO_CHOICES, required=False)
+    categoria_terapeutica = serializers.ChoiceField(choices=Produto.CATEGORIA_TERAPEUTICA_CHOICES, required=False)
+    status_anvisa = serializers.ChoiceField(choices=Produto.STATUS_ANVISA_CHOICES, required=False)
+    
+    def validate(self, data):
+        """
+        Exige ao menos um critério, para não alterar o catálogo inteiro por engano.
+        """
+        if not data:
+            raise serializers.ValidationError("Informe ao menos um critério de filtro.")
+        return data
+
+
+class ParametrosAnaliseSerializer(serializers.Serializer):
+    """
+    Parâmetros de consulta da análise de distribuição de THC/CBD.
+    """
+    intervalos = serializers.IntegerField(min_value=1, max_value=100, default=10)
+    status_anvisa = serializers.ChoiceField(choices=Produto.STATUS_ANVISA_CHOICES, required=False)
+
+
+class ParametrosSimilaresSerializer(serializers.Serializer):
+    """
+    Parâmetros de consulta da busca de produtos similares.
+    """
+    k = serializers.IntegerField(min_value=1, max_value=100, default=10)
+
+
+class TransicaoStatusSerializer(serializers.Serializer):
+    """
+    Entrada da transição de status ANVISA em lote.
+    """
+    MODO_CHOICES = [
+        ('parcial', 'Parcial'),
+        ('atomico', 'Atômico'),
+    ]
+    
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        allow_empty=False,
+        max_length=100000,
+    )
+    filtro = FiltroProdutosSerializer(required=False)
+    status_anvisa = serializers.ChoiceField(choices=Produto.STATUS_ANVISA_CHOICES)
+    modo = serializers.ChoiceField(choices=MODO_CHOICES, default='parcial')
+    
+    def validate(self, data):
+        """
+        Exige a seleção dos produtos por lista de ids e/ou por filtro.
+        """
+        if 'ids' not in data and 'filtro' not in data:
+            raise serializers.ValidationError("Informe 'ids' e/ou 'filtro' para selecionar os produtos.")
+        return data
+
+
+class TarefaSerializer(serializers.ModelSerializer):
+    """
+    Serializer para consulta de tarefas e do seu progresso.
+    """
+    url_resultado = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Tarefa
+        fields = [
+            'id', 'tipo', 'parametros', 'status', 'progresso', 'mensagem',
+            'tentativas', 'max_tentativas', 'resultado', 'url_resultado', 'erro',
+            'data_criacao', 'data_inicio', 'data_atualizacao', 'data_conclusao'
+        ]
+        read_only_fields = fields
+    
+    def get_url_resultado(self, obj):
+        """
+        URL de download do arquivo de resultado, se houver.
+        """
+        if not obj.arquivo_resultado:
+            return None
+        url = reverse('produtos:tarefa_resultado_api', args=[obj.pk])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+
+class NovaTarefaSerializer(serializers.Serializer):
+    """
+    Entrada para enfileirar uma tarefa.
+    Importações exigem o envio do arquivo (JSON ou CSV) no campo `arquivo`.
+    """
+    FORMATO_CHOICES = [
+        ('csv', 'CSV'),
+        ('json', 'JSON'),
+    ]
+    
+    tipo = serializers.ChoiceField(choices=Tarefa.TIPO_CHOICES)
+    arquivo = serializers.FileField(required=False)
+    formato = serializers.ChoiceField(choices=FORMATO_CHOICES, default='csv')
+    max_tentativas = serializers.IntegerField(min_value=1, max_value=10, default=3)
+    
+    def validate(self, data):
+        """
+        Valida o arquivo de entrada das importações.
+        """
+        if data['tipo'] == 'importacao':
+            arquivo = data.get('arquivo')
+            if arquivo is None:
+                raise serializers.ValidationError({'arquivo': "Envie o arquivo com os produtos a importar."})
+            if not arquivo.name.lower().endswith(('.json', '.csv')):
+                raise serializers.ValidationError({'arquivo': "O arquivo deve ser JSON ou CSV."})
+        return data
@@ -0,0 +1,72 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import contagens
+from .catalogo import incrementar_versao
+from .historico import registrar_exclusao, registrar_salvamento, registro_automatico_suspenso
+from .models import Produto
+
+
+@receiver(pre_save, sender=Produto)
+def produto_a_salvar(sender, instance, **kwargs):
+    """
+    Lê os valores gravados de um produto existente cuja instância não foi
+    lida do banco (ou tem campos adiados), para o post_save ajustar só a
+    combinação anterior e a atual. Roda na transação aberta por `Produto.save`.
+    """
+    if registro_automatico_suspenso() or instance.pk is None:
+        return
+    if contagens.combinacao_original(instance) is None:
+        instance._valores_no_banco = contagens.valores_no_banco(instance.pk)
+
+
+@receiver(post_save, sender=Produto)
+def produto_salvo(sender, instance, created, **kwargs):
+    """
+    Registra o histórico, ajusta as contagens e invalida a versão do catálogo
+    ao criar ou alterar um produto.
+    """
+    if registro_automatico_suspenso():
+        return
+    no_banco = instance.__dict__.pop('_valores_no_banco', None) or {}
+    # Lida antes do histórico, que substitui os valores originais pelos atuais
+    anterior = None if created else contagens.combinacao_original(instance)
+    if anterior is None and no_banco and not created:
+        anterior = contagens.combinacao(no_banco)
+    registrar_salvamento(instance, created)
+    # Campos adiados não foram gravados: valem os lidos no pre_save
+    atual = contagens.combinacao({**no_banco, **instance.__dict__})
+    if anterior is None:
+        contagens.ajustar({atual: 1})
+    elif anterior != atual:
+        contagens.ajustar({anterior: -1, atual: 1})
+    incrementar_versao()
+
+
+@receiver(post_delete, sender=Produto)
+def produto_excluido(sender, instance, **kwargs):
+    """
+    Registra o histórico, ajusta as contagens e invalida a versão do catálogo
+    ao excluir um produto.
+    """
+    if registro_automatico_suspenso():
+        return
+    registrar_exclusao(instance)
+    contagens.ajustar({contagens.combinacao(instance): -1})
+    incrementar_versao()
+
+
+@receiver(connection_created)
+def configurar_sqlite(sender, connection, **kwargs):
+    """
+    Ativa o modo WAL no SQLite: leituras não bloqueiam a escrita, o que permite
+    aos processos do `run_workers` gravar enquanto a API atende requisições.
+
+    Bancos novos já nascem com `auto_vacuum = INCREMENTAL`, usado pelo
+    `manage.py manutencao_db` (em bancos existentes o PRAGMA não tem efeito).
+    """
+    if connection.vendor == 'sqlite' and not connection.is_in_memory_db():
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            cursor.execute('PRAGMA journal_mode=WAL')
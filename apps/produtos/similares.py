@@ -0,0 +1,165 @@
+"""
+Busca de produtos similares pelo perfil de canabinoides (THC x CBD).
+
+O `IndiceSimilares` mantém em memória uma grade espacial por categoria
+terapêutica: o plano THC x CBD é dividido em células de `TAMANHO_CELULA`
+pontos percentuais e cada célula guarda os produtos que caem nela. Os k
+vizinhos mais próximos são encontrados percorrendo anéis de células ao
+redor do produto consultado, parando assim que nenhuma célula ainda não
+visitada pode conter algo mais próximo que o k-ésimo encontrado.
+
+O índice é sincronizado de forma incremental (veja `IndiceIncremental`) e
+carregado só no aquecimento do worker; enquanto não estiver carregado, as
+consultas usam `vizinhos_no_banco`.
+"""
+import heapq
+import math
+
+from django.db.models import F
+
+from .indices import IndiceIncremental
+from .models import Produto
+
+# Lado de cada célula da grade, em pontos percentuais de THC/CBD
+TAMANHO_CELULA = 0.25
+
+
+def _celula(thc, cbd):
+    return (int(thc // TAMANHO_CELULA), int(cbd // TAMANHO_CELULA))
+
+
+class IndiceSimilares(IndiceIncremental):
+    """
+    Grade espacial THC x CBD particionada por categoria terapêutica.
+    """
+    campos = ('categoria_terapeutica', 'thc_percentual', 'cbd_percentual')
+
+    def __len__(self):
+        return len(self.posicoes)
+
+    def limpar(self):
+        self.posicoes = {}
+        self.grades = {}
+        self.limites = {}
+
+    def inserir(self, produto_id, categoria, thc, cbd):
+        """
+        Insere ou reposiciona um produto.
+        """
+        if produto_id in self.posicoes:
+            self.remover(produto_id)
+        thc, cbd = float(thc), float(cbd)
+        self.posicoes[produto_id] = (categoria, thc, cbd)
+        i, j = _celula(thc, cbd)
+        self.grades.setdefault(categoria, {}).setdefault((i, j), set()).add(produto_id)
+
+        # Retângulo de células ocupadas (só cresce; remoções não o reduzem)
+        imin, imax, jmin, jmax = self.limites.get(categoria, (i, i, j, j))
+        self.limites[categoria] = (min(imin, i), max(imax, i), min(jmin, j), max(jmax, j))
+
+    def remover(self, produto_id):
+        """
+        Remove um produto, se estiver no índice.
+        """
+        posicao = self.posicoes.pop(produto_id, None)
+        if posicao is None:
+            return
+        categoria, thc, cbd = posicao
+        grade = self.grades[categoria]
+        celula = _celula(thc, cbd)
+        grade[celula].discard(produto_id)
+        if not grade[celula]:
+            del grade[celula]
+
+    def vizinhos(self, produto_id, k):
+        """
+        Os k produtos mais próximos (distância euclidiana THC/CBD) na mesma categoria.
+
+        Retorna uma lista de (distância, produto_id) em ordem crescente, ou None
+        se o produto não estiver no índice.
+        """
+        with self.trava:
+            posicao = self.posicoes.get(produto_id)
+            if posicao is None:
+                return None
+            categoria, thc, cbd = posicao
+            grade = self.grades[categoria]
+            ci, cj = _celula(thc, cbd)
+            imin, imax, jmin, jmax = self.limites[categoria]
+            ultimo_anel = max(ci - imin, imax - ci, cj - jmin, jmax - cj)
+
+            # Heap de máximo (distâncias negativas) com os k melhores até agora
+            melhores = []
+
+            def considerar(ids):
+                for vizinho in ids:
+                    if vizinho == produto_id:
+                        continue
+                    _, vthc, vcbd = self.posicoes[vizinho]
+                    distancia = math.hypot(vthc - thc, vcbd - cbd)
+                    if len(melhores) < k:
+                        heapq.heappush(melhores, (-distancia, vizinho))
+                    elif distancia < -melhores[0][0]:
+                        heapq.heapreplace(melhores, (-distancia, vizinho))
+
+            for anel in range(ultimo_anel + 1):
+                if (2 * anel + 1) ** 2 > len(grade):
+                    # Grade esparsa: mais barato visitar as células ocupadas restantes
+                    for (i, j), ids in grade.items():
+                        if max(abs(i - ci), abs(j - cj)) >= anel:
+                            considerar(ids)
+                    break
+                for celula in self._anel(ci, cj, anel):
+                    considerar(grade.get(celula, ()))
+
+                # Células fora dos anéis visitados estão a pelo menos anel * lado de distância
+                if len(melhores) == k and -melhores[0][0] <= anel * TAMANHO_CELULA:
+                    break
+
+        return sorted((-distancia, vizinho) for distancia, vizinho in melhores)
+
+    @staticmethod
+    def _anel(ci, cj, anel):
+        """
+        Células na borda do quadrado de raio `anel` centrado em (ci, cj).
+        """
+        if anel == 0:
+            yield (ci, cj)
+            return
+        for i in range(ci - anel, ci + anel + 1):
+            yield (i, cj - anel)
+            yield (i, cj + anel)
+        for j in range(cj - anel + 1, cj + anel):
+            yield (ci - anel, j)
+            yield (ci + anel, j)
+
+
+def vizinhos_no_banco(produto_id, k):
+    """
+    O mesmo que `IndiceSimilares.vizinhos`, calculado pelo banco.
+
+    Ordena pela distância só os produtos da categoria do consultado, sem
+    carregar o índice; usado enquanto o índice deste processo não foi carregado.
+    """
+    produto = Produto.objects.filter(pk=produto_id).values(*IndiceSimilares.campos).first()
+    if produto is None:
+        return None
+    thc, cbd = produto['thc_percentual'], produto['cbd_percentual']
+    diferenca_thc = F('thc_percentual') - thc
+    diferenca_cbd = F('cbd_percentual') - cbd
+    candidatos = (
+        Produto.objects
+        .filter(categoria_terapeutica=produto['categoria_terapeutica'])
+        .exclude(pk=produto_id)
+        .annotate(distancia=diferenca_thc * diferenca_thc + diferenca_cbd * diferenca_cbd)
+        .order_by('distancia', 'pk')
+        .values_list('pk', 'thc_percentual', 'cbd_percentual')[:k]
+    )
+    return sorted(
+        (math.hypot(float(vthc) - float(thc), float(vcbd) - float(cbd)), vizinho)
+        for vizinho, vthc, vcbd in candidatos
+    )
+
+
+# Índice compartilhado pelas requisições deste processo
+indice_similares = IndiceSimilares()
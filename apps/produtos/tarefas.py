@@ -0,0 +1,430 @@
+"""
+Fila de tarefas em banco de dados para operações longas.
+
+As tarefas são enfileiradas pela API (`enfileirar`) e executadas pelos
+processos do comando `manage.py run_workers`. Cada processo reserva uma
+tarefa por vez com um UPDATE condicional, de modo que dois processos nunca
+executam a mesma tarefa; a reserva já conta a tentativa, para que uma tarefa
+que derruba o processo também chegue a `falhou`. Enquanto executa, a tarefa
+recebe batimentos periódicos (`data_atualizacao`); sem eles por mais de
+`TAREFAS_TEMPO_LIMITE` segundos, ela é considerada abandonada e volta à fila.
+Falhas são repetidas com espera crescente até `max_tentativas`; os arquivos
+gerados ficam em `TAREFAS_DIR`.
+"""
+import csv
+import json
+import logging
+import threading
+import time
+import traceback
+import uuid
+from collections import Counter
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .catalogo import incrementar_versao, versao_atual
+from .contagens import ajustar, combinacao
+from .duplicados import indice_nomes
+from .historico import registrar_em_lote, registro_criacao
+from .models import Produto, Tarefa
+from .serializers import ProdutoSerializer
+
+logger = logging.getLogger(__name__)
+
+# Registro dos executores por tipo de tarefa
+EXECUTORES = {}
+
+# Intervalo mínimo entre gravações de progresso no banco (segundos)
+INTERVALO_PROGRESSO = 1.0
+
+# Intervalo máximo entre batimentos de uma tarefa em execução (segundos)
+INTERVALO_BATIMENTO = 60
+
+# Produtos processados por lote na importação e na exportação
+TAMANHO_LOTE = 500
+
+
+def executor(tipo):
+    """
+    Decorator que registra a função executora de um tipo de tarefa.
+    """
+    def registrar(funcao):
+        EXECUTORES[tipo] = funcao
+        return funcao
+    return registrar
+
+
+def diretorio_tarefas():
+    """
+    Diretório base dos arquivos de entrada e de resultado das tarefas.
+    """
+    diretorio = Path(settings.TAREFAS_DIR)
+    diretorio.mkdir(parents=True, exist_ok=True)
+    return diretorio
+
+
+def salvar_entrada(arquivo):
+    """
+    Grava um arquivo enviado para uma tarefa e retorna o caminho relativo.
+    """
+    extensao = Path(arquivo.name).suffix.lower()
+    relativo = Path('entradas') / f'{uuid.uuid4().hex}{extensao}'
+    destino = diretorio_tarefas() / relativo
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    with open(destino, 'wb') as saida:
+        for pedaco in arquivo.chunks():
+            saida.write(pedaco)
+    return str(relativo)
+
+
+def enfileirar(tipo, parametros=None, max_tentativas=3):
+    """
+    Cria uma tarefa pendente.
+    """
+    if tipo not in EXECUTORES:
+        raise ValueError(f"Tipo de tarefa desconhecido: {tipo}")
+    return Tarefa.objects.create(
+        tipo=tipo,
+        parametros=parametros or {},
+        max_tentativas=max_tentativas,
+    )
+
+
+class Contexto:
+    """
+    Acesso da função executora à sua tarefa: progresso e arquivos.
+    """
+
+    def __init__(self, tarefa):
+        self.tarefa = tarefa
+        self._ultima_gravacao = 0.0
+
+    def progresso(self, feito, total, mensagem=''):
+        """
+        Atualiza o progresso, gravando no banco no máximo a cada INTERVALO_PROGRESSO.
+        """
+        agora = time.monotonic()
+        if feito < total and agora - self._ultima_gravacao < INTERVALO_PROGRESSO:
+            return
+        self._ultima_gravacao = agora
+        percentual = int(feito * 100 / total) if total else 100
+        Tarefa.objects.filter(pk=self.tarefa.pk).update(
+            progresso=min(percentual, 100),
+            mensagem=mensagem[:255],
+            data_atualizacao=timezone.now(),
+        )
+
+    def registrar_andamento(self, andamento):
+        """
+        Grava um ponto de retomada no resultado da tarefa.
+
+        Chamado dentro da transação de um lote, permite que uma nova tentativa
+        continue de onde a anterior parou.
+        """
+        self.tarefa.resultado = andamento
+        Tarefa.objects.filter(pk=self.tarefa.pk).update(resultado=andamento)
+
+    def arquivo_resultado(self, nome):
+        """
+        Caminho absoluto para gravar um arquivo de resultado, registrado na tarefa.
+        """
+        relativo = Path('resultados') / str(self.tarefa.pk) / nome
+        destino = diretorio_tarefas() / relativo
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        self.tarefa.arquivo_resultado = str(relativo)
+        return destino
+
+
+def reservar_proxima():
+    """
+    Reserva a próxima tarefa disponível para este processo, ou retorna None.
+
+    Tarefas em execução sem batimento há mais de TAREFAS_TEMPO_LIMITE
+    segundos (processo interrompido) voltam a ser elegíveis; se já esgotaram
+    as tentativas, são marcadas como `falhou` em vez de executadas de novo.
+    """
+    agora = timezone.now()
+    abandonadas = agora - timedelta(seconds=settings.TAREFAS_TEMPO_LIMITE)
+    Tarefa.objects.filter(
+        status='executando', data_atualizacao__lt=abandonadas, tentativas__gte=F('max_tentativas'),
+    ).update(
+        status='falhou',
+        mensagem="Abandonada: o processo foi interrompido na última tentativa.",
+        data_atualizacao=agora,
+        data_conclusao=agora,
+    )
+    candidatas = (
+        Tarefa.objects.filter(status='pendente', disponivel_em__lte=agora)
+        | Tarefa.objects.filter(status='executando', data_atualizacao__lt=abandonadas)
+    )
+
+    for tarefa_id, status, atualizacao in (
+        candidatas.order_by('disponivel_em', 'pk').values_list('pk', 'status', 'data_atualizacao')[:10]
+    ):
+        # A condição inclui o estado lido: só um processo reserva cada tarefa
+        reservada = Tarefa.objects.filter(pk=tarefa_id, status=status, data_atualizacao=atualizacao).update(
+            status='executando',
+            tentativas=F('tentativas') + 1,
+            data_inicio=agora,
+            data_atualizacao=agora,
+        )
+        if reservada:
+            return Tarefa.objects.get(pk=tarefa_id)
+    return None
+
+
+class Batimento(threading.Thread):
+    """
+    Atualiza `data_atualizacao` da tarefa a cada `intervalo` segundos enquanto
+    ela executa, para que não seja tomada como abandonada.
+    """
+
+    def __init__(self, tarefa_id, intervalo):
+        super().__init__(name=f'batimento-{tarefa_id}', daemon=True)
+        self.tarefa_id = tarefa_id
+        self.intervalo = intervalo
+        self._parar = threading.Event()
+
+    def run(self):
+        try:
+            while not self._parar.wait(self.intervalo):
+                try:
+                    self.bater()
+                except Exception:
+                    logger.exception("Falha no batimento da tarefa %s", self.tarefa_id)
+        finally:
+            # Conexão própria desta thread
+            connections.close_all()
+
+    def bater(self):
+        """
+        Grava um batimento, se a tarefa ainda estiver em execução.
+        """
+        Tarefa.objects.filter(pk=self.tarefa_id, status='executando').update(
+            data_atualizacao=timezone.now()
+        )
+
+    def parar(self):
+        self._parar.set()
+        self.join()
+
+
+def intervalo_batimento():
+    """
+    Intervalo entre batimentos: bem abaixo do tempo limite de abandono.
+    """
+    return min(INTERVALO_BATIMENTO, settings.TAREFAS_TEMPO_LIMITE / 4)
+
+
+def executar(tarefa):
+    """
+    Executa uma tarefa reservada, registrando o resultado ou agendando nova tentativa.
+
+    `tarefa.tentativas` já inclui esta tentativa (contada na reserva).
+    """
+    contexto = Contexto(tarefa)
+    batimento = Batimento(tarefa.pk, intervalo_batimento())
+    batimento.start()
+    # Só os campos decididos aqui: progresso e batimentos já foram gravados à parte
+    campos = ['status', 'mensagem', 'erro', 'arquivo_resultado', 'data_atualizacao']
+    try:
+        resultado = EXECUTORES[tarefa.tipo](contexto, **tarefa.parametros)
+    except Exception:
+        tarefa.erro = traceback.format_exc()
+        if tarefa.tentativas < tarefa.max_tentativas:
+            tarefa.status = 'pendente'
+            tarefa.disponivel_em = timezone.now() + timedelta(seconds=30 * 2 ** (tarefa.tentativas - 1))
+            tarefa.mensagem = f"Falhou na tentativa {tarefa.tentativas}; nova tentativa agendada."
+            campos.append('disponivel_em')
+        else:
+            tarefa.status = 'falhou'
+            tarefa.data_conclusao = timezone.now()
+            tarefa.mensagem = f"Falhou após {tarefa.tentativas} tentativas."
+            campos.append('data_conclusao')
+        logger.exception("Tarefa %s falhou", tarefa.pk)
+    else:
+        tarefa.status = 'concluida'
+        tarefa.progresso = 100
+        tarefa.resultado = resultado or {}
+        tarefa.mensagem = "Concluída."
+        tarefa.erro = ''
+        tarefa.data_conclusao = timezone.now()
+        campos += ['progresso', 'resultado', 'data_conclusao']
+    finally:
+        batimento.parar()
+
+    tarefa.data_atualizacao = timezone.now()
+    tarefa.save(update_fields=campos)
+    return tarefa
+
+
+def processar_fila(intervalo=1.0, uma_vez=False):
+    """
+    Laço de um processo trabalhador: reserva e executa tarefas até ser interrompido.
+
+    Com `uma_vez`, encerra quando não houver mais tarefas disponíveis.
+    """
+    executadas = 0
+    while True:
+        tarefa = reservar_proxima()
+        if tarefa is None:
+            if uma_vez:
+                return executadas
+            time.sleep(intervalo)
+            continue
+        executar(tarefa)
+        executadas += 1
+
+
+# Executores
+
+def _ler_linhas(caminho):
+    """
+    Lê os produtos de um arquivo JSON (lista de objetos) ou CSV (com cabeçalho).
+    """
+    if caminho.suffix == '.csv':
+        with open(caminho, newline='', encoding='utf-8-sig') as arquivo:
+            return list(csv.DictReader(arquivo))
+    with open(caminho, encoding='utf-8') as arquivo:
+        return json.load(arquivo)
+
+
+@executor('importacao')
+def importar_produtos(contexto, arquivo):
+    """
+    Importa produtos em lotes, validando cada linha com o ProdutoSerializer.
+
+    Cada lote é gravado em uma transação junto com o ponto de retomada, de
+    modo que uma nova tentativa não duplica os lotes já importados. As linhas
+    inválidas e os produtos importados com nome semelhante a outro do catálogo
+    (ou de uma linha anterior do arquivo) são registrados em `relatorio.jsonl`.
+    """
+    linhas = _ler_linhas(diretorio_tarefas() / arquivo)
+    total = len(linhas)
+    andamento = {
+        'linhas_processadas': 0, 'importados': 0, 'com_erro': 0, 'possiveis_duplicados': 0,
+        **contexto.tarefa.resultado,
+    }
+    caminho_relatorio = contexto.arquivo_resultado('relatorio.jsonl')
+    indice_nomes.sincronizar(versao_atual().versao)
+
+    for inicio in range(andamento['linhas_processadas'], total, TAMANHO_LOTE):
+        fim = min(inicio + TAMANHO_LOTE, total)
+        validos = []
+        numeros = []
+        ocorrencias = []
+        for numero, linha in enumerate(linhas[inicio:fim], start=inicio + 1):
+            serializer = ProdutoSerializer(data=linha)
+            if serializer.is_valid():
+                validos.append(Produto(**serializer.validated_data))
+                numeros.append(numero)
+            else:
+                ocorrencias.append({'linha': numero, 'erros': serializer.errors})
+        com_erro = len(ocorrencias)
+
+        with transaction.atomic():
+            criados = Produto.objects.bulk_create(validos)
+            registrar_em_lote([registro_criacao(produto) for produto in criados])
+            ajustar(Counter(combinacao(produto) for produto in criados))
+            if criados:
+                incrementar_versao()
+            andamento = {
+                'linhas_processadas': fim,
+                'importados': andamento['importados'] + len(criados),
+                'com_erro': andamento['com_erro'] + com_erro,
+                'possiveis_duplicados': andamento['possiveis_duplicados'],
+            }
+            contexto.registrar_andamento(andamento)
+
+        # Só depois do commit: o índice não pode conter produtos de um lote desfeito
+        for numero, produto in zip(numeros, criados):
+            duplicados = indice_nomes.buscar(produto.nome, excluir=produto.pk)
+            indice_nomes.inserir(produto.pk, produto.nome)
+            if duplicados:
+                ocorrencias.append({'linha': numero, 'id': produto.pk, 'possiveis_duplicados': duplicados})
+        andamento['possiveis_duplicados'] += len(ocorrencias) - com_erro
+
+        with open(caminho_relatorio, 'a', encoding='utf-8') as saida:
+            for ocorrencia in sorted(ocorrencias, key=lambda item: item['linha']):
+                saida.write(json.dumps(ocorrencia, ensure_ascii=False) + '\n')
+        contexto.progresso(fim, total, f"{andamento['importados']} produtos importados")
+
+    return {'total': total, **andamento}
+
+
+@executor('exportacao')
+def exportar_catalogo(contexto, formato='csv'):
+    """
+    Exporta o catálogo completo para CSV ou JSON.
+    """
+    total = Produto.objects.count()
+    campos = ProdutoSerializer.Meta.fields
+    exportados = 0
+
+    with open(contexto.arquivo_resultado(f'produtos.{formato}'), 'w', newline='', encoding='utf-8') as saida:
+        if formato == 'csv':
+            escritor = csv.DictWriter(saida, fieldnames=campos, extrasaction='ignore')
+            escritor.writeheader()
+        else:
+            saida.write('[\n')
+
+        lote = []
+        for produto in Produto.objects.order_by('pk').iterator(chunk_size=TAMANHO_LOTE):
+            lote.append(produto)
+            if len(lote) == TAMANHO_LOTE:
+                exportados += _escrever_lote(saida, formato, lote, exportados)
+                lote = []
+                contexto.progresso(exportados, total, f"{exportados} produtos exportados")
+        exportados += _escrever_lote(saida, formato, lote, exportados)
+
+        if formato != 'csv':
+            saida.write('\n]\n')
+
+    return {'exportados': exportados, 'formato': formato}
+
+
+def _escrever_lote(saida, formato, produtos, ja_escritos):
+    """
+    Serializa e grava um lote de produtos na exportação.
+    """
+    dados = ProdutoSerializer(produtos, many=True).data
+    if formato == 'csv':
+        csv.DictWriter(saida, fieldnames=ProdutoSerializer.Meta.fields, extrasaction='ignore').writerows(dados)
+    else:
+        for indice, item in enumerate(dados):
+            if ja_escritos or indice:
+                saida.write(',\n')
+            saida.write(json.dumps(item, ensure_ascii=False))
+    return len(dados)
+
+
+@executor('auditoria')
+def auditar_catalogo(contexto):
+    """
+    Audita o catálogo: aprovações que violam a regra de THC e produtos de risco.
+    """
+    violacoes = list(
+        Produto.objects.filter(status_anvisa='aprovado', thc_percentual__gt=0.3)
+        .values('id', 'nome', 'thc_percentual', 'categoria_terapeutica')
+    )
+    contexto.progresso(1, 2, "Violações levantadas")
+
+    risco = list(
+        Produto.objects.filter(
+            thc_percentual__gt=0.3,
+            categoria_terapeutica__in=['neurologia', 'pediatria']
+        ).values('id', 'nome', 'thc_percentual', 'categoria_terapeutica', 'status_anvisa')
+    )
+
+    with open(contexto.arquivo_resultado('auditoria.json'), 'w', encoding='utf-8') as saida:
+        json.dump(
+            {'violacoes': violacoes, 'produtos_risco': risco},
+            saida, ensure_ascii=False, indent=2, default=str,
+        )
+
+    return {'violacoes': len(violacoes), 'produtos_risco': len(risco)}
@@ -0,0 +1,47 @@
+"""
+Funções compartilhadas pelos testes do app de produtos.
+"""
+from decimal import Decimal
+
+from django.core.cache import cache
+
+from ..analitico import invalidar_instantaneo
+from ..catalogo import incrementar_versao
+from ..contagens import recalcular
+from ..duplicados import indice_nomes
+from ..models import Produto
+from ..similares import indice_similares
+
+TIPOS_ESPECTRO = ['sativa', 'indica', 'hibrida']
+CATEGORIAS = ['neurologia', 'pediatria', 'oncologia', 'dermatologia', 'outros']
+STATUS_ANVISA = ['aprovado', 'pendente', 'reprovado']
+
+
+def criar_produtos(quantidade):
+    """
+    Cadastra produtos variados (parte deles com risco) em uma única consulta.
+    """
+    inicio = Produto.objects.count()
+    Produto.objects.bulk_create([
+        Produto(
+            nome=f'Produto de teste {numero}',
+            tipo_espectro=TIPOS_ESPECTRO[numero % len(TIPOS_ESPECTRO)],
+            thc_percentual=Decimal(numero % 250) / 100,
+            cbd_percentual=Decimal(numero % 2000) / 100,
+            categoria_terapeutica=CATEGORIAS[numero % len(CATEGORIAS)],
+            status_anvisa=STATUS_ANVISA[numero % len(STATUS_ANVISA)],
+        )
+        for numero in range(inicio, inicio + quantidade)
+    ])
+    recalcular()
+    incrementar_versao()
+
+
+def descartar_caches():
+    """
+    Esvazia o cache e os índices em memória, que sobrevivem entre os testes.
+    """
+    cache.clear()
+    indice_nomes.invalidar()
+    indice_similares.invalidar()
+    invalidar_instantaneo()
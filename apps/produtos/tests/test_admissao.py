@@ -0,0 +1,105 @@
+import os
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.urls import resolve
+
+from ..admissao import AdmissaoMiddleware, BaldesCompartilhados
+from ..coalescencia import coalescer_leituras
+
+
+class AdmissaoTests(SimpleTestCase):
+    """
+    Limite de taxa por cliente e de concorrência por endpoint.
+    """
+
+    @override_settings(ADMISSAO={'TAXA_POR_CLIENTE': 1, 'RAJADA_POR_CLIENTE': 3})
+    def test_limite_de_taxa(self):
+        respostas = [self.client.get('/api/produtos/metricas/') for _ in range(4)]
+        self.assertEqual([resposta.status_code for resposta in respostas], [200, 200, 200, 429])
+        self.assertEqual(respostas[-1]['Retry-After'], '1')
+        # Rotas fora dos prefixos não passam pelo limite
+        self.assertEqual(self.client.get('/cadastro/').status_code, 200)
+
+    def test_baldes_compartilhados_entre_processos(self):
+        with tempfile.TemporaryDirectory() as diretorio:
+            caminho = os.path.join(diretorio, 'admissao')
+            worker_a = BaldesCompartilhados(caminho, taxa=0.5, rajada=2, posicoes=64)
+            worker_b = BaldesCompartilhados(caminho, taxa=0.5, rajada=2, posicoes=64)
+            self.assertEqual(worker_a.consumir('10.0.0.1'), 0)
+            self.assertEqual(worker_b.consumir('10.0.0.1'), 0)
+            self.assertGreater(worker_a.consumir('10.0.0.1'), 1)
+            self.assertEqual(worker_b.consumir('10.0.0.2'), 0)
+
+    @override_settings(ADMISSAO={'CONCORRENCIA_POR_ENDPOINT': 2, 'LIMITES_ENDPOINT': {}, 'ALVO_LATENCIA': 0.1})
+    def test_descarte_acima_da_concorrencia(self):
+        liberar = threading.Event()
+
+        def view_lenta(request):
+            liberar.wait(5)
+            return HttpResponse('ok')
+
+        def resposta(request):
+            request.resolver_match = resolve('/api/produtos/')
+            return middleware.process_view(request, view_lenta, (), {}) or view_lenta(request)
+
+        middleware = AdmissaoMiddleware(resposta)
+        fabrica = RequestFactory()
+        ocupadas = [
+            threading.Thread(target=middleware, args=(fabrica.get('/api/produtos/'),))
+            for _ in range(2)
+        ]
+        for thread in ocupadas:
+            thread.start()
+        while middleware.controle.limite('produtos:produtos_api').em_execucao < 2:
+            time.sleep(0.01)
+
+        excedente = middleware(fabrica.get('/api/produtos/'))
+        liberar.set()
+        for thread in ocupadas:
+            thread.join()
+        self.assertEqual(excedente.status_code, 503)
+        self.assertIn('Retry-After', excedente)
+
+    @override_settings(ADMISSAO={'CONCORRENCIA_POR_ENDPOINT': 1, 'LIMITES_ENDPOINT': {}, 'ALVO_LATENCIA': 0.1})
+    def test_seguidoras_da_coalescencia_nao_ocupam_vaga(self):
+        liberar = threading.Event()
+        ocupacao = []
+
+        @coalescer_leituras
+        def view_lenta(request):
+            ocupacao.append(middleware.controle.limite('produtos:produtos_risco_api').em_execucao)
+            liberar.wait(5)
+            return HttpResponse('ok')
+
+        def resposta(request):
+            request.resolver_match = resolve('/api/produtos/risco/')
+            request._versao_catalogo = SimpleNamespace(versao=1)
+            return middleware.process_view(request, view_lenta, (), {}) or view_lenta(request)
+
+        middleware = AdmissaoMiddleware(resposta)
+        fabrica = RequestFactory()
+        respostas = []
+        threads = [
+            threading.Thread(target=lambda: respostas.append(middleware(fabrica.get('/api/produtos/risco/'))))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        # Além do alvo de latência: seguidoras com vaga seriam descartadas com 503
+        time.sleep(0.3)
+        liberar.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([resposta.status_code for resposta in respostas], [200] * 4)
+        self.assertEqual(ocupacao, [1])
+        self.assertEqual(sum(resposta.has_header('X-Coalescida') for resposta in respostas), 3)
+        estatisticas = middleware.controle.estatisticas()
+        self.assertEqual(estatisticas['admitidas'], 1)
+        # Só a duração da líder entra no tempo médio
+        self.assertGreaterEqual(estatisticas['endpoints']['produtos:produtos_risco_api']['tempo_medio_ms'], 300)
@@ -0,0 +1,152 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import F
+from django.test import TestCase
+from django.utils import timezone
+
+from ..arquivamento import CAMPOS_PRODUTO, arquivar, arquivar_elegiveis, restaurar
+from ..contagens import recalcular
+from ..models import HistoricoProduto, Produto, ProdutoArquivado
+from .auxiliares import criar_produtos
+
+
+class ArquivamentoTests(TestCase):
+    """
+    Ida e volta entre a tabela ativa e o arquivo, preservando id e datas.
+    """
+
+    def setUp(self):
+        criar_produtos(12)
+        agora = timezone.now()
+        # Datas distintas e antigas, que o auto_now de um save comum sobrescreveria
+        for posicao, produto_id in enumerate(Produto.objects.order_by('pk').values_list('pk', flat=True)):
+            Produto.objects.filter(pk=produto_id).update(
+                data_criacao=agora - timedelta(days=900 - posicao),
+                data_atualizacao=agora - timedelta(days=400 - posicao, minutes=posicao),
+            )
+        self.originais = {
+            produto['id']: produto for produto in Produto.objects.values(*CAMPOS_PRODUTO)
+        }
+
+    def assertContagensCorretas(self):
+        self.assertEqual(recalcular(), {})
+
+    def test_ida_e_volta_preserva_ids_e_datas(self):
+        ids = sorted(self.originais)[::3]
+        self.assertEqual(arquivar(ids), len(ids))
+
+        self.assertFalse(Produto.objects.filter(pk__in=ids).exists())
+        arquivados = {produto['id']: produto for produto in ProdutoArquivado.objects.values(*CAMPOS_PRODUTO)}
+        self.assertEqual(arquivados, {produto_id: self.originais[produto_id] for produto_id in ids})
+        self.assertContagensCorretas()
+
+        self.assertEqual(restaurar(ids), len(ids))
+
+        self.assertFalse(ProdutoArquivado.objects.exists())
+        restaurados = {produto['id']: produto for produto in Produto.objects.values(*CAMPOS_PRODUTO)}
+        self.assertEqual(restaurados, self.originais)
+        self.assertContagensCorretas()
+        self.assertEqual(
+            list(HistoricoProduto.objects.filter(produto_id=ids[0]).values_list('operacao', flat=True)
+                 .order_by('momento', 'pk'))[-2:],
+            ['arquivamento', 'restauracao'],
+        )
+
+    def test_ids_arquivados_nao_sao_reutilizados(self):
+        maior = max(self.originais)
+        arquivar([maior])
+        criar_produtos(1)
+        self.assertGreater(Produto.objects.order_by('-pk').values_list('pk', flat=True)[0], maior)
+        restaurar([maior])
+        self.assertEqual(Produto.objects.get(pk=maior).data_criacao, self.originais[maior]['data_criacao'])
+
+    def test_ids_inexistentes(self):
+        self.assertEqual(arquivar([0]), 0)
+        self.assertEqual(restaurar(list(self.originais)), 0)
+        self.assertEqual(Produto.objects.count(), len(self.originais))
+
+    def test_arquivar_elegiveis_em_lotes(self):
+        elegiveis = sorted(
+            produto_id for produto_id, produto in self.originais.items()
+            if produto['status_anvisa'] == 'reprovado'
+        )
+        lotes = []
+        total = arquivar_elegiveis(
+            status=['reprovado'], idade_dias=365, tamanho_lote=2, ao_concluir_lote=lotes.append
+        )
+        self.assertEqual(total, len(elegiveis))
+        self.assertEqual(lotes, list(range(2, len(elegiveis) + 1, 2)) + ([total] if total % 2 else []))
+        self.assertEqual(sorted(ProdutoArquivado.objects.values_list('pk', flat=True)), elegiveis)
+        self.assertContagensCorretas()
+        # Produtos atualizados há menos tempo que a idade mínima ficam
+        self.assertEqual(arquivar_elegiveis(status=['aprovado', 'pendente'], idade_dias=1000), 0)
+
+
+class IncluirArquivadosApiTests(TestCase):
+    """
+    `?incluir_arquivados=` nas listagens e no detalhe.
+    """
+
+    def setUp(self):
+        criar_produtos(15)
+        agora = timezone.now()
+        for posicao, produto_id in enumerate(Produto.objects.order_by('pk').values_list('pk', flat=True)):
+            Produto.objects.filter(pk=produto_id).update(
+                data_criacao=agora - timedelta(hours=posicao),
+                thc_percentual=Decimal('1.50') if posicao % 2 else F('thc_percentual'),
+            )
+        recalcular()
+        self.arquivados = sorted(Produto.objects.values_list('pk', flat=True))[1::4]
+        arquivar(self.arquivados)
+
+    def test_listagem(self):
+        padrao = self.client.get('/api/produtos/')
+        self.assertEqual(len(padrao.json()), 15 - len(self.arquivados))
+        self.assertFalse(any(produto['arquivado'] for produto in padrao.json()))
+        self.assertEqual(padrao['X-Total-Count'], str(15 - len(self.arquivados)))
+
+        com_arquivo = self.client.get('/api/produtos/', {'incluir_arquivados': 'true'})
+        dados = com_arquivo.json()
+        self.assertEqual(len(dados), 15)
+        self.assertEqual(
+            sorted(produto['id'] for produto in dados if produto['arquivado']), self.arquivados
+        )
+        # Ativos e arquivados intercalados na ordenação padrão (mais recentes primeiro)
+        self.assertEqual([produto['id'] for produto in dados], sorted(produto['id'] for produto in dados))
+        sem_arquivo = self.client.get('/api/produtos/', {'incluir_arquivados': '0'})
+        self.assertEqual(len(sem_arquivo.json()), 15 - len(self.arquivados))
+
+    def test_listagem_de_risco(self):
+        risco = {produto['id'] for produto in self.client.get('/api/produtos/risco/').json()}
+        com_arquivo = self.client.get('/api/produtos/risco/', {'incluir_arquivados': 'true'}).json()
+        esperado = set(
+            ProdutoArquivado.objects.filter(
+                thc_percentual__gt='0.3', categoria_terapeutica__in=['neurologia', 'pediatria']
+            ).values_list('pk', flat=True)
+        )
+        self.assertTrue(esperado)
+        self.assertEqual({produto['id'] for produto in com_arquivo}, risco | esperado)
+        self.assertTrue(all(produto['tem_risco'] for produto in com_arquivo))
+
+    def test_detalhe(self):
+        produto_id = self.arquivados[0]
+        self.assertEqual(self.client.get(f'/api/produtos/{produto_id}/').status_code, 404)
+
+        resposta = self.client.get(f'/api/produtos/{produto_id}/', {'incluir_arquivados': 'true'})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertTrue(resposta.json()['arquivado'])
+        nao_modificada = self.client.get(
+            f'/api/produtos/{produto_id}/', {'incluir_arquivados': 'true'}, HTTP_IF_NONE_MATCH=resposta['ETag']
+        )
+        self.assertEqual(nao_modificada.status_code, 304)
+
+        ativo = self.client.get(f'/api/produtos/{self.arquivados[0] - 1}/', {'incluir_arquivados': 'true'})
+        self.assertFalse(ativo.json()['arquivado'])
+
+    def test_valor_invalido(self):
+        for url in ('/api/produtos/', '/api/produtos/risco/', f'/api/produtos/{self.arquivados[0]}/'):
+            with self.subTest(url=url):
+                resposta = self.client.get(url, {'incluir_arquivados': 'talvez'})
+                self.assertEqual(resposta.status_code, 400)
+                self.assertIn('incluir_arquivados', resposta.json())
@@ -0,0 +1,155 @@
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+
+from .. import coalescencia
+from ..coalescencia import GrupoCoalescencia, coalescer_leituras
+
+
+def _em_thread(funcao, *args):
+    resultados = []
+    thread = threading.Thread(target=lambda: resultados.append(funcao(*args)))
+    thread.start()
+    return thread, resultados
+
+
+def _aguardar(condicao):
+    limite = time.monotonic() + 5
+    while not condicao():
+        if time.monotonic() > limite:
+            raise AssertionError("Condição não atingida")
+        time.sleep(0.005)
+
+
+class GrupoCoalescenciaTests(SimpleTestCase):
+    """
+    Líder e seguidoras de uma mesma chave.
+    """
+
+    def setUp(self):
+        self.grupo = GrupoCoalescencia()
+        self.liberar = threading.Event()
+
+    def _lider(self, resultado='lider'):
+        def funcao():
+            self.liberar.wait(5)
+            return resultado
+        thread, resultados = _em_thread(self.grupo.executar, 'chave', funcao)
+        _aguardar(lambda: self.grupo.estatisticas()['em_andamento'] == 1)
+        return thread, resultados
+
+    def test_seguidora_recebe_o_resultado_da_lider(self):
+        lider, resultado_lider = self._lider()
+        seguidora, resultado_seguidora = _em_thread(
+            self.grupo.executar, 'chave', mock.Mock(side_effect=AssertionError("não deveria executar"))
+        )
+        time.sleep(0.05)
+        self.liberar.set()
+        lider.join()
+        seguidora.join()
+
+        self.assertEqual(resultado_lider, [('lider', False)])
+        self.assertEqual(resultado_seguidora, [('lider', True)])
+        self.assertEqual(self.grupo.estatisticas(), {'executadas': 1, 'coalescidas': 1, 'em_andamento': 0})
+
+    def test_seguidora_executa_sozinha_apos_o_tempo_maximo(self):
+        lider, _ = self._lider()
+        with mock.patch.object(coalescencia, 'TEMPO_MAXIMO_ESPERA', 0.05):
+            resultado = self.grupo.executar('chave', lambda: 'propria')
+        self.liberar.set()
+        lider.join()
+
+        self.assertEqual(resultado, ('propria', False))
+        self.assertEqual(self.grupo.estatisticas()['coalescidas'], 0)
+
+    def test_seguidora_executa_sozinha_se_a_lider_falha(self):
+        def falhar():
+            self.liberar.wait(5)
+            raise RuntimeError("falha da líder")
+
+        lider, _ = _em_thread(self._executar_ignorando_erro, falhar)
+        _aguardar(lambda: self.grupo.estatisticas()['em_andamento'] == 1)
+        seguidora, resultado = _em_thread(self.grupo.executar, 'chave', lambda: 'propria')
+        time.sleep(0.05)
+        self.liberar.set()
+        lider.join()
+        seguidora.join()
+
+        self.assertEqual(resultado, [('propria', False)])
+
+    def _executar_ignorando_erro(self, funcao):
+        try:
+            self.grupo.executar('chave', funcao)
+        except RuntimeError:
+            pass
+
+
+class CoalescerLeiturasTests(TestCase):
+    """
+    O decorator nas views: o que é compartilhado e os contadores em /api/produtos/metricas/.
+    """
+
+    def setUp(self):
+        self.liberar = threading.Event()
+        self.execucoes = 0
+
+        @coalescer_leituras
+        def view(request):
+            self.execucoes += 1
+            self.liberar.wait(5)
+            return HttpResponse(f'corpo {self.execucoes}')
+
+        self.view = view
+
+    def _concorrentes(self, quantidade, **extra):
+        fabrica = RequestFactory()
+        requisicoes = []
+        for _ in range(quantidade):
+            request = fabrica.get('/api/produtos/risco/', **extra)
+            request._versao_catalogo = SimpleNamespace(versao=1)
+            requisicoes.append(request)
+
+        threads = [_em_thread(self.view, request) for request in requisicoes]
+        time.sleep(0.1)
+        self.liberar.set()
+        respostas = []
+        for thread, resultado in threads:
+            thread.join()
+            respostas.extend(resultado)
+        return respostas
+
+    def test_json_e_coalescido_e_contado_nas_metricas(self):
+        antes = self.client.get('/api/produtos/metricas/').json()['coalescencia']
+        respostas = self._concorrentes(3, HTTP_ACCEPT='application/json')
+        depois = self.client.get('/api/produtos/metricas/').json()['coalescencia']
+
+        self.assertEqual(self.execucoes, 1)
+        self.assertEqual({resposta.content for resposta in respostas}, {b'corpo 1'})
+        self.assertEqual(sum(resposta.has_header('X-Coalescida') for resposta in respostas), 2)
+        self.assertEqual(depois['executadas'] - antes['executadas'], 1)
+        self.assertEqual(depois['coalescidas'] - antes['coalescidas'], 2)
+
+    def test_html_nao_e_compartilhado(self):
+        respostas = self._concorrentes(3, HTTP_ACCEPT='text/html,application/xhtml+xml,*/*;q=0.8')
+        self.assertEqual(self.execucoes, 3)
+        self.assertFalse(any(resposta.has_header('X-Coalescida') for resposta in respostas))
+
+    def test_formato_api_nao_e_compartilhado(self):
+        fabrica = RequestFactory()
+        self.assertFalse(coalescencia._coalescivel(fabrica.get('/api/produtos/', {'format': 'api'})))
+        self.assertTrue(coalescencia._coalescivel(fabrica.get('/api/produtos/', {'format': 'cbor'})))
+        self.assertTrue(coalescencia._coalescivel(fabrica.get('/api/produtos/')))
+
+    def test_usuarios_diferentes_nao_compartilham(self):
+        fabrica = RequestFactory()
+        chaves = []
+        for usuario in (SimpleNamespace(pk=1, is_authenticated=True), SimpleNamespace(pk=2, is_authenticated=True)):
+            request = fabrica.get('/api/produtos/risco/')
+            request._versao_catalogo = SimpleNamespace(versao=1)
+            request.user = usuario
+            chaves.append(coalescencia._chave(request))
+        self.assertNotEqual(*chaves)
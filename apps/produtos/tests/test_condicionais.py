@@ -0,0 +1,79 @@
+from decimal import Decimal
+
+from django.test import TestCase
+
+from ..models import Produto
+from .auxiliares import criar_produtos
+
+NOVO_PRODUTO = {
+    'nome': 'Óleo CBD 20%',
+    'tipo_espectro': 'hibrida',
+    'thc_percentual': '0.10',
+    'cbd_percentual': '20.00',
+    'categoria_terapeutica': 'oncologia',
+    'status_anvisa': 'pendente',
+}
+
+
+class RequisicoesCondicionaisTests(TestCase):
+    """
+    ETag e Last-Modified das leituras: 304 enquanto nada muda, novo ETag após escritas.
+    """
+
+    def setUp(self):
+        criar_produtos(5)
+
+    def test_if_none_match_responde_304(self):
+        for url in ('/api/produtos/', '/api/produtos/risco/', f'/api/produtos/{Produto.objects.first().pk}/'):
+            with self.subTest(url=url):
+                resposta = self.client.get(url)
+                self.assertEqual(resposta.status_code, 200)
+                nao_modificada = self.client.get(url, HTTP_IF_NONE_MATCH=resposta['ETag'])
+                self.assertEqual(nao_modificada.status_code, 304)
+                self.assertEqual(nao_modificada.content, b'')
+                self.assertEqual(nao_modificada['ETag'], resposta['ETag'])
+
+    def test_if_modified_since_responde_304(self):
+        resposta = self.client.get('/api/produtos/')
+        nao_modificada = self.client.get('/api/produtos/', HTTP_IF_MODIFIED_SINCE=resposta['Last-Modified'])
+        self.assertEqual(nao_modificada.status_code, 304)
+
+    def test_etag_depende_da_representacao(self):
+        json = self.client.get('/api/produtos/', HTTP_ACCEPT='application/json')
+        cbor = self.client.get('/api/produtos/', HTTP_ACCEPT='application/cbor')
+        self.assertNotEqual(json['ETag'], cbor['ETag'])
+        self.assertEqual(
+            self.client.get('/api/produtos/', HTTP_ACCEPT='application/cbor', HTTP_IF_NONE_MATCH=json['ETag']).status_code,
+            200,
+        )
+
+    def test_criacao_muda_o_etag(self):
+        etag = self.client.get('/api/produtos/')['ETag']
+        criacao = self.client.post('/api/produtos/', NOVO_PRODUTO, content_type='application/json')
+        self.assertEqual(criacao.status_code, 201)
+
+        resposta = self.client.get('/api/produtos/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(resposta['ETag'], etag)
+
+    def test_exclusao_muda_o_etag(self):
+        produto = Produto.objects.first()
+        etag_listagem = self.client.get('/api/produtos/')['ETag']
+        etag_detalhe = self.client.get(f'/api/produtos/{produto.pk}/')['ETag']
+        produto.delete()
+
+        self.assertEqual(self.client.get('/api/produtos/', HTTP_IF_NONE_MATCH=etag_listagem).status_code, 200)
+        self.assertEqual(
+            self.client.get(f'/api/produtos/{produto.pk}/', HTTP_IF_NONE_MATCH=etag_detalhe).status_code,
+            404,
+        )
+
+    def test_alteracao_muda_o_etag_do_produto(self):
+        produto = Produto.objects.first()
+        etag = self.client.get(f'/api/produtos/{produto.pk}/')['ETag']
+        produto.cbd_percentual = Decimal('12.50')
+        produto.save()
+
+        resposta = self.client.get(f'/api/produtos/{produto.pk}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json()['cbd_percentual'], '12.50')
@@ -0,0 +1,117 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.test import TestCase
+
+from .. import contagens
+from ..arquivamento import arquivar, restaurar
+from ..contagens import FILTRO_RISCO, contar, recalcular
+from ..models import Produto
+from .auxiliares import criar_produtos
+
+
+class ContagensTests(TestCase):
+    """
+    Totais mantidos pelas escritas, conferidos contra `COUNT(*)`.
+    """
+
+    def assertContagensCorretas(self):
+        self.assertEqual(recalcular(), {}, "as contagens mantidas divergem da tabela de produtos")
+
+    def test_escritas_mantem_contagens(self):
+        criar_produtos(30)
+        produto = Produto.objects.filter(thc_percentual__lte=Decimal('0.3')).first()
+        resposta = self.client.post('/api/produtos/', {
+            'nome': 'Óleo de contagem',
+            'tipo_espectro': 'hibrida',
+            'thc_percentual': '0.90',
+            'cbd_percentual': '10.00',
+            'categoria_terapeutica': 'pediatria',
+            'status_anvisa': 'pendente',
+        }, content_type='application/json')
+        self.assertEqual(resposta.status_code, 201)
+        self.assertContagensCorretas()
+
+        produto.thc_percentual = Decimal('1.50')
+        produto.categoria_terapeutica = 'neurologia'
+        produto.save()
+        self.assertContagensCorretas()
+
+        resposta = self.client.post('/api/produtos/status/', {
+            'status_anvisa': 'aprovado', 'filtro': {'categoria_terapeutica': 'oncologia'},
+        }, content_type='application/json')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertContagensCorretas()
+
+        ids = list(Produto.objects.values_list('pk', flat=True)[:5])
+        arquivar(ids)
+        self.assertContagensCorretas()
+        restaurar(ids[:2])
+        self.assertContagensCorretas()
+        Produto.objects.filter(pk=ids[0]).delete()
+        self.assertContagensCorretas()
+
+    def test_instancia_sem_valores_originais_ajusta_uma_linha(self):
+        criar_produtos(20)
+        produto = Produto.objects.filter(thc_percentual__lte=Decimal('0.3')).first()
+        montado = Produto(
+            pk=produto.pk,
+            nome=produto.nome,
+            tipo_espectro='sativa' if produto.tipo_espectro != 'sativa' else 'indica',
+            thc_percentual=Decimal('2.00'),
+            cbd_percentual=produto.cbd_percentual,
+            categoria_terapeutica=produto.categoria_terapeutica,
+            status_anvisa=produto.status_anvisa,
+            data_criacao=produto.data_criacao,
+        )
+        with mock.patch.object(contagens, 'recalcular') as refazer:
+            montado.save()
+            adiado = Produto.objects.only('nome').get(pk=produto.pk)
+            adiado.nome = 'Renomeado'
+            adiado.save()
+        refazer.assert_not_called()
+        self.assertContagensCorretas()
+
+    def test_totais_exatos_e_estimados(self):
+        criar_produtos(60)
+        self.assertEqual(contar(), (60, True))
+        self.assertEqual(
+            contar(FILTRO_RISCO), (Produto.objects.filter(**FILTRO_RISCO).count(), True)
+        )
+        resposta = self.client.get('/api/produtos/risco/')
+        self.assertEqual(resposta['X-Total-Count'], str(len(resposta.json())))
+        self.assertEqual(resposta['X-Total-Count-Exato'], 'true')
+
+        # Filtros fora da combinação: a amostra cobre o catálogo, então o total é exato
+        filtro = {'status_anvisa': 'aprovado', 'nome__endswith': '7'}
+        self.assertEqual(contar(filtro), (Produto.objects.filter(**filtro).count(), True))
+
+        resposta = self.client.head('/api/produtos/')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta['X-Total-Count'], '60')
+
+    @mock.patch.object(contagens, 'TAMANHO_AMOSTRA', 1000)
+    def test_estimativa_por_amostra(self):
+        criar_produtos(12000)
+        # Padrões periódicos nos nomes (período 10) e em blocos de ids (cbd, 500 a cada 2000)
+        for filtro in ({'nome__endswith': '3'}, {'cbd_percentual__lt': 5}, {'nome__contains': 'teste 11'}):
+            with self.subTest(filtro=filtro):
+                exato = Produto.objects.filter(**filtro).count()
+                with self.assertNumQueries(4):
+                    estimado, eh_exato = contar(filtro)
+                self.assertFalse(eh_exato)
+                self.assertLess(abs(estimado - exato), 0.15 * exato)
+                # Mesma amostra enquanto o catálogo não muda
+                self.assertEqual(contar(filtro), (estimado, False))
+
+        consulta = Produto.objects.filter(nome__endswith='3')
+        estimado, eh_exato = contar({}, consulta)
+        self.assertFalse(eh_exato)
+        self.assertLess(abs(estimado - consulta.count()), 0.15 * consulta.count())
+
+    @mock.patch.object(contagens, 'TAMANHO_AMOSTRA', 1000)
+    def test_amostra_grande_demais_conta_tudo(self):
+        criar_produtos(12000)
+        # 4000 aprovados: a amostra sortearia 3000 dos 12000 ids, mais que contar tudo
+        filtro = {'status_anvisa': 'aprovado', 'nome__endswith': '7'}
+        self.assertEqual(contar(filtro), (Produto.objects.filter(**filtro).count(), True))
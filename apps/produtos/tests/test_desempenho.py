@@ -0,0 +1,234 @@
+"""
+Testes de regressão de desempenho da API e das páginas de produtos.
+
+- `ConsultasConstantesTests` fixa a quantidade de consultas SQL de cada
+  endpoint e confere que ela não cresce com o número de produtos (N+1).
+- `OrcamentoSerializacaoTests` mede a serialização e a renderização da
+  listagem e compara com a referência gravada em `referencia_desempenho.json`,
+  com uma tolerância.
+
+Os tempos dependem da máquina, então as medições só rodam com
+`MEDIR_DESEMPENHO=1` (ex.: na máquina em que a referência foi gravada).
+Para regravar a referência depois de uma mudança intencional (ou em outra
+máquina), rode com `ATUALIZAR_REFERENCIA_DESEMPENHO=1`; a tolerância pode
+ser ajustada com `TOLERANCIA_DESEMPENHO` (padrão: a gravada na referência).
+"""
+import json
+import os
+import time
+import unittest
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+
+from ..catalogo import versao_atual
+from ..duplicados import indice_nomes
+from ..models import Produto
+from ..renderers import CBORRenderer
+from ..serializers import ProdutoSerializer
+from ..similares import indice_similares
+from .auxiliares import criar_produtos, descartar_caches
+
+# Tamanhos do catálogo em que as consultas de cada endpoint são contadas
+QUANTIDADES_CATALOGO = (20, 600)
+
+# Produtos serializados nas medições de tempo
+PRODUTOS_ORCAMENTO = 2000
+
+# Repetições de cada medição (vale o menor tempo, o menos sujeito a ruído)
+REPETICOES_ORCAMENTO = 5
+
+ARQUIVO_REFERENCIA = Path(__file__).resolve().parent.parent / 'referencia_desempenho.json'
+
+ATUALIZAR_REFERENCIA = os.environ.get('ATUALIZAR_REFERENCIA_DESEMPENHO') == '1'
+
+MEDIR_DESEMPENHO = ATUALIZAR_REFERENCIA or os.environ.get('MEDIR_DESEMPENHO') == '1'
+
+
+class ConsultasConstantesTests(TestCase):
+    """
+    Quantidade de consultas SQL por requisição, independente do tamanho do catálogo.
+    """
+
+    def assertConsultasConstantes(self, esperadas, requisicao, aquecer=False):
+        """
+        Confere que `requisicao` faz exatamente `esperadas` consultas em cada
+        tamanho de `QUANTIDADES_CATALOGO`.
+
+        Com `aquecer`, uma requisição idêntica é feita antes da medida, para
+        contar o caso comum (índices em memória já carregados), ou, se for
+        uma função, ela é chamada no lugar dessa requisição.
+        """
+        for quantidade in QUANTIDADES_CATALOGO:
+            with self.subTest(produtos=quantidade):
+                criar_produtos(quantidade - Produto.objects.count())
+                descartar_caches()
+                if callable(aquecer):
+                    aquecer()
+                elif aquecer:
+                    requisicao()
+                with CaptureQueriesContext(connection) as consultas:
+                    resposta = requisicao()
+                self.assertLess(resposta.status_code, 400)
+                self.assertEqual(
+                    len(consultas), esperadas,
+                    f"{len(consultas)} consultas com {quantidade} produtos, esperadas {esperadas}:\n"
+                    + '\n'.join(consulta['sql'] for consulta in consultas.captured_queries),
+                )
+
+    def test_listagem(self):
+        # versão do catálogo (ETag) + produtos + total (X-Total-Count)
+        self.assertConsultasConstantes(3, lambda: self.client.get('/api/produtos/'))
+
+    def test_listagem_com_arquivados(self):
+        # versão + produtos ativos + arquivados
+        self.assertConsultasConstantes(
+            3, lambda: self.client.get('/api/produtos/', {'incluir_arquivados': 'true'})
+        )
+
+    def test_criacao(self):
+        numero = iter(range(10 ** 6))
+
+        def criar():
+            return self.client.post('/api/produtos/', {
+                'nome': f'Óleo CBD Premium {next(numero)}',
+                'tipo_espectro': 'hibrida',
+                'thc_percentual': '0.20',
+                'cbd_percentual': '10.00',
+                'categoria_terapeutica': 'neurologia',
+                'status_anvisa': 'pendente',
+            }, content_type='application/json')
+
+        def aquecer():
+            # Como no aquecimento do worker: o índice de nomes é carregado fora da requisição
+            criar()
+            indice_nomes.sincronizar(versao_atual().versao)
+
+        # savepoint + produto + histórico + contagem + versão, e a sincronização
+        # incremental do índice de nomes (versão, registros pendentes e só o produto criado)
+        self.assertConsultasConstantes(10, criar, aquecer=aquecer)
+
+    def test_detalhe(self):
+        criar_produtos(1)
+        url = f'/api/produtos/{Produto.objects.get().pk}/'
+        # última modificação (ETag) + produto
+        self.assertConsultasConstantes(2, lambda: self.client.get(url))
+
+    def test_risco(self):
+        # versão + produtos + total
+        self.assertConsultasConstantes(3, lambda: self.client.get('/api/produtos/risco/'))
+
+    def test_similares(self):
+        criar_produtos(1)
+        url = f'/api/produtos/{Produto.objects.get().pk}/similares/'
+        requisicao = lambda: self.client.get(url)
+
+        def aquecer():
+            # Como no aquecimento do worker: o índice é carregado fora da requisição
+            indice_similares.sincronizar(versao_atual().versao)
+            requisicao()
+
+        # versão + vizinhos; o índice já está em memória
+        self.assertConsultasConstantes(2, requisicao, aquecer=aquecer)
+        # sem o índice: versão + produto consultado + vizinhos no banco + vizinhos
+        self.assertConsultasConstantes(4, requisicao, aquecer=True)
+
+    def test_analise(self):
+        # versão; o instantâneo já está em memória
+        self.assertConsultasConstantes(1, lambda: self.client.get('/api/produtos/analise/'), aquecer=True)
+
+    def test_pagina_inicial(self):
+        # versão + primeira página + total de risco (fragmento fora do cache)
+        self.assertConsultasConstantes(3, lambda: self.client.get('/'))
+
+    def test_pagina_inicial_em_cache(self):
+        # só a versão: o fragmento da tabela vem do cache
+        self.assertConsultasConstantes(1, lambda: self.client.get('/'), aquecer=True)
+
+    def test_cadastro(self):
+        self.assertConsultasConstantes(0, lambda: self.client.get('/cadastro/'))
+
+    def test_changelist_admin(self):
+        administrador = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'senha')
+        self.client.force_login(administrador)
+        # sessão + usuário + total (tabela de contagens) + página de produtos
+        self.assertConsultasConstantes(4, lambda: self.client.get('/admin/produtos/produto/'))
+
+
+@unittest.skipUnless(MEDIR_DESEMPENHO, "Medições de tempo desligadas; rode com MEDIR_DESEMPENHO=1.")
+class OrcamentoSerializacaoTests(TestCase):
+    """
+    Tempo de serialização e renderização da listagem, comparado com a referência.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        criar_produtos(PRODUTOS_ORCAMENTO)
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.atualizar = ATUALIZAR_REFERENCIA
+        cls.referencia = {'tolerancia': 2.0, 'orcamentos_ms': {}}
+        if ARQUIVO_REFERENCIA.exists():
+            cls.referencia = json.loads(ARQUIVO_REFERENCIA.read_text(encoding='utf-8'))
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.atualizar:
+            cls.referencia['produtos'] = PRODUTOS_ORCAMENTO
+            ARQUIVO_REFERENCIA.write_text(
+                json.dumps(cls.referencia, indent=2, sort_keys=True) + '\n', encoding='utf-8'
+            )
+        super().tearDownClass()
+
+    def setUp(self):
+        self.produtos = list(Produto.objects.all())
+
+    def assertDentroDoOrcamento(self, nome, operacao):
+        """
+        Mede `operacao` e confere que o menor tempo está dentro da referência
+        multiplicada pela tolerância (ou grava a medida como nova referência).
+        """
+        operacao()  # aquecimento: caches de campos, imports tardios
+        tempos = []
+        for _ in range(REPETICOES_ORCAMENTO):
+            inicio = time.perf_counter()
+            operacao()
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        medido = min(tempos)
+
+        orcamentos = self.referencia['orcamentos_ms']
+        if self.atualizar:
+            orcamentos[nome] = round(medido, 1)
+            return
+        if nome not in orcamentos:
+            self.skipTest(f"Sem referência para '{nome}'; rode com ATUALIZAR_REFERENCIA_DESEMPENHO=1.")
+
+        tolerancia = float(os.environ.get('TOLERANCIA_DESEMPENHO', self.referencia['tolerancia']))
+        limite = orcamentos[nome] * tolerancia
+        self.assertLessEqual(
+            medido, limite,
+            f"'{nome}' levou {medido:.1f}ms para {len(self.produtos)} produtos; "
+            f"referência {orcamentos[nome]}ms x {tolerancia} = {limite:.1f}ms",
+        )
+
+    def _dados(self, decimal_nativo=False):
+        return ProdutoSerializer(
+            self.produtos, many=True, context={'decimal_nativo': decimal_nativo}
+        ).data
+
+    def test_serializacao(self):
+        self.assertDentroDoOrcamento('serializacao', self._dados)
+
+    def test_renderizacao_json(self):
+        dados = self._dados()
+        self.assertDentroDoOrcamento('renderizacao_json', lambda: JSONRenderer().render(dados))
+
+    def test_renderizacao_cbor(self):
+        dados = self._dados(decimal_nativo=True)
+        self.assertDentroDoOrcamento('renderizacao_cbor', lambda: CBORRenderer().render(dados))
@@ -0,0 +1,217 @@
+import itertools
+import random
+from io import StringIO
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase
+
+from ..catalogo import versao_atual
+from ..duplicados import (
+    LIMIAR_SIMILARIDADE,
+    IndiceNomes,
+    agrupar_duplicados,
+    indice_nomes,
+    normalizar,
+    possiveis_duplicados,
+    similaridade,
+    trigramas,
+)
+from ..models import Produto
+from .auxiliares import criar_produtos, descartar_caches
+
+MARCAS = ['Premium', 'Gold', 'Vita', 'Natura', 'Pure', 'Calm', 'Relief', 'Balance', 'Harmonia', 'Serena']
+FORMAS = ['Óleo', 'Cápsula', 'Creme', 'Spray', 'Gotas']
+ATIVOS = ['CBD', 'THC', 'CBG', 'Full Spectrum', 'Isolado']
+
+
+def _nomes(quantidade, semente):
+    aleatorio = random.Random(semente)
+    return {
+        produto_id: ' '.join([
+            aleatorio.choice(FORMAS), aleatorio.choice(ATIVOS), aleatorio.choice(MARCAS),
+            f'{aleatorio.choice([5, 10, 20, 30])}%',
+        ])
+        for produto_id in range(1, quantidade + 1)
+    }
+
+
+def _errar(nome, aleatorio):
+    """
+    Uma variação do nome com um erro de digitação (troca de uma letra).
+    """
+    posicao = aleatorio.randrange(len(nome))
+    return nome[:posicao] + aleatorio.choice('aeiou') + nome[posicao + 1:]
+
+
+class SimilaridadeTests(SimpleTestCase):
+    """
+    Normalização e Jaccard de trigramas.
+    """
+
+    def test_normalizacao(self):
+        self.assertEqual(normalizar('  Óleo  CBD-Premium 10%!'), 'oleo cbd premium 10')
+        self.assertEqual(trigramas('Óleo CBD Premium'), trigramas('oleo cbd   PREMIUM'))
+        self.assertEqual(trigramas('!!!'), frozenset())
+        self.assertIn('  c', trigramas('CBD'))
+
+    def test_limiar(self):
+        original = trigramas('Óleo CBD Premium')
+        self.assertEqual(similaridade(original, trigramas('Oleo CBD  premium')), 1.0)
+        self.assertGreaterEqual(similaridade(original, trigramas('Óleo CBD Premiun')), LIMIAR_SIMILARIDADE)
+        self.assertLess(similaridade(original, trigramas('Óleo CBD Gold')), LIMIAR_SIMILARIDADE)
+        self.assertEqual(similaridade(original, frozenset()), 0.0)
+
+    def test_limiar_inclusivo_na_busca(self):
+        indice = IndiceNomes()
+        indice.inserir(1, 'Óleo CBD Premiun')
+        valor = similaridade(trigramas('Óleo CBD Premium'), trigramas('Óleo CBD Premiun'))
+        self.assertEqual([item['id'] for item in indice.buscar('Óleo CBD Premium', limiar=valor)], [1])
+        self.assertEqual(indice.buscar('Óleo CBD Premium', limiar=valor + 0.001), [])
+
+
+class IndiceNomesTests(SimpleTestCase):
+    """
+    A filtragem por prefixo encontra os mesmos nomes que comparar com todos.
+    """
+
+    def test_filtragem_por_prefixo_igual_a_forca_bruta(self):
+        nomes = _nomes(400, semente=37)
+        indice = IndiceNomes()
+        for produto_id, nome in nomes.items():
+            indice.inserir(produto_id, nome)
+
+        consultas = list(nomes.values())[:40] + ['Oleo CBD Premiun 10', 'Spray Isolado', 'Creme']
+        for limiar in (0.4, LIMIAR_SIMILARIDADE, 0.8):
+            for consulta in consultas:
+                with self.subTest(limiar=limiar, consulta=consulta):
+                    conjunto = trigramas(consulta)
+                    esperados = {
+                        produto_id for produto_id, nome in nomes.items()
+                        if similaridade(conjunto, trigramas(nome)) >= limiar
+                    }
+                    encontrados = indice.buscar(consulta, limiar=limiar, limite=len(nomes))
+                    self.assertEqual({item['id'] for item in encontrados}, esperados)
+                    similaridades = [item['similaridade'] for item in encontrados]
+                    self.assertEqual(similaridades, sorted(similaridades, reverse=True))
+
+    def test_remocao_e_renomeacao(self):
+        indice = IndiceNomes()
+        indice.inserir(1, 'Óleo CBD Premium')
+        indice.inserir(2, 'Óleo CBD Premiun')
+        indice.inserir(2, 'Creme THC Gold')
+        self.assertEqual(indice.buscar('Óleo CBD Premium', excluir=1), [])
+        indice.remover(1)
+        self.assertEqual(indice.buscar('Óleo CBD Premium'), [])
+        self.assertEqual(len(indice), 1)
+
+
+class AgruparDuplicadosTests(SimpleTestCase):
+    """
+    Agrupamento por MinHash/LSH comparado ao agrupamento exato de todos os pares.
+    """
+
+    def test_grupos_de_variacoes(self):
+        aleatorio = random.Random(12)
+        bases = [
+            'Óleo CBD Premium Harmonia 10%', 'Cápsula Full Spectrum Serena 30mg',
+            'Creme Canabidiol Relief Intensivo', 'Spray Sublingual Isolado Calm',
+            'Gotas Pediátricas Natura CBG', 'Pomada Dermatológica Balance',
+        ]
+        nomes = []
+        grupos_esperados = []
+        for base in bases:
+            grupo = []
+            for _ in range(aleatorio.randint(2, 5)):
+                nomes.append((len(nomes) + 1, _errar(base, aleatorio)))
+                grupo.append(len(nomes))
+            grupos_esperados.append(grupo)
+        # Nomes sem relação, que não devem se juntar a nenhum grupo
+        for _ in range(300):
+            nomes.append((len(nomes) + 1, ''.join(aleatorio.choice('bcdfgjklmnpqrstvxz') for _ in range(18))))
+
+        esperado = self._agrupar_exato(nomes)
+        self.assertEqual(sorted(esperado), sorted(grupos_esperados))
+        self.assertEqual(agrupar_duplicados(nomes), esperado)
+
+    def test_sem_grupos(self):
+        self.assertEqual(agrupar_duplicados([]), [])
+        self.assertEqual(agrupar_duplicados([(1, 'Óleo CBD'), (2, 'Creme THC'), (3, '%%%')]), [])
+
+    @staticmethod
+    def _agrupar_exato(nomes):
+        conjuntos = {produto_id: trigramas(nome) for produto_id, nome in nomes}
+        pais = {produto_id: produto_id for produto_id in conjuntos}
+
+        def raiz(produto_id):
+            while pais[produto_id] != produto_id:
+                produto_id = pais[produto_id]
+            return produto_id
+
+        for a, b in itertools.combinations(conjuntos, 2):
+            if similaridade(conjuntos[a], conjuntos[b]) >= LIMIAR_SIMILARIDADE:
+                pais[raiz(b)] = raiz(a)
+        grupos = {}
+        for produto_id in conjuntos:
+            grupos.setdefault(raiz(produto_id), []).append(produto_id)
+        return sorted(
+            (sorted(grupo) for grupo in grupos.values() if len(grupo) > 1),
+            key=lambda grupo: (-len(grupo), grupo[0]),
+        )
+
+
+class PossiveisDuplicadosTests(TestCase):
+    """
+    A criação de produtos não carrega o índice de nomes inteiro.
+    """
+
+    def setUp(self):
+        criar_produtos(30)
+        descartar_caches()
+
+    def _criar(self, nome):
+        return Produto.objects.create(
+            nome=nome,
+            tipo_espectro='hibrida',
+            thc_percentual='0.20',
+            cbd_percentual='10.00',
+            categoria_terapeutica='neurologia',
+            status_anvisa='pendente',
+        )
+
+    def test_indice_nao_carregado_nao_e_reconstruido_na_requisicao(self):
+        with mock.patch.object(IndiceNomes, '_reconstruir') as reconstruir:
+            self.assertIsNone(possiveis_duplicados(self._criar('Óleo CBD Premium')))
+        reconstruir.assert_not_called()
+
+    def test_indice_carregado_e_sincronizado_incrementalmente(self):
+        original = self._criar('Óleo CBD Premium')
+        indice_nomes.sincronizar(versao_atual().versao)
+
+        with mock.patch.object(IndiceNomes, '_reconstruir') as reconstruir, \
+                mock.patch('apps.produtos.indices.LIMITE_SINCRONIZACAO_INCREMENTAL', 0):
+            duplicados = possiveis_duplicados(self._criar('Oleo CBD Premiun'))
+        reconstruir.assert_not_called()
+        self.assertEqual([item['id'] for item in duplicados], [original.pk])
+
+
+class AgruparDuplicadosComandoTests(TestCase):
+    """
+    `manage.py agrupar_duplicados`.
+    """
+
+    def test_lista_os_grupos(self):
+        for nome in ('Óleo CBD Premium', 'Oleo CBD Premiun', 'Creme THC Gold'):
+            Produto.objects.create(
+                nome=nome, tipo_espectro='hibrida', thc_percentual='0.20', cbd_percentual='10.00',
+                categoria_terapeutica='neurologia', status_anvisa='pendente',
+            )
+        saida = StringIO()
+        call_command('agrupar_duplicados', stdout=saida)
+        self.assertIn("Grupo 1 (2 produtos):", saida.getvalue())
+        self.assertIn("1 grupo(s) com 2 produto(s) entre 3", saida.getvalue())
+
+    def test_limiar_invalido(self):
+        for limiar in ('0', '1.5', '-0.2'):
+            with self.subTest(limiar=limiar), self.assertRaisesMessage(CommandError, "entre 0 e 1"):
+                call_command('agrupar_duplicados', '--limiar', limiar, stdout=StringIO())
@@ -0,0 +1,116 @@
+import gzip
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.http import Http404
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.utils.http import http_date
+
+from ..estaticos import CACHE_IMUTAVEL, CACHE_REVALIDAR, servir_estatico
+
+CONTEUDO = b'body { color: #333; }\n' * 40
+
+
+class ServirEstaticoTests(SimpleTestCase):
+    """
+    Negociação de gzip e cabeçalhos de cache dos arquivos estáticos.
+    """
+
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        for nome in ('app.0123456789ab.css', 'app.css'):
+            caminho = os.path.join(diretorio.name, nome)
+            with open(caminho, 'wb') as arquivo:
+                arquivo.write(CONTEUDO)
+            with open(f'{caminho}.gz', 'wb') as arquivo:
+                arquivo.write(gzip.compress(CONTEUDO, mtime=0))
+        configuracao = override_settings(STATIC_ROOT=diretorio.name)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        self.fabrica = RequestFactory()
+
+    def _servir(self, caminho, **cabecalhos):
+        resposta = servir_estatico(self.fabrica.get(f'/static/{caminho}', **cabecalhos), caminho)
+        self.addCleanup(resposta.close)
+        return resposta
+
+    def _corpo(self, resposta):
+        return b''.join(resposta.streaming_content)
+
+    def test_negociacao_do_gzip(self):
+        casos = [
+            ('gzip, deflate, br', True),
+            ('gzip;q=0.5', True),
+            ('*', True),
+            ('gzip;q=0', False),
+            ('gzip; q=0.000, br', False),
+            ('*;q=0.8, gzip;q=0', False),
+            ('deflate, br', False),
+            ('', False),
+        ]
+        for aceito, gzip_esperado in casos:
+            with self.subTest(accept_encoding=aceito):
+                resposta = self._servir('app.0123456789ab.css', HTTP_ACCEPT_ENCODING=aceito)
+                self.assertEqual(resposta.get('Content-Encoding') == 'gzip', gzip_esperado)
+                corpo = self._corpo(resposta)
+                self.assertEqual(gzip.decompress(corpo) if gzip_esperado else corpo, CONTEUDO)
+                self.assertEqual(resposta['Content-Type'], 'text/css')
+
+    def test_vary_e_sem_content_disposition(self):
+        for aceito in ('gzip', 'identity'):
+            with self.subTest(accept_encoding=aceito):
+                resposta = self._servir('app.0123456789ab.css', HTTP_ACCEPT_ENCODING=aceito)
+                self.assertIn('Accept-Encoding', resposta['Vary'])
+                self.assertNotIn('Content-Disposition', resposta)
+
+    def test_cache_imutavel_so_para_nomes_com_hash(self):
+        self.assertEqual(self._servir('app.0123456789ab.css')['Cache-Control'], CACHE_IMUTAVEL)
+        sem_hash = self._servir('app.css')
+        self.assertEqual(sem_hash['Cache-Control'], CACHE_REVALIDAR)
+
+        nao_modificado = self._servir('app.css', HTTP_IF_MODIFIED_SINCE=sem_hash['Last-Modified'])
+        self.assertEqual(nao_modificado.status_code, 304)
+        # Nomes com hash não revalidam: o conteúdo de uma URL nunca muda
+        self.assertEqual(
+            self._servir('app.0123456789ab.css', HTTP_IF_MODIFIED_SINCE=http_date()).status_code, 200
+        )
+
+    def test_variantes_gz_e_caminhos_invalidos(self):
+        for caminho in ('app.css.gz', 'nao-existe.css', '../settings.py'):
+            with self.subTest(caminho=caminho), self.assertRaises(Http404):
+                servir_estatico(self.fabrica.get('/static/x'), caminho)
+
+
+@override_settings(DEBUG=False)
+class ManifestGzipStaticFilesStorageTests(SimpleTestCase):
+    """
+    URLs do `{% static %}` com e sem o manifesto do `collectstatic`.
+    """
+
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        self.static_root = diretorio.name
+        configuracao = override_settings(STATIC_ROOT=self.static_root)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    def _static(self, caminho):
+        return Template('{% load static %}{% static caminho %}').render(Context({'caminho': caminho}))
+
+    def test_sem_manifesto_usa_o_nome_original(self):
+        self.assertEqual(self._static('produtos/css/styles.css'), '/static/produtos/css/styles.css')
+        self.assertEqual(self._static('produtos/nao-existe.js'), '/static/produtos/nao-existe.js')
+
+    def test_collectstatic_gera_nomes_com_hash_e_gz(self):
+        call_command('collectstatic', interactive=False, verbosity=0)
+        # O storage carrega o manifesto ao ser criado
+        with override_settings(STATIC_ROOT=self.static_root):
+            url = self._static('produtos/css/styles.css')
+            self.assertRegex(url, r'^/static/produtos/css/styles\.[0-9a-f]{12}\.css$')
+            self.assertTrue(os.path.isfile(os.path.join(self.static_root, url.removeprefix('/static/'))))
+            self.assertTrue(os.path.isfile(os.path.join(self.static_root, url.removeprefix('/static/') + '.gz')))
+            self.assertEqual(self._static('produtos/nao-existe.js'), '/static/produtos/nao-existe.js')
@@ -0,0 +1,123 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from ..historico import HistoricoExtenso, estados_em, produto_em, produtos_em
+from ..models import HistoricoProduto, Produto
+
+DADOS = {
+    'nome': 'Óleo CBD 10%',
+    'tipo_espectro': 'sativa',
+    'thc_percentual': Decimal('0.20'),
+    'cbd_percentual': Decimal('10.00'),
+    'categoria_terapeutica': 'neurologia',
+    'status_anvisa': 'pendente',
+}
+
+
+class HistoricoTests(TestCase):
+    """
+    Registro do histórico e reconstrução dos produtos em um momento.
+    """
+
+    def test_reconstrucao_em_um_momento(self):
+        produto = Produto.objects.create(**DADOS)
+        criado = timezone.now()
+        produto.status_anvisa = 'aprovado'
+        produto.thc_percentual = Decimal('0.50')
+        produto.save()
+        alterado = timezone.now()
+
+        antes = produto_em(produto.pk, criado)
+        self.assertEqual(antes.status_anvisa, 'pendente')
+        self.assertEqual(antes.thc_percentual, Decimal('0.20'))
+        self.assertEqual(antes.nome, DADOS['nome'])
+        depois = produto_em(produto.pk, alterado)
+        self.assertEqual(depois.status_anvisa, 'aprovado')
+        self.assertEqual(depois.thc_percentual, Decimal('0.50'))
+        self.assertEqual(depois.data_criacao, produto.data_criacao)
+        self.assertIsNone(produto_em(produto.pk, produto.data_criacao - timedelta(seconds=1)))
+
+        self.assertEqual([item.pk for item in produtos_em(criado)], [produto.pk])
+
+    def test_alteracao_registra_so_os_campos_alterados(self):
+        produto = Produto.objects.create(**DADOS)
+        produto.status_anvisa = 'aprovado'
+        produto.save()
+        # Salvar sem mudanças não gera registro
+        produto.save()
+
+        registros = list(HistoricoProduto.objects.filter(produto_id=produto.pk))
+        self.assertEqual([registro.operacao for registro in registros], ['criacao', 'alteracao'])
+        self.assertEqual(set(registros[0].alteracoes), {*DADOS, 'data_criacao'})
+        self.assertEqual(registros[1].alteracoes, {'status_anvisa': 'aprovado'})
+
+    def test_exclusao_e_recriacao_com_o_mesmo_id(self):
+        produto = Produto.objects.create(**DADOS)
+        existia = timezone.now()
+        pk = produto.pk
+        produto.delete()
+        excluido = timezone.now()
+        Produto.objects.create(id=pk, **{**DADOS, 'nome': 'Recriado', 'status_anvisa': 'aprovado'})
+        recriado = timezone.now()
+
+        self.assertEqual(produto_em(pk, existia).nome, DADOS['nome'])
+        self.assertIsNone(produto_em(pk, excluido))
+        self.assertEqual(produtos_em(excluido), [])
+        # A recriação parte de um estado novo, sem herdar os campos anteriores
+        self.assertEqual(estados_em(recriado)[pk]['nome'], 'Recriado')
+        self.assertEqual(produto_em(pk, recriado).status_anvisa, 'aprovado')
+
+    def test_listagem_limitada_pelo_numero_de_registros(self):
+        for indice in range(3):
+            Produto.objects.create(**{**DADOS, 'nome': f'Produto {indice}'})
+        agora = timezone.now()
+
+        with override_settings(HISTORICO={'LIMITE_REGISTROS_LISTAGEM': 2}):
+            with self.assertRaises(HistoricoExtenso):
+                estados_em(agora)
+            # O detalhe lê só o histórico do produto e não é limitado
+            self.assertEqual(len(estados_em(agora, [Produto.objects.first().pk])), 1)
+            resposta = self.client.get('/api/produtos/', {'as_of': agora.isoformat()})
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn('as_of', resposta.json())
+
+
+class MigracaoHistoricoTests(TransactionTestCase):
+    """
+    A migração 0003 registra a criação dos produtos existentes.
+    """
+    antes = [('produtos', '0002_versao_catalogo')]
+    depois = [('produtos', '0003_historico_produto')]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_registra_os_produtos_existentes(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.antes)
+        ProdutoAntigo = executor.loader.project_state(self.antes).apps.get_model('produtos', 'Produto')
+        produto = ProdutoAntigo.objects.create(**DADOS)
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.depois)
+        HistoricoAntigo = executor.loader.project_state(self.depois).apps.get_model('produtos', 'HistoricoProduto')
+
+        registro = HistoricoAntigo.objects.get(produto_id=produto.pk)
+        self.assertEqual(registro.operacao, 'criacao')
+        self.assertEqual(registro.momento, produto.data_criacao)
+        self.assertEqual(registro.alteracoes, {
+            'nome': DADOS['nome'],
+            'tipo_espectro': 'sativa',
+            'thc_percentual': '0.20',
+            'cbd_percentual': '10.00',
+            'categoria_terapeutica': 'neurologia',
+            'status_anvisa': 'pendente',
+            'data_criacao': produto.data_criacao.isoformat(),
+        })
@@ -0,0 +1,257 @@
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import APIException
+
+from .. import idempotencia
+from ..idempotencia import limpar_expiradas
+from ..models import ChaveIdempotencia, HistoricoProduto, Produto, Tarefa
+from ..serializers import ProdutoSerializer
+from .auxiliares import criar_produtos
+
+PRODUTO = {
+    'nome': 'Óleo CBD Premium',
+    'tipo_espectro': 'hibrida',
+    'thc_percentual': '0.20',
+    'cbd_percentual': '10.00',
+    'categoria_terapeutica': 'neurologia',
+    'status_anvisa': 'pendente',
+}
+
+
+def _criar(cliente, chave, **extra):
+    return cliente.post(
+        '/api/produtos/', PRODUTO, content_type='application/json', HTTP_IDEMPOTENCY_KEY=chave, **extra
+    )
+
+
+class IdempotenciaTests(TestCase):
+    """
+    Repetições de POST com a mesma `Idempotency-Key`.
+    """
+
+    def criar(self, chave, **alteracoes):
+        return self.client.post(
+            '/api/produtos/', {**PRODUTO, **alteracoes},
+            content_type='application/json', HTTP_IDEMPOTENCY_KEY=chave,
+        )
+
+    def test_repeticao_devolve_resposta_guardada_sem_escrever(self):
+        primeira = self.criar('pedido-1')
+        with CaptureQueriesContext(connection) as consultas:
+            repeticao = self.criar('pedido-1')
+        self.assertEqual(repeticao.status_code, 201)
+        self.assertEqual(repeticao['Idempotency-Replayed'], 'true')
+        self.assertEqual(repeticao.content, primeira.content)
+        self.assertEqual(Produto.objects.count(), 1)
+        self.assertFalse([
+            consulta for consulta in consultas.captured_queries
+            if consulta['sql'].startswith(('UPDATE', 'DELETE'))
+            or (consulta['sql'].startswith('INSERT') and 'produtos_produto' in consulta['sql'])
+        ])
+
+    def test_chave_reutilizada_com_outro_corpo(self):
+        self.criar('pedido-1')
+        self.assertEqual(self.criar('pedido-1', nome='Outro produto').status_code, 422)
+        self.assertEqual(Produto.objects.count(), 1)
+
+    @override_settings(IDEMPOTENCIA={'ESPERA_MAXIMA': 0.1})
+    def test_primeira_ainda_em_execucao_apos_a_espera_maxima(self):
+        self.criar('pedido-1')
+        # Como se a primeira ainda não tivesse terminado
+        ChaveIdempotencia.objects.update(status_resposta=None, data_criacao=timezone.now())
+
+        resposta = self.criar('pedido-1')
+        self.assertEqual(resposta.status_code, 409)
+        self.assertEqual(resposta['Retry-After'], '1')
+        self.assertEqual(Produto.objects.count(), 1)
+
+    def test_chave_abandonada_e_assumida(self):
+        self.criar('pedido-1')
+        # O processo da primeira morreu antes de gravar o produto e a resposta
+        Produto.objects.all().delete()
+        ChaveIdempotencia.objects.update(
+            status_resposta=None, data_criacao=timezone.now() - timedelta(seconds=61)
+        )
+
+        resposta = self.criar('pedido-1')
+        self.assertEqual(resposta.status_code, 201)
+        self.assertNotIn('Idempotency-Replayed', resposta)
+        self.assertEqual(Produto.objects.count(), 1)
+        self.assertEqual(self.criar('pedido-1')['Idempotency-Replayed'], 'true')
+
+    def test_chave_expirada_e_assumida(self):
+        self.criar('pedido-1')
+        ChaveIdempotencia.objects.update(expira_em=timezone.now() - timedelta(seconds=1))
+
+        resposta = self.criar('pedido-1')
+        self.assertEqual(resposta.status_code, 201)
+        self.assertNotIn('Idempotency-Replayed', resposta)
+        self.assertEqual(Produto.objects.count(), 2)
+        self.assertGreater(ChaveIdempotencia.objects.get().expira_em, timezone.now())
+
+    def test_clientes_diferentes_nao_compartilham_a_chave(self):
+        usuarios = [
+            get_user_model().objects.create_user(username=nome, password='senha') for nome in ('ana', 'bia')
+        ]
+        clientes = []
+        for usuario in usuarios:
+            cliente = Client()
+            cliente.force_login(usuario)
+            clientes.append(cliente)
+
+        for cliente in clientes:
+            self.assertNotIn('Idempotency-Replayed', _criar(cliente, 'pedido-1'))
+        # O mesmo usuário, de outro endereço, repete a própria requisição
+        self.assertEqual(_criar(clientes[0], 'pedido-1', REMOTE_ADDR='10.0.0.9')['Idempotency-Replayed'], 'true')
+
+        # Anônimos: pela credencial enviada ou, sem ela, pelo endereço
+        for extra in (
+            {'REMOTE_ADDR': '10.0.0.1'}, {'REMOTE_ADDR': '10.0.0.2'},
+            {'REMOTE_ADDR': '10.0.0.2', 'HTTP_AUTHORIZATION': 'Token abc'},
+        ):
+            with self.subTest(**extra):
+                self.assertNotIn('Idempotency-Replayed', _criar(self.client, 'pedido-1', **extra))
+        self.assertEqual(
+            _criar(self.client, 'pedido-1', REMOTE_ADDR='10.0.0.3', HTTP_AUTHORIZATION='Token abc')
+            ['Idempotency-Replayed'],
+            'true',
+        )
+        self.assertEqual(Produto.objects.count(), 5)
+
+
+class EndpointsIdempotentesTests(TestCase):
+    """
+    Transição em lote e tarefas com `Idempotency-Key`.
+    """
+
+    def setUp(self):
+        criar_produtos(6)
+
+    def test_transicao_em_lote(self):
+        corpo = {'status_anvisa': 'reprovado', 'ids': list(Produto.objects.values_list('pk', flat=True))}
+        primeira = self.client.post(
+            '/api/produtos/status/', corpo, content_type='application/json', HTTP_IDEMPOTENCY_KEY='lote-1'
+        )
+        self.assertEqual(primeira.status_code, 200)
+        historico = HistoricoProduto.objects.count()
+
+        repeticao = self.client.post(
+            '/api/produtos/status/', corpo, content_type='application/json', HTTP_IDEMPOTENCY_KEY='lote-1'
+        )
+        self.assertEqual(repeticao['Idempotency-Replayed'], 'true')
+        self.assertEqual(repeticao.content, primeira.content)
+        self.assertEqual(HistoricoProduto.objects.count(), historico)
+
+    def test_tarefas(self):
+        primeira = self.client.post('/api/tarefas/', {'tipo': 'auditoria'}, HTTP_IDEMPOTENCY_KEY='tarefa-1')
+        self.assertEqual(primeira.status_code, 202)
+        repeticao = self.client.post('/api/tarefas/', {'tipo': 'auditoria'}, HTTP_IDEMPOTENCY_KEY='tarefa-1')
+        self.assertEqual(repeticao['Idempotency-Replayed'], 'true')
+        self.assertEqual(repeticao['Location'], primeira['Location'])
+        self.assertEqual(Tarefa.objects.count(), 1)
+
+    def test_erro_libera_a_chave(self):
+        with mock.patch('apps.produtos.views.enfileirar', side_effect=APIException()):
+            resposta = self.client.post('/api/tarefas/', {'tipo': 'auditoria'}, HTTP_IDEMPOTENCY_KEY='tarefa-1')
+        self.assertEqual(resposta.status_code, 500)
+        self.assertFalse(ChaveIdempotencia.objects.exists())
+
+        with mock.patch('apps.produtos.views.enfileirar', side_effect=RuntimeError("falha simulada")), \
+                self.assertRaises(RuntimeError):
+            self.client.post('/api/tarefas/', {'tipo': 'auditoria'}, HTTP_IDEMPOTENCY_KEY='tarefa-1')
+        self.assertFalse(ChaveIdempotencia.objects.exists())
+
+        resposta = self.client.post('/api/tarefas/', {'tipo': 'auditoria'}, HTTP_IDEMPOTENCY_KEY='tarefa-1')
+        self.assertEqual(resposta.status_code, 202)
+        self.assertNotIn('Idempotency-Replayed', resposta)
+        self.assertEqual(Tarefa.objects.count(), 1)
+
+
+class LimpezaIdempotenciaTests(TestCase):
+    """
+    Remoção das chaves expiradas pelo `manage.py limpar_idempotencia`.
+    """
+
+    def setUp(self):
+        agora = timezone.now()
+        ChaveIdempotencia.objects.bulk_create([
+            ChaveIdempotencia(
+                escopo='produtos:produtos_api ip:127.0.0.1', chave=f'pedido-{numero}', impressao='',
+                expira_em=agora + timedelta(hours=1 if numero < 2 else -1),
+            )
+            for numero in range(7)
+        ])
+
+    def test_limpar_expiradas(self):
+        self.assertEqual(limpar_expiradas(tamanho_lote=2), 5)
+        self.assertEqual(
+            sorted(ChaveIdempotencia.objects.values_list('chave', flat=True)), ['pedido-0', 'pedido-1']
+        )
+        self.assertEqual(limpar_expiradas(), 0)
+
+    def test_comando(self):
+        saida = StringIO()
+        call_command('limpar_idempotencia', lote=3, stdout=saida)
+        self.assertIn("5 chave(s) expirada(s) apagada(s); 2 restante(s).", saida.getvalue())
+
+
+class IdempotenciaConcorrenteTests(TransactionTestCase):
+    """
+    Repetições simultâneas aguardam a primeira requisição com a mesma chave.
+    """
+
+    def test_repeticoes_recebem_a_resposta_da_primeira(self):
+        em_execucao = threading.Event()
+        liberar = threading.Event()
+        aguardando = threading.Semaphore(0)
+        respostas = []
+
+        class ProdutoSerializerLento(ProdutoSerializer):
+            def is_valid(self, **kwargs):
+                em_execucao.set()
+                liberar.wait(5)
+                return super().is_valid(**kwargs)
+
+        aguardar = idempotencia._aguardar
+
+        def sinalizar_e_aguardar(registro, espera_maxima):
+            aguardando.release()
+            return aguardar(registro, espera_maxima)
+
+        def requisitar():
+            try:
+                # Leituras sem trava de tabela no cache compartilhado do SQLite em
+                # memória: as repetições consultam a chave enquanto a primeira grava
+                connection.cursor().execute('PRAGMA read_uncommitted = 1')
+                respostas.append(_criar(Client(), 'pedido-1'))
+            finally:
+                connections.close_all()
+
+        with mock.patch('apps.produtos.views.ProdutoSerializer', ProdutoSerializerLento), \
+                mock.patch.object(idempotencia, '_aguardar', sinalizar_e_aguardar):
+            threads = [threading.Thread(target=requisitar) for _ in range(4)]
+            threads[0].start()
+            self.assertTrue(em_execucao.wait(5))
+            # Uma repetição por vez: cada uma já encontrou a chave reservada
+            for thread in threads[1:]:
+                thread.start()
+                self.assertTrue(aguardando.acquire(timeout=5))
+            liberar.set()
+            for thread in threads:
+                thread.join(10)
+
+        self.assertEqual(sorted(resposta.status_code for resposta in respostas), [201] * 4)
+        self.assertEqual(
+            sorted(resposta.get('Idempotency-Replayed', '') for resposta in respostas), ['', 'true', 'true', 'true']
+        )
+        self.assertEqual(len({resposta.content for resposta in respostas}), 1)
+        self.assertEqual(Produto.objects.count(), 1)
@@ -0,0 +1,36 @@
+import io
+import json
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from ..manutencao import ETAPAS
+from .auxiliares import criar_produtos
+
+
+class ManutencaoDbTests(TestCase):
+    """
+    Relatório e etapas do `manage.py manutencao_db`.
+    """
+
+    def manutencao(self, *argumentos):
+        saida = io.StringIO()
+        call_command('manutencao_db', '--json', *argumentos, stdout=saida)
+        return json.loads(saida.getvalue())
+
+    @override_settings(MANUTENCAO_DB={'PAUSA_ENTRE_PASSOS': 0})
+    def test_relatorio_antes_e_depois(self):
+        criar_produtos(50)
+        resultado = self.manutencao('--etapas', 'integridade', 'estatisticas')
+        self.assertTrue(resultado['etapas']['integridade']['ok'])
+        self.assertGreater(resultado['etapas']['estatisticas']['analisadas'], 0)
+        self.assertEqual(set(resultado['antes']['planos']), set(resultado['depois']['planos']))
+        self.assertIn('SCAN produtos_produto', '\n'.join(resultado['depois']['planos']['risco']))
+
+    @override_settings(MANUTENCAO_DB={'PAUSA_ENTRE_PASSOS': 0})
+    def test_etapas_fora_do_prazo_sao_puladas(self):
+        resultado = self.manutencao('--tempo-maximo', '0')
+        self.assertEqual(
+            resultado['etapas'],
+            {etapa: {'pulada': True, 'segundos': 0.0} for etapa in ETAPAS},
+        )
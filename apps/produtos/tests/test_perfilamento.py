@@ -0,0 +1,153 @@
+import json
+import pstats
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+
+from ..models import Produto
+from ..perfilamento import PerfilamentoMiddleware, caminho_captura, gerar_token, listar_capturas
+from .auxiliares import criar_produtos
+
+
+def _listar(request):
+    return HttpResponse(str(Produto.objects.count()))
+
+
+class PerfilamentoMiddlewareTests(TestCase):
+    """
+    Capturas por token assinado e rotação do diretório de perfis.
+    """
+
+    def setUp(self):
+        criar_produtos(3)
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        self.diretorio = Path(diretorio.name)
+        self.configurar()
+        self.fabrica = RequestFactory()
+
+    def configurar(self, **config):
+        configuracao = override_settings(PERFILAMENTO={
+            'ATIVO': True,
+            'TAXA_AMOSTRAGEM': 0.0,
+            'DIRETORIO': self.diretorio,
+            'MAXIMO_ARQUIVOS': 50,
+            'VALIDADE_TOKEN': 60,
+            **config,
+        })
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    def _requisitar(self, token=None, caminho='/api/produtos/'):
+        cabecalhos = {'HTTP_X_PERFILAR': token} if token is not None else {}
+        return PerfilamentoMiddleware(_listar)(self.fabrica.get(caminho, **cabecalhos))
+
+    def _arquivos(self):
+        return sorted(arquivo.name for arquivo in self.diretorio.iterdir())
+
+    def test_token_valido_grava_prof_e_json(self):
+        resposta = self._requisitar(gerar_token())
+        nome = resposta['X-Perfil']
+        self.assertEqual(self._arquivos(), [f'{nome}.json', f'{nome}.prof'])
+
+        with open(self.diretorio / f'{nome}.json', encoding='utf-8') as entrada:
+            dados = json.load(entrada)
+        self.assertEqual(dados['caminho'], '/api/produtos/')
+        self.assertEqual(dados['status'], 200)
+        self.assertTrue(dados['tem_cprofile'])
+        self.assertEqual(dados['total_consultas'], len(dados['consultas']))
+        self.assertTrue(any('produtos_produto' in consulta['sql'] for consulta in dados['consultas']))
+        self.assertGreater(pstats.Stats(str(self.diretorio / f'{nome}.prof')).total_calls, 0)
+
+        self.assertEqual(caminho_captura(nome, 'prof'), self.diretorio / f'{nome}.prof')
+        self.assertEqual([captura['nome'] for captura in listar_capturas()], [nome])
+
+    def test_token_invalido_ou_expirado_nao_grava(self):
+        token = gerar_token()
+        adulterado = token[:-1] + ('a' if token[-1] != 'a' else 'b')
+        with mock.patch('django.core.signing.time.time', return_value=time.time() - 120):
+            expirado = gerar_token()
+
+        for valor in ('', 'perfilar', adulterado, expirado):
+            with self.subTest(token=valor):
+                resposta = self._requisitar(valor)
+                self.assertEqual(resposta.status_code, 200)
+                self.assertNotIn('X-Perfil', resposta)
+        self.assertEqual(self._arquivos(), [])
+
+    @override_settings(SECRET_KEY='outra-chave')
+    def test_token_de_outra_chave_nao_grava(self):
+        with override_settings(SECRET_KEY='chave-original'):
+            token = gerar_token()
+        self.assertNotIn('X-Perfil', self._requisitar(token))
+        self.assertEqual(self._arquivos(), [])
+
+    def test_rotacao_mantem_as_mais_recentes(self):
+        self.configurar(MAXIMO_ARQUIVOS=3)
+        nomes = [self._requisitar(gerar_token(), f'/api/produtos/{numero}/')['X-Perfil'] for numero in range(5)]
+
+        self.assertEqual(len(set(nomes)), 5)
+        self.assertEqual(
+            self._arquivos(),
+            sorted(f'{nome}.{extensao}' for nome in nomes[-3:] for extensao in ('json', 'prof')),
+        )
+        self.assertIsNone(caminho_captura(nomes[0], 'json'))
+
+    def test_nomes_de_captura_invalidos(self):
+        nome = self._requisitar(gerar_token())['X-Perfil']
+        for nome_invalido, extensao in (('../settings', 'json'), (nome, 'py'), (f'{nome}/..', 'prof')):
+            with self.subTest(nome=nome_invalido, extensao=extensao):
+                self.assertIsNone(caminho_captura(nome_invalido, extensao))
+
+    def test_desligado_sem_configuracao(self):
+        self.configurar(ATIVO=False)
+        with self.assertRaises(MiddlewareNotUsed):
+            PerfilamentoMiddleware(_listar)
+
+
+class PerfisAdminTests(TestCase):
+    """
+    Listagem e download das capturas no admin, restritos a superusuários.
+    """
+
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        configuracao = override_settings(PERFILAMENTO={'ATIVO': True, 'DIRETORIO': diretorio.name})
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        resposta = PerfilamentoMiddleware(_listar)(
+            RequestFactory().get('/api/produtos/', HTTP_X_PERFILAR=gerar_token())
+        )
+        self.nome = resposta['X-Perfil']
+        self.urls = ['/admin/produtos/produto/perfis/', f'/admin/produtos/produto/perfis/{self.nome}/json/']
+
+    def _entrar(self, **permissoes):
+        usuario = get_user_model().objects.create_user(username='equipe', password='senha', **permissoes)
+        self.client.force_login(usuario)
+
+    def test_superusuario(self):
+        self._entrar(is_staff=True, is_superuser=True)
+        listagem = self.client.get(self.urls[0])
+        self.assertEqual(listagem.status_code, 200)
+        self.assertContains(listagem, self.nome)
+        download = self.client.get(self.urls[1])
+        self.assertEqual(download.status_code, 200)
+        self.assertIn('produtos_produto', json.loads(b''.join(download.streaming_content))['consultas'][0]['sql'])
+
+    def test_equipe_sem_superusuario(self):
+        self._entrar(is_staff=True)
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_anonimo_vai_para_o_login(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertRedirects(self.client.get(url), f'/admin/login/?next={url}')
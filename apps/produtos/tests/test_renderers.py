@@ -0,0 +1,133 @@
+from datetime import datetime, timezone as fuso
+from decimal import Decimal
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+
+from .. import renderers
+from ..models import Produto
+from ..renderers import codificar_cbor
+from ..serializers import ProdutoSerializer
+
+
+class CodificadorCBORTests(SimpleTestCase):
+    """
+    Codificador CBOR puro Python, contra os exemplos do apêndice A da RFC 8949.
+    """
+
+    def setUp(self):
+        sem_biblioteca = mock.patch.object(renderers, 'cbor2', None)
+        sem_biblioteca.start()
+        self.addCleanup(sem_biblioteca.stop)
+
+    def assertCodifica(self, exemplos):
+        for valor, esperado in exemplos:
+            with self.subTest(valor=valor):
+                self.assertEqual(codificar_cbor(valor).hex(), esperado)
+
+    def test_inteiros(self):
+        self.assertCodifica([
+            (0, '00'),
+            (23, '17'),
+            (24, '1818'),
+            (100, '1864'),
+            (1000, '1903e8'),
+            (1000000, '1a000f4240'),
+            (1000000000000, '1b000000e8d4a51000'),
+            (18446744073709551615, '1bffffffffffffffff'),
+            (18446744073709551616, 'c249010000000000000000'),
+        ])
+
+    def test_inteiros_negativos(self):
+        self.assertCodifica([
+            (-1, '20'),
+            (-10, '29'),
+            (-100, '3863'),
+            (-1000, '3903e7'),
+            (-18446744073709551616, '3bffffffffffffffff'),
+            (-18446744073709551617, 'c349010000000000000000'),
+        ])
+
+    def test_floats(self):
+        self.assertCodifica([
+            # Precisão simples quando não há perda
+            (1.5, 'fa3fc00000'),
+            (100000.0, 'fa47c35000'),
+            (-4.0, 'fac0800000'),
+            (1.1, 'fb3ff199999999999a'),
+            (1.0e300, 'fb7e37e43c8800759c'),
+        ])
+
+    def test_simples_texto_e_bytes(self):
+        self.assertCodifica([
+            (False, 'f4'),
+            (True, 'f5'),
+            (None, 'f6'),
+            ('', '60'),
+            ('a', '6161'),
+            ('IETF', '6449455446'),
+            ('ü', '62c3bc'),
+            ('水', '63e6b0b4'),
+            (b'', '40'),
+            (bytes.fromhex('01020304'), '4401020304'),
+        ])
+
+    def test_arrays_e_mapas_aninhados(self):
+        self.assertCodifica([
+            ([], '80'),
+            ([1, [2, 3], [4, 5]], '8301820203820405'),
+            ({}, 'a0'),
+            ({1: 2, 3: 4}, 'a201020304'),
+            ({'a': 1, 'b': [2, 3]}, 'a26161016162820203'),
+            (['a', {'b': 'c'}], '826161a161626163'),
+            (list(range(1, 26)), '98190102030405060708090a0b0c0d0e0f101112131415161718181819'),
+        ])
+
+    def test_decimal_como_fracao_decimal(self):
+        self.assertCodifica([
+            (Decimal('273.15'), 'c48221196ab3'),
+            (Decimal('0.30'), 'c48221181e'),
+            (Decimal('-1.5'), 'c482202e'),
+            (Decimal('0'), 'c4820000'),
+        ])
+
+    def test_data_hora_em_texto(self):
+        momento = datetime(2013, 3, 21, 20, 4, tzinfo=fuso.utc)
+        texto = '2013-03-21T20:04:00+00:00'.encode()
+        self.assertEqual(codificar_cbor(momento), bytes([0xc0, 0x78, len(texto)]) + texto)
+
+    def test_tipo_nao_suportado(self):
+        with self.assertRaises(TypeError):
+            codificar_cbor(object())
+
+
+class DecimalNativoTests(TestCase):
+    """
+    O renderer CBOR recebe THC/CBD como Decimal; os demais, como texto.
+    """
+
+    def setUp(self):
+        self.produto = Produto.objects.create(
+            nome='Óleo CBD 5%',
+            tipo_espectro='indica',
+            thc_percentual=Decimal('0.25'),
+            cbd_percentual=Decimal('5.00'),
+            categoria_terapeutica='dermatologia',
+            status_anvisa='aprovado',
+        )
+
+    def test_serializer_alterna_coerce_to_string(self):
+        texto = ProdutoSerializer(self.produto, context={}).data
+        nativo = ProdutoSerializer(self.produto, context={'decimal_nativo': True}).data
+        self.assertEqual(texto['thc_percentual'], '0.25')
+        self.assertEqual(nativo['thc_percentual'], Decimal('0.25'))
+        self.assertEqual(nativo['cbd_percentual'], Decimal('5.00'))
+
+    def test_resposta_cbor_com_fracoes_decimais(self):
+        resposta = self.client.get(f'/api/produtos/{self.produto.pk}/', HTTP_ACCEPT='application/cbor')
+        self.assertEqual(resposta['Content-Type'], 'application/cbor')
+        # thc_percentual: tag 4, [-2, 25]
+        self.assertIn(bytes.fromhex('6e7468635f70657263656e7475616cc482211819'), resposta.content)
+
+        json = self.client.get(f'/api/produtos/{self.produto.pk}/', HTTP_ACCEPT='application/json')
+        self.assertEqual(json.json()['thc_percentual'], '0.25')
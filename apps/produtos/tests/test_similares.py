@@ -0,0 +1,162 @@
+import math
+import random
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+
+from ..catalogo import versao_atual
+from ..indices import IndiceIncremental
+from ..models import Produto
+from ..similares import TAMANHO_CELULA, IndiceSimilares, indice_similares
+from .auxiliares import criar_produtos, descartar_caches
+
+
+def _forca_bruta(pontos, produto_id, k):
+    categoria, thc, cbd = pontos[produto_id]
+    return sorted(
+        (math.hypot(vthc - thc, vcbd - cbd), vizinho)
+        for vizinho, (vcategoria, vthc, vcbd) in pontos.items()
+        if vcategoria == categoria and vizinho != produto_id
+    )[:k]
+
+
+class IndiceSimilaresTests(SimpleTestCase):
+    """
+    kNN pela grade espacial comparado à busca exaustiva.
+    """
+
+    def _indice(self, pontos):
+        indice = IndiceSimilares()
+        for produto_id, (categoria, thc, cbd) in pontos.items():
+            indice.inserir(produto_id, categoria, thc, cbd)
+        return indice
+
+    def assertVizinhosExatos(self, indice, pontos, ks=(1, 3, 10)):
+        """
+        Mesmas distâncias da busca exaustiva; em empates, qualquer vizinho à mesma distância serve.
+        """
+        for produto_id in pontos:
+            _, thc, cbd = pontos[produto_id]
+            for k in ks:
+                with self.subTest(produto_id=produto_id, k=k):
+                    esperado = _forca_bruta(pontos, produto_id, k)
+                    obtido = indice.vizinhos(produto_id, k)
+                    self.assertEqual(len(obtido), len(esperado))
+                    for (distancia, _), (distancia_esperada, _) in zip(obtido, esperado):
+                        self.assertAlmostEqual(distancia, distancia_esperada)
+                    vizinhos = [vizinho for _, vizinho in obtido]
+                    self.assertEqual(len(set(vizinhos)), len(vizinhos))
+                    for distancia, vizinho in obtido:
+                        categoria, vthc, vcbd = pontos[vizinho]
+                        self.assertEqual(categoria, pontos[produto_id][0])
+                        self.assertAlmostEqual(distancia, math.hypot(vthc - thc, vcbd - cbd))
+
+    def test_pontos_aleatorios(self):
+        aleatorio = random.Random(36)
+        pontos = {
+            produto_id: (
+                aleatorio.choice(['neurologia', 'pediatria', 'oncologia']),
+                round(aleatorio.uniform(0, 2), 2),
+                round(aleatorio.uniform(0, 30), 2),
+            )
+            for produto_id in range(1, 301)
+        }
+        self.assertVizinhosExatos(self._indice(pontos), pontos)
+
+    def test_vizinhos_do_outro_lado_da_borda_da_celula(self):
+        # O mais próximo está na célula vizinha; um da mesma célula está mais longe
+        borda = 4 * TAMANHO_CELULA
+        pontos = {
+            1: ('neurologia', 1.0, borda - 0.01),
+            2: ('neurologia', 1.0, borda + 0.01),
+            3: ('neurologia', 1.0 + TAMANHO_CELULA - 0.01, borda - 0.01),
+            4: ('neurologia', 1.0 - 0.01, borda - 0.02),
+            5: ('neurologia', 1.0 + 3 * TAMANHO_CELULA, borda + 3 * TAMANHO_CELULA),
+        }
+        indice = self._indice(pontos)
+        self.assertEqual(indice.vizinhos(1, 1)[0][1], 4)
+        self.assertEqual([vizinho for _, vizinho in indice.vizinhos(1, 2)], [4, 2])
+        self.assertVizinhosExatos(indice, pontos, ks=(1, 2, 4))
+
+    def test_pontos_esparsos_e_agrupados_nas_bordas(self):
+        aleatorio = random.Random(7)
+        pontos = {}
+        for produto_id in range(1, 121):
+            # Metade colada às bordas das células, metade bem espalhada
+            if produto_id % 2:
+                i, j = aleatorio.randrange(8), aleatorio.randrange(8)
+                thc = i * TAMANHO_CELULA + aleatorio.choice([0.001, TAMANHO_CELULA - 0.001])
+                cbd = j * TAMANHO_CELULA + aleatorio.choice([0.001, TAMANHO_CELULA - 0.001])
+            else:
+                thc, cbd = aleatorio.uniform(0, 50), aleatorio.uniform(0, 50)
+            pontos[produto_id] = ('pediatria', thc, cbd)
+        self.assertVizinhosExatos(self._indice(pontos), pontos, ks=(1, 5, 200))
+
+    def test_reposicionamento_e_remocao(self):
+        aleatorio = random.Random(1)
+        pontos = {
+            produto_id: ('neurologia', aleatorio.uniform(0, 3), aleatorio.uniform(0, 3))
+            for produto_id in range(1, 61)
+        }
+        indice = self._indice(pontos)
+        for produto_id in range(1, 61, 3):
+            pontos[produto_id] = ('pediatria' if produto_id % 2 else 'neurologia', aleatorio.uniform(0, 3), 9.5)
+            indice.inserir(produto_id, *pontos[produto_id])
+        for produto_id in range(2, 61, 5):
+            del pontos[produto_id]
+            indice.remover(produto_id)
+
+        self.assertEqual(len(indice), len(pontos))
+        self.assertIsNone(indice.vizinhos(2, 3))
+        self.assertVizinhosExatos(indice, pontos, ks=(1, 4))
+
+    def test_base_exige_os_metodos_abstratos(self):
+        class IndiceIncompleto(IndiceIncremental):
+            def limpar(self):
+                pass
+
+        with self.assertRaises(TypeError):
+            IndiceIncompleto()
+
+
+class SimilaresApiTests(TestCase):
+    """
+    A API de similares não carrega o índice inteiro na requisição.
+    """
+
+    def setUp(self):
+        criar_produtos(60)
+        descartar_caches()
+        self.produto_id = Produto.objects.order_by('pk').values_list('pk', flat=True)[7]
+        self.url = f'/api/produtos/{self.produto_id}/similares/'
+
+    def _similares(self, **parametros):
+        resposta = self.client.get(self.url, parametros)
+        self.assertEqual(resposta.status_code, 200)
+        return [(produto['distancia'], produto['id']) for produto in resposta.json()['similares']]
+
+    def test_indice_nao_carregado_usa_o_banco(self):
+        with mock.patch.object(IndiceSimilares, '_reconstruir') as reconstruir:
+            pelo_banco = self._similares(k=5)
+        reconstruir.assert_not_called()
+        self.assertIsNone(indice_similares.versao)
+
+        indice_similares.sincronizar(versao_atual().versao)
+        pelo_indice = self._similares(k=5)
+        self.assertEqual(len(pelo_banco), 5)
+        self.assertEqual([distancia for distancia, _ in pelo_banco], [distancia for distancia, _ in pelo_indice])
+
+        self.assertEqual(self.client.get('/api/produtos/0/similares/').status_code, 404)
+
+    def test_indice_carregado_e_sincronizado_incrementalmente(self):
+        indice_similares.sincronizar(versao_atual().versao)
+        produto = Produto.objects.get(pk=self.produto_id)
+        produto.thc_percentual = produto.cbd_percentual = '0.00'
+        produto.save()
+
+        with mock.patch.object(IndiceSimilares, '_reconstruir') as reconstruir, \
+                mock.patch('apps.produtos.indices.LIMITE_SINCRONIZACAO_INCREMENTAL', 0):
+            similares = self._similares(k=3)
+        reconstruir.assert_not_called()
+        self.assertEqual(indice_similares.posicoes[self.produto_id][1:], (0.0, 0.0))
+        self.assertEqual(len(similares), 3)
@@ -0,0 +1,175 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .. import tarefas
+from ..models import Tarefa
+from ..tarefas import EXECUTORES, enfileirar, executar, processar_fila, reservar_proxima
+from .auxiliares import criar_produtos
+
+
+def _falhar(contexto):
+    raise RuntimeError("falha simulada")
+
+
+def _envelhecer(tarefa, segundos):
+    """
+    Faz a tarefa parecer sem batimento há `segundos` (processo interrompido).
+    """
+    Tarefa.objects.filter(pk=tarefa.pk).update(
+        data_atualizacao=timezone.now() - timedelta(seconds=segundos)
+    )
+
+
+class FilaTarefasTests(TestCase):
+    """
+    Reserva, novas tentativas e retomada de tarefas abandonadas.
+    """
+
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        configuracao = override_settings(TAREFAS_DIR=diretorio.name)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        # Nenhum batimento durante estes testes: a thread escreveria na mesma
+        # tabela que a transação do teste e pode encontrá-la travada
+        batimento = mock.patch.object(tarefas, 'intervalo_batimento', return_value=3600)
+        batimento.start()
+        self.addCleanup(batimento.stop)
+
+    def test_reserva_conta_a_tentativa_e_e_exclusiva(self):
+        tarefa = enfileirar('auditoria')
+        reservada = reservar_proxima()
+        self.assertEqual(reservada.pk, tarefa.pk)
+        self.assertEqual(reservada.status, 'executando')
+        self.assertEqual(reservada.tentativas, 1)
+        self.assertIsNone(reservar_proxima())
+
+    @mock.patch.dict(EXECUTORES, {'falha': _falhar})
+    def test_falhas_agendam_nova_tentativa_com_espera_crescente(self):
+        tarefa = enfileirar('falha', max_tentativas=3)
+        esperas = []
+        for _ in range(2):
+            inicio = timezone.now()
+            with self.assertLogs('apps.produtos.tarefas', 'ERROR') as registros:
+                executada = executar(reservar_proxima())
+            self.assertIn(f"Tarefa {tarefa.pk} falhou", registros.output[0])
+            self.assertEqual(executada.status, 'pendente')
+            esperas.append(round((executada.disponivel_em - inicio).total_seconds()))
+            # Antes do horário agendado a tarefa não é reservada
+            self.assertIsNone(reservar_proxima())
+            Tarefa.objects.filter(pk=tarefa.pk).update(disponivel_em=timezone.now())
+        self.assertEqual(esperas, [30, 60])
+
+        with self.assertLogs('apps.produtos.tarefas', 'ERROR'):
+            executada = executar(reservar_proxima())
+        self.assertEqual(executada.status, 'falhou')
+        self.assertEqual(executada.tentativas, 3)
+        self.assertIn("falha simulada", executada.erro)
+
+    def test_falha_preserva_o_progresso_gravado(self):
+        def falhar_no_meio(contexto):
+            contexto.progresso(40, 100, "Metade do primeiro lote")
+            raise RuntimeError("falha simulada")
+
+        with mock.patch.dict(EXECUTORES, {'falha': falhar_no_meio}):
+            tarefa = enfileirar('falha')
+            with self.assertLogs('apps.produtos.tarefas', 'ERROR'):
+                executar(reservar_proxima())
+
+        tarefa.refresh_from_db()
+        self.assertEqual(tarefa.status, 'pendente')
+        self.assertEqual(tarefa.progresso, 40)
+
+    def test_tarefa_abandonada_volta_a_fila_ate_esgotar_as_tentativas(self):
+        tarefa = enfileirar('auditoria', max_tentativas=2)
+        reservar_proxima()
+        # Com batimento recente ela não é tomada por outro processo
+        self.assertIsNone(reservar_proxima())
+
+        _envelhecer(tarefa, settings.TAREFAS_TEMPO_LIMITE + 1)
+        retomada = reservar_proxima()
+        self.assertEqual(retomada.pk, tarefa.pk)
+        self.assertEqual(retomada.tentativas, 2)
+
+        # O processo morreu de novo, na última tentativa: a tarefa falha em vez de repetir
+        _envelhecer(tarefa, settings.TAREFAS_TEMPO_LIMITE + 1)
+        self.assertIsNone(reservar_proxima())
+        tarefa.refresh_from_db()
+        self.assertEqual(tarefa.status, 'falhou')
+        self.assertEqual(tarefa.tentativas, 2)
+
+    def test_download_do_resultado(self):
+        criar_produtos(12)
+        resposta = self.client.post('/api/tarefas/', {'tipo': 'exportacao', 'formato': 'json'})
+        self.assertEqual(resposta.status_code, 202)
+        self.assertEqual(processar_fila(uma_vez=True), 1)
+
+        tarefa = self.client.get(resposta['Location']).json()
+        self.assertEqual(tarefa['status'], 'concluida')
+        self.assertEqual(tarefa['resultado'], {'exportados': 12, 'formato': 'json'})
+
+        download = self.client.get(tarefa['url_resultado'])
+        self.assertEqual(download.status_code, 200)
+        self.assertIn('attachment; filename="produtos.json"', download['Content-Disposition'])
+        self.assertEqual(len(json.loads(b''.join(download.streaming_content))), 12)
+
+    def test_download_sem_resultado(self):
+        tarefa = enfileirar('auditoria')
+        self.assertEqual(self.client.get(f'/api/tarefas/{tarefa.pk}/resultado/').status_code, 404)
+
+
+class BatimentoTarefasTests(TransactionTestCase):
+    """
+    Batimentos de uma tarefa longa, que a impedem de ser tomada como abandonada.
+    """
+
+    def test_tarefa_longa_recebe_batimentos(self):
+        atualizacoes = []
+        bater = tarefas.Batimento.bater
+
+        def bater_e_ler(batimento):
+            # Lido na própria thread do batimento: a executora não usa o banco
+            # enquanto isso, para não disputar a trava da tabela no SQLite
+            bater(batimento)
+            atualizacoes.append(Tarefa.objects.get(pk=batimento.tarefa_id).data_atualizacao)
+
+        def demorar(contexto):
+            time.sleep(0.3)
+
+        with mock.patch.dict(EXECUTORES, {'longa': demorar}), \
+                mock.patch.object(tarefas, 'intervalo_batimento', return_value=0.05), \
+                mock.patch.object(tarefas.Batimento, 'bater', bater_e_ler):
+            enfileirar('longa')
+            reservada = reservar_proxima()
+            reserva = reservada.data_atualizacao
+            with self.assertNoLogs('apps.produtos.tarefas', 'ERROR'):
+                executada = executar(reservada)
+
+        self.assertEqual(executada.status, 'concluida')
+        self.assertGreaterEqual(len(set(atualizacoes)), 3)
+        self.assertTrue(all(reserva < atualizacao < executada.data_atualizacao for atualizacao in atualizacoes))
+
+
+class RunWorkersTests(TestCase):
+
+    def test_modulo_importavel_sem_django_configurado(self):
+        # Como no método `spawn`: o filho importa o módulo antes do django.setup()
+        processo = subprocess.run(
+            [sys.executable, '-c', 'import apps.produtos.management.commands.run_workers'],
+            cwd=settings.BASE_DIR,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'setup.settings'},
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(processo.returncode, 0, processo.stderr)
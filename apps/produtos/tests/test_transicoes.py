@@ -0,0 +1,162 @@
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from ..catalogo import versao_atual
+from ..contagens import contar, recalcular
+from ..models import HistoricoProduto, Produto
+from ..transicoes import TransicaoRejeitada, transicionar_status
+from .auxiliares import CATEGORIAS, criar_produtos
+
+
+def _produto(thc, status='pendente', categoria='neurologia'):
+    return Produto.objects.create(
+        nome=f'Produto THC {thc}',
+        tipo_espectro='sativa',
+        thc_percentual=Decimal(thc),
+        cbd_percentual=Decimal('5.00'),
+        categoria_terapeutica=categoria,
+        status_anvisa=status,
+    )
+
+
+class TransicaoStatusTests(TestCase):
+    """
+    Transição de status em lote nos modos parcial e atômico.
+    """
+
+    def setUp(self):
+        self.permitido = _produto('0.20')
+        self.ja_aprovado = _produto('0.10', status='aprovado')
+        self.acima_limite = _produto('0.50')
+        self.outra_categoria = _produto('0.25', categoria='dermatologia')
+
+    def _alteracoes_status(self):
+        return list(
+            HistoricoProduto.objects.filter(operacao='alteracao')
+            .values_list('produto_id', 'alteracoes')
+        )
+
+    def test_modo_parcial_ignora_e_reporta_violacoes(self):
+        versao = versao_atual().versao
+        inexistente = self.outra_categoria.pk + 100
+        resultado = transicionar_status(
+            'aprovado',
+            ids=[self.permitido.pk, self.ja_aprovado.pk, self.acima_limite.pk, inexistente],
+        )
+
+        self.assertEqual(resultado['selecionados'], 3)
+        self.assertEqual(resultado['atualizados'], 1)
+        self.assertEqual(resultado['inalterados'], 1)
+        self.assertEqual(resultado['rejeitados'], 1)
+        self.assertEqual(resultado['ids_rejeitados'], [self.acima_limite.pk])
+        self.assertEqual(resultado['nao_encontrados'], 1)
+        self.assertEqual(resultado['ids_nao_encontrados'], [inexistente])
+
+        self.permitido.refresh_from_db()
+        self.acima_limite.refresh_from_db()
+        self.assertEqual(self.permitido.status_anvisa, 'aprovado')
+        self.assertEqual(self.acima_limite.status_anvisa, 'pendente')
+        # Histórico só das linhas de fato alteradas; contagens e versão acompanham
+        self.assertEqual(self._alteracoes_status(), [(self.permitido.pk, {'status_anvisa': 'aprovado'})])
+        self.assertEqual(contar({'status_anvisa': 'aprovado'}), (2, True))
+        self.assertEqual(versao_atual().versao, versao + 1)
+
+    def test_modo_atomico_rejeita_a_transicao_inteira(self):
+        versao = versao_atual().versao
+        with self.assertRaises(TransicaoRejeitada) as contexto:
+            transicionar_status('aprovado', filtro={'categoria_terapeutica': 'neurologia'}, modo='atomico')
+
+        self.assertEqual(contexto.exception.resultado['ids_rejeitados'], [self.acima_limite.pk])
+        self.assertFalse(Produto.objects.filter(pk=self.permitido.pk, status_anvisa='aprovado').exists())
+        self.assertEqual(self._alteracoes_status(), [])
+        self.assertEqual(contar({'status_anvisa': 'aprovado'}), (1, True))
+        self.assertEqual(versao_atual().versao, versao)
+
+    def test_modo_atomico_sem_violacoes(self):
+        resultado = transicionar_status(
+            'aprovado', ids=[self.permitido.pk, self.outra_categoria.pk], modo='atomico'
+        )
+        self.assertEqual(resultado['atualizados'], 2)
+        self.assertEqual(Produto.objects.filter(status_anvisa='aprovado').count(), 3)
+
+    def test_api_rejeita_thc_acima_do_limite_no_modo_atomico(self):
+        resposta = self.client.post('/api/produtos/status/', {
+            'ids': [self.permitido.pk, self.acima_limite.pk],
+            'status_anvisa': 'aprovado',
+            'modo': 'atomico',
+        }, content_type='application/json')
+
+        self.assertEqual(resposta.status_code, 400)
+        dados = resposta.json()
+        self.assertEqual(dados['atualizados'], 0)
+        self.assertEqual(dados['ids_rejeitados'], [self.acima_limite.pk])
+        self.assertIn('0.3%', dados['detail'])
+
+    def test_status_sem_regra_de_thc(self):
+        resultado = transicionar_status('reprovado', ids=[self.acima_limite.pk, self.ja_aprovado.pk])
+        self.assertEqual(resultado['atualizados'], 2)
+        self.assertEqual(resultado['rejeitados'], 0)
+        self.assertEqual(contar({'status_anvisa': 'reprovado'}), (2, True))
+
+
+class TransicaoEmConjuntoTests(TestCase):
+    """
+    A quantidade de comandos SQL não depende do tamanho da seleção.
+    """
+
+    def _consultas(self, **parametros):
+        with CaptureQueriesContext(connection) as consultas:
+            resultado = transicionar_status('aprovado', **parametros)
+        return resultado, len(consultas)
+
+    def _pendentes(self, quantidade):
+        inicio = Produto.objects.count()
+        Produto.objects.bulk_create([
+            Produto(
+                nome=f'Pendente {numero}',
+                tipo_espectro='hibrida',
+                thc_percentual=Decimal('0.10'),
+                cbd_percentual=Decimal('5.00'),
+                categoria_terapeutica=CATEGORIAS[numero % len(CATEGORIAS)],
+                status_anvisa='pendente',
+            )
+            for numero in range(inicio, inicio + quantidade)
+        ])
+        recalcular()
+
+    def test_comandos_constantes(self):
+        # Primeira transição: cria as linhas de contagem das combinações 'aprovado'
+        self._pendentes(10)
+        transicionar_status('aprovado', filtro={'status_anvisa': 'pendente'})
+        self._pendentes(10)
+        pequena, consultas_pequena = self._consultas(filtro={'status_anvisa': 'pendente'})
+        self._pendentes(3000)
+        grande, consultas_grande = self._consultas(filtro={'status_anvisa': 'pendente'})
+
+        self.assertEqual((pequena['atualizados'], grande['atualizados']), (10, 3000))
+        self.assertEqual(consultas_grande, consultas_pequena)
+        self.assertLessEqual(consultas_grande, 8)
+        self.assertEqual(HistoricoProduto.objects.filter(operacao='alteracao').count(), 3020)
+        self.assertEqual(recalcular(), {})
+
+    def test_muitos_ids(self):
+        criar_produtos(2500)
+        ids = list(Produto.objects.exclude(status_anvisa='aprovado').values_list('pk', flat=True))
+        maior = Produto.objects.order_by('-pk').values_list('pk', flat=True)[0]
+        inexistentes = [maior + 1, maior + 2]
+        resultado = transicionar_status('aprovado', ids=ids + inexistentes)
+
+        self.assertEqual(resultado['selecionados'], len(ids))
+        self.assertEqual(resultado['atualizados'] + resultado['rejeitados'], len(ids))
+        self.assertEqual(resultado['ids_nao_encontrados'], inexistentes)
+        self.assertEqual(
+            sorted(resultado['ids_rejeitados']),
+            sorted(Produto.objects.filter(pk__in=ids, thc_percentual__gt=Decimal('0.3'))
+                   .exclude(status_anvisa='aprovado').values_list('pk', flat=True))[:1000],
+        )
+        self.assertFalse(Produto.objects.filter(pk__in=ids, thc_percentual__lte=Decimal('0.3'))
+                         .exclude(status_anvisa='aprovado').exists())
+        self.assertEqual(recalcular(), {})
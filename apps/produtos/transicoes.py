@@ -0,0 +1,118 @@
+"""
+Transição de status ANVISA em lote, executada como SQL baseado em conjuntos.
+
+Em vez de salvar produto a produto, a transição roda um número fixo de
+comandos, qualquer que seja o tamanho da seleção:
+- um SELECT agregado que conta a seleção (rejeitados, já no status, a alterar);
+- um GROUP BY com as diferenças das contagens por combinação;
+- um INSERT ... SELECT no histórico e um UPDATE, ambos com a regra
+  THC > 0.3% x 'aprovado' na cláusula WHERE;
+- o ajuste das contagens (uma linha por combinação afetada) e o incremento
+  da versão do catálogo.
+
+Os ids rejeitados e os não encontrados só são lidos quando existem.
+"""
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .catalogo import incrementar_versao
+from .contagens import ajustar, diferenca_status, lista_ids
+from .historico import registrar_alteracao_em_conjunto
+from .models import Produto
+
+# Quantidade máxima de ids rejeitados listados na resposta
+MAXIMO_IDS_LISTADOS = 1000
+
+
+class TransicaoRejeitada(Exception):
+    """
+    Transição atômica abortada porque há produtos que violam a regra de THC.
+    """
+
+    def __init__(self, resultado):
+        super().__init__("Produtos com THC superior a 0.3% não podem ter status 'aprovado' na ANVISA.")
+        self.resultado = resultado
+
+
+def _selecao(ids=None, filtro=None):
+    """
+    Queryset da seleção: os ids informados (se houver) que atendem ao filtro.
+    """
+    selecao = Produto.objects.filter(**(filtro or {}))
+    if ids is not None:
+        selecao = selecao.filter(pk__in=lista_ids(sorted(set(ids))))
+    return selecao.order_by()
+
+
+def _violacao(status_alvo):
+    """
+    Condição que identifica produtos que não podem receber o status alvo.
+    """
+    if status_alvo == 'aprovado':
+        return Q(thc_percentual__gt=0.3)
+    return None
+
+
+def transicionar_status(status_alvo, ids=None, filtro=None, modo='parcial'):
+    """
+    Leva os produtos selecionados para `status_alvo`.
+
+    No modo 'parcial' os produtos que violam a regra de THC são ignorados e
+    reportados; no modo 'atomico' qualquer violação aborta a transição
+    inteira com `TransicaoRejeitada`. Ids informados que não existem (ou não
+    atendem ao filtro) são reportados em `nao_encontrados`. Retorna um
+    dicionário com as contagens.
+    """
+    agora = timezone.now()
+    violacao = _violacao(status_alvo)
+    resultado = {
+        'status_anvisa': status_alvo,
+        'selecionados': 0,
+        'atualizados': 0,
+        'inalterados': 0,
+        'rejeitados': 0,
+        'nao_encontrados': 0,
+        'ids_rejeitados': [],
+        'ids_nao_encontrados': [],
+    }
+
+    with transaction.atomic():
+        selecao = _selecao(ids, filtro)
+        no_status = Q(status_anvisa=status_alvo)
+        contagens = {'selecionados': Count('pk')}
+        if violacao is None:
+            contagens['inalterados'] = Count('pk', filter=no_status)
+        else:
+            contagens['inalterados'] = Count('pk', filter=no_status & ~violacao)
+            contagens['rejeitados'] = Count('pk', filter=violacao)
+        resultado.update(selecao.aggregate(**contagens))
+
+        if resultado['rejeitados']:
+            resultado['ids_rejeitados'] = list(
+                selecao.filter(violacao).order_by('pk').values_list('pk', flat=True)[:MAXIMO_IDS_LISTADOS]
+            )
+        if ids is not None and resultado['selecionados'] < len(set(ids)):
+            nao_encontrados = sorted(set(ids) - set(selecao.values_list('pk', flat=True)))
+            resultado['nao_encontrados'] = len(nao_encontrados)
+            resultado['ids_nao_encontrados'] = nao_encontrados[:MAXIMO_IDS_LISTADOS]
+
+        if modo == 'atomico' and resultado['rejeitados']:
+            raise TransicaoRejeitada(resultado)
+
+        if resultado['selecionados'] == resultado['inalterados'] + resultado['rejeitados']:
+            return resultado
+
+        atualizacao = selecao.exclude(no_status)
+        if violacao is not None:
+            atualizacao = atualizacao.exclude(violacao)
+        # Diferenças, histórico e UPDATE usam o mesmo WHERE na mesma transação:
+        # saem das linhas que o UPDATE altera, e não da contagem acima
+        diferencas = diferenca_status(atualizacao, status_alvo)
+        registrar_alteracao_em_conjunto(atualizacao, {'status_anvisa': status_alvo}, agora)
+        resultado['atualizados'] = atualizacao.update(status_anvisa=status_alvo, data_atualizacao=agora)
+        ajustar(diferencas)
+        if resultado['atualizados']:
+            incrementar_versao()
+
+    return resultado
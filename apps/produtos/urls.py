@@ -10,5 +10,13 @@ urlpatterns = [
     
     # URLs para API (backend)
     path('api/produtos/', views.produtos_api, name='produtos_api'),
+    path('api/produtos/<int:pk>/', views.produto_detalhe_api, name='produto_detalhe_api'),
+    path('api/produtos/<int:pk>/similares/', views.produtos_similares_api, name='produtos_similares_api'),
     path('api/produtos/risco/', views.produtos_risco_api, name='produtos_risco_api'),
+    path('api/produtos/analise/', views.produtos_analise_api, name='produtos_analise_api'),
+    path('api/produtos/status/', views.produtos_status_api, name='produtos_status_api'),
+    path('api/produtos/metricas/', views.metricas_api, name='metricas_api'),
+    path('api/tarefas/', views.tarefas_api, name='tarefas_api'),
+    path('api/tarefas/<int:pk>/', views.tarefa_api, name='tarefa_api'),
+    path('api/tarefas/<int:pk>/resultado/', views.tarefa_resultado_api, name='tarefa_resultado_api'),
 ]
@@ -1,18 +1,206 @@
-from django.shortcuts import render
-from django.http import JsonResponse
-from rest_framework import status
+import hashlib
+import heapq
+from functools import cached_property
+
+from datetime import datetime, time
+
+from django.shortcuts import get_object_or_404, render
+from django.urls import reverse
+from django.http import FileResponse, Http404, JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_headers
+from rest_framework import serializers, status
 from rest_framework.decorators import api_view
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from .models import Produto
-from .serializers import ProdutoSerializer
+from . import admissao
+from .catalogo import versao_da_requisicao
+from .coalescencia import coalescer_leituras, grupo_leituras
+from .contagens import FILTRO_RISCO, contar
+from .duplicados import possiveis_duplicados
+from .historico import HistoricoExtenso, produto_em, produtos_em
+from .idempotencia import idempotente
+from .models import Produto, ProdutoArquivado, Tarefa
+from .serializers import (
+    NovaTarefaSerializer,
+    ParametrosAnaliseSerializer,
+    ParametrosSimilaresSerializer,
+    ProdutoSerializer,
+    TarefaSerializer,
+    TransicaoStatusSerializer,
+)
+from .similares import indice_similares, vizinhos_no_banco
+from .tarefas import diretorio_tarefas, enfileirar, salvar_entrada
+from .transicoes import TransicaoRejeitada, transicionar_status
 
 # Create your views here.
 
+# Produtos renderizados no servidor na página inicial
+TAMANHO_PRIMEIRA_PAGINA = 50
+
+# Validade do fragmento da tabela em cache (a chave já muda a cada versão do catálogo)
+TEMPO_CACHE_TABELA = 60 * 60
+
+class PrimeiraPagina:
+    """
+    Dados da primeira página da listagem, consultados só quando o template os usa.
+
+    Se o fragmento da tabela estiver em cache, nenhum atributo é acessado e
+    nenhuma consulta é feita.
+    """
+
+    @cached_property
+    def _produtos(self):
+        return list(Produto.objects.all()[:TAMANHO_PRIMEIRA_PAGINA + 1])
+
+    @property
+    def produtos(self):
+        return self._produtos[:TAMANHO_PRIMEIRA_PAGINA]
+
+    @property
+    def tem_mais(self):
+        return len(self._produtos) > TAMANHO_PRIMEIRA_PAGINA
+
+    @cached_property
+    def total_risco(self):
+        return contar(FILTRO_RISCO)[0]
+
+def _contexto_serializacao(request):
+    """
+    Contexto do serializer conforme o renderer negociado para a requisição.
+    """
+    return {
+        'request': request,
+        'decimal_nativo': getattr(request.accepted_renderer, 'decimal_nativo', False),
+    }
+
+def _parametro_as_of(request):
+    """
+    Lê o parâmetro `as_of` (data ou data/hora ISO 8601).
+
+    Uma data sem hora refere-se ao fim daquele dia no fuso do projeto.
+    """
+    valor = request.query_params.get('as_of')
+    if not valor:
+        return None
+
+    momento = parse_datetime(valor)
+    if momento is None:
+        data = parse_date(valor)
+        if data is None:
+            raise ValidationError({'as_of': 'Informe uma data ou data/hora no formato ISO 8601.'})
+        momento = datetime.combine(data, time.max)
+    if timezone.is_naive(momento):
+        momento = timezone.make_aware(momento)
+    return momento
+
+def _listagem_em(momento):
+    """
+    Produtos como estavam em `momento`, ou erro 400 se o histórico a ler é extenso demais.
+    """
+    try:
+        return produtos_em(momento)
+    except HistoricoExtenso as erro:
+        raise ValidationError({
+            'as_of': f'O histórico até esta data passa de {erro.limite} registros; consulte os produtos individualmente.'
+        })
+
+def _parametro_incluir_arquivados(parametros):
+    """
+    Lê o parâmetro `incluir_arquivados` (true/false, 1/0...) de um QueryDict.
+    """
+    valor = parametros.get('incluir_arquivados')
+    if not valor:
+        return False
+    try:
+        return serializers.BooleanField().run_validation(valor)
+    except ValidationError as erro:
+        raise ValidationError({'incluir_arquivados': erro.detail})
+
+def _com_arquivados(ativos, arquivados):
+    """
+    Junta produtos ativos e arquivados na ordenação padrão (mais recentes primeiro).
+    """
+    return list(heapq.merge(ativos, arquivados, key=lambda produto: produto.data_criacao, reverse=True))
+
+def _com_total(resposta, filtros=None):
+    """
+    Informa o total de produtos ativos que atendem a `filtros` nos cabeçalhos
+    `X-Total-Count` e `X-Total-Count-Exato` (false quando o total é estimado).
+    """
+    total, exato = contar(filtros)
+    resposta['X-Total-Count'] = str(total)
+    resposta['X-Total-Count-Exato'] = 'true' if exato else 'false'
+    return resposta
+
+def _etag(request, *partes):
+    """
+    Monta um ETag a partir das partes informadas e da representação pedida.
+    """
+    chave = ':'.join(
+        [str(parte) for parte in partes]
+        + [request.get_full_path(), request.META.get('HTTP_ACCEPT', '')]
+    )
+    return hashlib.blake2b(chave.encode('utf-8'), digest_size=12).hexdigest()
+
+def _etag_catalogo(request, *args, **kwargs):
+    """
+    ETag das listagens, derivado da versão do catálogo.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    return _etag(request, versao_da_requisicao(request).versao)
+
+def _ultima_modificacao_catalogo(request, *args, **kwargs):
+    """
+    Last-Modified das listagens: momento da última escrita no catálogo.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    return versao_da_requisicao(request).atualizado_em
+
+def _ultima_modificacao_produto(request, pk):
+    """
+    Data de atualização de um produto, consultada sem carregar a linha inteira.
+    """
+    if not hasattr(request, '_ultima_modificacao_produto'):
+        ultima_modificacao = (
+            Produto.objects.filter(pk=pk).values_list('data_atualizacao', flat=True).first()
+        )
+        try:
+            incluir_arquivados = _parametro_incluir_arquivados(request.GET)
+        except ValidationError:
+            # O erro é informado pela própria view
+            incluir_arquivados = False
+        if ultima_modificacao is None and incluir_arquivados:
+            ultima_modificacao = (
+                ProdutoArquivado.objects.filter(pk=pk).values_list('data_atualizacao', flat=True).first()
+            )
+        request._ultima_modificacao_produto = ultima_modificacao
+    return request._ultima_modificacao_produto
+
+def _etag_produto(request, pk):
+    """
+    ETag de um produto, derivado da sua data de atualização.
+    """
+    ultima_modificacao = _ultima_modificacao_produto(request, pk)
+    if ultima_modificacao is None:
+        return None
+    return _etag(request, pk, ultima_modificacao.timestamp())
+
 def index(request):
     """
     View para a página inicial que lista produtos.
+    A primeira página e o total de produtos de risco já vêm renderizados.
     """
-    return render(request, 'produtos/index.html')
+    return render(request, 'produtos/index.html', {
+        'pagina': PrimeiraPagina(),
+        'versao_catalogo': versao_da_requisicao(request).versao,
+        'tempo_cache_tabela': TEMPO_CACHE_TABELA,
+    })
 
 def cadastro(request):
     """
@@ -20,34 +208,227 @@ def cadastro(request):
     """
     return render(request, 'produtos/cadastro.html')
 
-@api_view(['GET', 'POST'])
+@gzip_page
+@vary_on_headers('Accept')
+@condition(etag_func=_etag_catalogo, last_modified_func=_ultima_modificacao_catalogo)
+@coalescer_leituras
+@idempotente
+@api_view(['GET', 'HEAD', 'POST'])
 def produtos_api(request):
     """
     API para listar e criar produtos.
-    GET: Lista todos os produtos
-    POST: Cria um novo produto
+    GET: Lista os produtos ativos (com `?incluir_arquivados=true`, também os arquivados;
+         com `?as_of=`, como estavam na data). Sem esses parâmetros, o total vem em
+         `X-Total-Count`; HEAD responde só os cabeçalhos, sem consultar a listagem
+    POST: Cria um novo produto, informando produtos já cadastrados com nome semelhante
+          (aceita `Idempotency-Key`)
     """
-    if request.method == 'GET':
-        produtos = Produto.objects.all()
-        serializer = ProdutoSerializer(produtos, many=True)
-        return Response(serializer.data)
+    if request.method in ('GET', 'HEAD'):
+        as_of = _parametro_as_of(request)
+        total = False
+        if as_of:
+            produtos = _listagem_em(as_of)
+        elif _parametro_incluir_arquivados(request.query_params):
+            produtos = _com_arquivados(Produto.objects.all(), ProdutoArquivado.objects.all())
+        else:
+            produtos = Produto.objects.all()
+            total = True
+        
+        if request.method == 'HEAD' and total:
+            return _com_total(Response())
+        serializer = ProdutoSerializer(produtos, many=True, context=_contexto_serializacao(request))
+        resposta = Response(serializer.data)
+        return _com_total(resposta) if total else resposta
     
     elif request.method == 'POST':
-        serializer = ProdutoSerializer(data=request.data)
+        serializer = ProdutoSerializer(data=request.data, context=_contexto_serializacao(request))
         if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            produto = serializer.save()
+            dados = serializer.data
+            dados['possiveis_duplicados'] = possiveis_duplicados(produto)
+            return Response(dados, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+@gzip_page
+@vary_on_headers('Accept')
+@condition(etag_func=_etag_produto, last_modified_func=_ultima_modificacao_produto)
 @api_view(['GET'])
+def produto_detalhe_api(request, pk):
+    """
+    API para consultar um produto (ou como estava em `?as_of=`).
+    Produtos arquivados só são encontrados com `?incluir_arquivados=true`.
+    """
+    as_of = _parametro_as_of(request)
+    if as_of:
+        produto = produto_em(pk, as_of)
+        if produto is None:
+            raise Http404("Produto não existia na data informada.")
+    elif _parametro_incluir_arquivados(request.query_params):
+        produto = (
+            Produto.objects.filter(pk=pk).first()
+            or get_object_or_404(ProdutoArquivado, pk=pk)
+        )
+    else:
+        produto = get_object_or_404(Produto, pk=pk)
+    serializer = ProdutoSerializer(produto, context=_contexto_serializacao(request))
+    return Response(serializer.data)
+
+@gzip_page
+@vary_on_headers('Accept')
+@condition(etag_func=_etag_catalogo, last_modified_func=_ultima_modificacao_catalogo)
+@api_view(['GET'])
+def produtos_similares_api(request, pk):
+    """
+    API com os `k` produtos de perfil THC/CBD mais próximo, na mesma categoria terapêutica.
+    Usa o índice espacial em memória, sincronizado com a versão atual do catálogo;
+    a requisição nunca carrega o índice inteiro: sem ele, a busca é feita no banco.
+    """
+    parametros = ParametrosSimilaresSerializer(data=request.query_params)
+    parametros.is_valid(raise_exception=True)
+    
+    if indice_similares.sincronizar(versao_da_requisicao(request).versao, reconstruir=False):
+        vizinhos = indice_similares.vizinhos(pk, parametros.validated_data['k'])
+    else:
+        vizinhos = vizinhos_no_banco(pk, parametros.validated_data['k'])
+    if vizinhos is None:
+        raise Http404("Produto não encontrado.")
+    
+    produtos = Produto.objects.in_bulk([produto_id for _, produto_id in vizinhos])
+    similares = []
+    for distancia, produto_id in vizinhos:
+        if produto_id not in produtos:
+            continue
+        dados = ProdutoSerializer(produtos[produto_id], context=_contexto_serializacao(request)).data
+        dados['distancia'] = round(distancia, 4)
+        similares.append(dados)
+    return Response({'produto': pk, 'similares': similares})
+
+@gzip_page
+@vary_on_headers('Accept')
+@condition(etag_func=_etag_catalogo, last_modified_func=_ultima_modificacao_catalogo)
+@coalescer_leituras
+@api_view(['GET', 'HEAD'])
 def produtos_risco_api(request):
     """
     API para listar produtos com risco (THC > 0.3% e categoria específica).
+    Aceita `?as_of=` para consultar os produtos de risco em uma data passada
+    e `?incluir_arquivados=true` para incluir os arquivados. Sem esses
+    parâmetros, o total vem em `X-Total-Count`.
     """
-    produtos = Produto.objects.filter(
-        thc_percentual__gt=0.3,
-        categoria_terapeutica__in=['neurologia', 'pediatria']
-    )
+    as_of = _parametro_as_of(request)
+    total = False
+    if as_of:
+        produtos = [produto for produto in _listagem_em(as_of) if produto.tem_risco]
+    else:
+        produtos = Produto.objects.filter(**FILTRO_RISCO)
+        if _parametro_incluir_arquivados(request.query_params):
+            produtos = _com_arquivados(produtos, ProdutoArquivado.objects.filter(**FILTRO_RISCO))
+        else:
+            total = True
     
-    serializer = ProdutoSerializer(produtos, many=True)
-    return Response(serializer.data)
+    if request.method == 'HEAD' and total:
+        return _com_total(Response(), FILTRO_RISCO)
+    serializer = ProdutoSerializer(produtos, many=True, context=_contexto_serializacao(request))
+    resposta = Response(serializer.data)
+    return _com_total(resposta, FILTRO_RISCO) if total else resposta
+
+@gzip_page
+@vary_on_headers('Accept')
+@condition(etag_func=_etag_catalogo, last_modified_func=_ultima_modificacao_catalogo)
+@api_view(['GET'])
+def produtos_analise_api(request):
+    """
+    API com a distribuição de THC/CBD (percentis, histogramas e razão THC:CBD)
+    no geral, por categoria terapêutica e por tipo de espectro.
+    Calculada sobre o instantâneo em memória da versão atual do catálogo.
+    """
+    # Importado na primeira chamada: NumPy é caro na inicialização dos workers
+    from .analitico import analisar, instantaneo_atual
+    
+    parametros = ParametrosAnaliseSerializer(data=request.query_params)
+    parametros.is_valid(raise_exception=True)
+    
+    instantaneo = instantaneo_atual(versao_da_requisicao(request).versao)
+    return Response(analisar(instantaneo, **parametros.validated_data))
+
+@idempotente
+@api_view(['POST'])
+def produtos_status_api(request):
+    """
+    API para transição de status ANVISA em lote.
+    Seleciona por `ids` e/ou `filtro` e aplica a regra de THC no próprio UPDATE.
+    Aceita `Idempotency-Key`.
+    """
+    serializer = TransicaoStatusSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        resultado = transicionar_status(
+            serializer.validated_data['status_anvisa'],
+            ids=serializer.validated_data.get('ids'),
+            filtro=serializer.validated_data.get('filtro'),
+            modo=serializer.validated_data['modo'],
+        )
+    except TransicaoRejeitada as erro:
+        return Response(
+            {'detail': str(erro), **erro.resultado, 'atualizados': 0},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    return Response(resultado)
+
+@idempotente
+@api_view(['POST'])
+def tarefas_api(request):
+    """
+    API para enfileirar tarefas longas (importação, exportação e auditoria).
+    A tarefa é executada pelo `manage.py run_workers`; acompanhe pelo endpoint da tarefa.
+    Aceita `Idempotency-Key`, para que a repetição não enfileire a tarefa de novo.
+    """
+    serializer = NovaTarefaSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    dados = serializer.validated_data
+    if dados['tipo'] == 'importacao':
+        parametros = {'arquivo': salvar_entrada(dados['arquivo'])}
+    elif dados['tipo'] == 'exportacao':
+        parametros = {'formato': dados['formato']}
+    else:
+        parametros = {}
+    
+    tarefa = enfileirar(dados['tipo'], parametros, max_tentativas=dados['max_tentativas'])
+    resposta = TarefaSerializer(tarefa, context={'request': request}).data
+    url = reverse('produtos:tarefa_api', args=[tarefa.pk])
+    return Response(resposta, status=status.HTTP_202_ACCEPTED, headers={'Location': url})
+
+@api_view(['GET'])
+def tarefa_api(request, pk):
+    """
+    API para consultar o status e o progresso de uma tarefa.
+    """
+    tarefa = get_object_or_404(Tarefa, pk=pk)
+    return Response(TarefaSerializer(tarefa, context={'request': request}).data)
+
+def tarefa_resultado_api(request, pk):
+    """
+    Download do arquivo de resultado de uma tarefa.
+    """
+    tarefa = get_object_or_404(Tarefa, pk=pk)
+    if not tarefa.arquivo_resultado:
+        raise Http404("Tarefa sem arquivo de resultado.")
+    caminho = diretorio_tarefas() / tarefa.arquivo_resultado
+    if not caminho.is_file():
+        raise Http404("Arquivo de resultado não encontrado.")
+    return FileResponse(open(caminho, 'rb'), as_attachment=True, filename=caminho.name)
+
+@api_view(['GET'])
+def metricas_api(request):
+    """
+    API com contadores internos deste processo (coalescência de leituras e
+    controle de admissão).
+    """
+    return Response({
+        'coalescencia': grupo_leituras.estatisticas(),
+        'admissao': admissao.estatisticas(),
+    })
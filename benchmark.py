@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+"""
+Script de benchmarks do Sistema de Produtos
+Django 4.x + DRF - Sistema de Produtos
+
+Compara o custo de codificação e o tamanho na rede das respostas da API:
+- JSON (renderer padrão do DRF) x CBOR (renderer binário da aplicação)
+- Com e sem compressão gzip
+
+E o custo da análise de distribuição de THC/CBD:
+- ORM + Python (instanciar cada Produto e agrupar) x instantâneo NumPy
+
+E a busca de produtos similares (k vizinhos mais próximos em THC/CBD):
+- Força bruta x índice espacial em grade
+
+Os produtos são gerados em memória; a análise usa um banco de teste em memória.
+"""
+
+import argparse
+import math
+import os
+import random
+import statistics
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+import django
+
+# Configurar Django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'setup.settings')
+django.setup()
+
+from django.db import connection
+from django.utils import timezone
+from django.utils.text import compress_string
+from rest_framework.renderers import JSONRenderer
+
+from apps.produtos.analitico import PERCENTIS, Instantaneo, analisar
+from apps.produtos.models import Produto
+from apps.produtos.renderers import CBORRenderer, cbor2
+from apps.produtos.serializers import ProdutoSerializer
+from apps.produtos.similares import IndiceSimilares
+
+
+def gerar_produtos(quantidade):
+    """Gera produtos em memória com valores variados"""
+    agora = timezone.now()
+    espectros = [valor for valor, _ in Produto.TIPO_ESPECTRO_CHOICES]
+    categorias = [valor for valor, _ in Produto.CATEGORIA_TERAPEUTICA_CHOICES]
+    status = [valor for valor, _ in Produto.STATUS_ANVISA_CHOICES]
+
+    return [
+        Produto(
+            id=i,
+            nome=f'Produto de Exemplo {i}',
+            tipo_espectro=espectros[i % len(espectros)],
+            thc_percentual=Decimal(i % 150) / 100,
+            cbd_percentual=Decimal(i % 2500) / 100,
+            categoria_terapeutica=categorias[i % len(categorias)],
+            status_anvisa=status[i % len(status)],
+            data_criacao=agora,
+            data_atualizacao=agora,
+        )
+        for i in range(1, quantidade + 1)
+    ]
+
+
+def cronometrar(funcao, repeticoes):
+    """Executa a função `repeticoes` vezes e retorna (melhor tempo, resultado)"""
+    melhor = None
+    resultado = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        decorrido = time.perf_counter() - inicio
+        melhor = decorrido if melhor is None else min(melhor, decorrido)
+    return melhor, resultado
+
+
+def benchmark_renderers(quantidade, repeticoes):
+    """Compara JSON x CBOR em tempo de codificação e bytes na rede"""
+    print(f"\n📦 RENDERERS ({quantidade} produtos, melhor de {repeticoes})")
+    print("=" * 60)
+    print(f"CBOR: {'cbor2' if cbor2 is not None else 'codificador puro Python'}")
+
+    produtos = gerar_produtos(quantidade)
+    formatos = [
+        ('JSON (DRF)', JSONRenderer(), {}),
+        ('CBOR', CBORRenderer(), {'decimal_nativo': True}),
+    ]
+
+    print(f"\n{'Formato':<12}{'serializar':>12}{'codificar':>12}{'bytes':>14}{'gzip':>12}{'gzip (s)':>10}")
+    for nome, renderer, contexto in formatos:
+        tempo_serializacao, dados = cronometrar(
+            lambda: ProdutoSerializer(produtos, many=True, context=contexto).data,
+            repeticoes,
+        )
+        tempo_codificacao, corpo = cronometrar(lambda: renderer.render(dados), repeticoes)
+        tempo_gzip, comprimido = cronometrar(lambda: compress_string(corpo), repeticoes)
+        print(
+            f"{nome:<12}{tempo_serializacao * 1000:>10.1f}ms{tempo_codificacao * 1000:>10.1f}ms"
+            f"{len(corpo):>14,}{len(comprimido):>12,}{tempo_gzip * 1000:>8.1f}ms"
+        )
+
+
+def analise_orm():
+    """Percentis de THC/CBD por categoria calculados em Python sobre o ORM"""
+    grupos = defaultdict(lambda: {'thc': [], 'cbd': []})
+    for produto in Produto.objects.all():
+        for chave in ('geral', produto.categoria_terapeutica, produto.tipo_espectro):
+            grupos[chave]['thc'].append(float(produto.thc_percentual))
+            grupos[chave]['cbd'].append(float(produto.cbd_percentual))
+
+    resultado = {}
+    for chave, colunas in grupos.items():
+        resultado[chave] = {}
+        for coluna, valores in colunas.items():
+            quantis = statistics.quantiles(valores, n=100, method='inclusive') if len(valores) > 1 else valores * 99
+            resultado[chave][coluna] = {
+                'media': statistics.fmean(valores),
+                'percentis': [quantis[p - 1] for p in PERCENTIS],
+            }
+    return resultado
+
+
+def benchmark_analise(quantidade, repeticoes):
+    """Compara a análise de THC/CBD via ORM + Python x instantâneo NumPy"""
+    print(f"\n📊 ANÁLISE THC/CBD ({quantidade} produtos, melhor de {repeticoes})")
+    print("=" * 60)
+
+    nome_banco = connection.creation.create_test_db(verbosity=0)
+    try:
+        Produto.objects.bulk_create(gerar_produtos(quantidade), batch_size=500)
+
+        tempo_orm, esperado = cronometrar(analise_orm, repeticoes)
+        tempo_carga, instantaneo = cronometrar(lambda: Instantaneo.carregar(versao=0), repeticoes)
+        tempo_calculo, analise = cronometrar(lambda: analisar(instantaneo), repeticoes)
+
+        print(f"\n{'Abordagem':<34}{'tempo':>12}")
+        print(f"{'ORM + Python':<34}{tempo_orm * 1000:>10.1f}ms")
+        print(f"{'Instantâneo: carga (por versão)':<34}{tempo_carga * 1000:>10.1f}ms")
+        print(f"{'Instantâneo: cálculo (por leitura)':<34}{tempo_calculo * 1000:>10.1f}ms")
+        print(f"\nGanho por leitura com o instantâneo carregado: {tempo_orm / tempo_calculo:.0f}x")
+
+        mediana_orm = esperado['geral']['thc']['percentis'][PERCENTIS.index(50)]
+        mediana_numpy = analise['geral']['thc']['percentis']['p50']
+        situacao = '✅' if abs(mediana_orm - mediana_numpy) < 1e-3 else '❌'
+        print(f"{situacao} Mediana de THC: ORM {mediana_orm:.4f} x NumPy {mediana_numpy:.4f}")
+    finally:
+        connection.creation.destroy_test_db(nome_banco, verbosity=0)
+
+
+def benchmark_similares(quantidade, consultas, k=10):
+    """Compara a busca de similares por força bruta x índice em grade"""
+    print(f"\n🧭 SIMILARES ({quantidade:,} pontos, {consultas} consultas, k={k})")
+    print("=" * 60)
+
+    aleatorio = random.Random(42)
+    categorias = [valor for valor, _ in Produto.CATEGORIA_TERAPEUTICA_CHOICES]
+    pontos = [
+        (i, aleatorio.choice(categorias), round(aleatorio.uniform(0, 30), 2), round(aleatorio.uniform(0, 30), 2))
+        for i in range(1, quantidade + 1)
+    ]
+
+    inicio = time.perf_counter()
+    indice = IndiceSimilares()
+    for ponto in pontos:
+        indice.inserir(*ponto)
+    tempo_construcao = time.perf_counter() - inicio
+
+    amostra = aleatorio.sample(pontos, consultas)
+    inicio = time.perf_counter()
+    respostas = [indice.vizinhos(ponto[0], k) for ponto in amostra]
+    tempo_indice = (time.perf_counter() - inicio) / consultas
+
+    # Força bruta só em parte da amostra: é lenta demais para todas
+    conferidas = amostra[:max(1, min(consultas, 5))]
+    inicio = time.perf_counter()
+    esperadas = [
+        sorted(
+            (math.hypot(thc - ponto[2], cbd - ponto[3]), produto_id)
+            for produto_id, categoria, thc, cbd in pontos
+            if categoria == ponto[1] and produto_id != ponto[0]
+        )[:k]
+        for ponto in conferidas
+    ]
+    tempo_bruto = (time.perf_counter() - inicio) / len(conferidas)
+
+    print(f"\n{'Abordagem':<34}{'tempo':>12}")
+    print(f"{'Índice: construção':<34}{tempo_construcao * 1000:>10.1f}ms")
+    print(f"{'Índice: consulta':<34}{tempo_indice * 1000:>10.3f}ms")
+    print(f"{'Força bruta: consulta':<34}{tempo_bruto * 1000:>10.1f}ms")
+
+    corretas = all(
+        [distancia for distancia, _ in resposta] == [distancia for distancia, _ in esperada]
+        for resposta, esperada in zip(respostas, esperadas)
+    )
+    print(f"{'✅' if corretas else '❌'} Vizinhos iguais aos da força bruta")
+
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description='Benchmarks do Sistema de Produtos')
+    parser.add_argument('--quantidade', type=int, default=10000, help='Número de produtos gerados')
+    parser.add_argument('--repeticoes', type=int, default=5, help='Repetições de cada medição')
+    parser.add_argument('--pontos-similares', type=int, default=1000000, help='Pontos no índice de similares')
+    parser.add_argument('--consultas', type=int, default=1000, help='Consultas de similares medidas')
+    args = parser.parse_args()
+
+    print("🚀 BENCHMARKS DO SISTEMA DE PRODUTOS")
+    print("=" * 60)
+
+    benchmark_renderers(args.quantidade, args.repeticoes)
+    benchmark_analise(args.quantidade, args.repeticoes)
+    benchmark_similares(args.pontos_similares, args.consultas)
+
+
+if __name__ == '__main__':
+    main()
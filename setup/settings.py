@@ -45,6 +45,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'apps.produtos.admissao.AdmissaoMiddleware',
+    'apps.produtos.perfilamento.PerfilamentoMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -81,6 +83,10 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Espera pelo lock de escrita em vez de falhar com "database is locked"
+            'timeout': 20,
+        },
     }
 }
 
@@ -125,7 +131,115 @@ STATICFILES_DIRS = [
     BASE_DIR / 'apps' / 'produtos' / 'static',
 ]
 
+# Nomes com hash e variantes .gz geradas no collectstatic
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'apps.produtos.estaticos.ManifestGzipStaticFilesStorage',
+    },
+}
+
+# Serve o STATIC_ROOT pela própria aplicação, sem servidor web externo. Com
+# DEBUG, o runserver serve /static/ das pastas de origem antes desta view.
+SERVIR_ESTATICOS = config('SERVIR_ESTATICOS', default=True, cast=bool)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Fila de tarefas (manage.py run_workers)
+# Arquivos de entrada e de resultado das tarefas
+TAREFAS_DIR = BASE_DIR / 'tarefas'
+
+# Segundos sem atualização após os quais uma tarefa em execução é considerada abandonada
+TAREFAS_TEMPO_LIMITE = 60 * 60
+
+# Perfilamento de requisições (cProfile + SQL), desligado por padrão.
+# Perfila requisições com cabeçalho X-Perfilar assinado ou sorteadas pela taxa.
+PERFILAMENTO = {
+    'ATIVO': config('PERFILAMENTO_ATIVO', default=False, cast=bool),
+    'TAXA_AMOSTRAGEM': config('PERFILAMENTO_TAXA_AMOSTRAGEM', default=0.0, cast=float),
+    'DIRETORIO': BASE_DIR / 'perfis',
+    'MAXIMO_ARQUIVOS': 50,
+    'VALIDADE_TOKEN': 60 * 60,
+}
+
+# Controle de admissão da API: limite de taxa por cliente (balde de fichas)
+# e de requisições simultâneas por endpoint; o excedente recebe 429/503 com
+# Retry-After. BACKEND 'compartilhado' divide os baldes entre os workers.
+# O cliente é o REMOTE_ADDR: atrás de um proxy reverso todos os clientes
+# dividem o balde do proxy (20 req/s no total) até que
+# ADMISSAO_CONFIAR_X_FORWARDED_FOR seja ligado.
+ADMISSAO = {
+    'ATIVO': config('ADMISSAO_ATIVA', default=True, cast=bool),
+    'PREFIXOS': ['/api/'],
+    'TAXA_POR_CLIENTE': config('ADMISSAO_TAXA_POR_CLIENTE', default=20.0, cast=float),
+    'RAJADA_POR_CLIENTE': config('ADMISSAO_RAJADA_POR_CLIENTE', default=40, cast=int),
+    'BACKEND': config('ADMISSAO_BACKEND', default='local'),
+    'CONFIAR_X_FORWARDED_FOR': config('ADMISSAO_CONFIAR_X_FORWARDED_FOR', default=False, cast=bool),
+    'CONCORRENCIA_POR_ENDPOINT': config('ADMISSAO_CONCORRENCIA_POR_ENDPOINT', default=8, cast=int),
+    'LIMITES_ENDPOINT': {
+        # Listagem completa e criação disputam a escrita do SQLite
+        'produtos:produtos_api': 4,
+    },
+    'ALVO_LATENCIA': config('ADMISSAO_ALVO_LATENCIA', default=0.5, cast=float),
+}
+
+# Aquecimento do worker (setup/wsgi.py), antes de aceitar tráfego: URLs,
+# templates, conexão com o banco, páginas em PAGINAS e índices em memória.
+# Tempos da partida: manage.py tempo_inicializacao
+AQUECIMENTO = {
+    'ATIVO': config('AQUECIMENTO_ATIVO', default=True, cast=bool),
+    'PAGINAS': ['/', '/cadastro/'],
+    'INDICES': config('AQUECIMENTO_INDICES', default=True, cast=bool),
+}
+
+# Consultas no tempo (?as_of=): a listagem lê todo o histórico até a data e
+# responde 400 acima deste número de registros (o detalhe de um produto não tem limite).
+HISTORICO = {
+    'LIMITE_REGISTROS_LISTAGEM': config('HISTORICO_LIMITE_REGISTROS_LISTAGEM', default=200000, cast=int),
+}
+
+# Chaves de idempotência (cabeçalho Idempotency-Key) nos POSTs de criação e em lote.
+# Limpeza das expiradas: manage.py limpar_idempotencia
+IDEMPOTENCIA = {
+    'VALIDADE_HORAS': config('IDEMPOTENCIA_VALIDADE_HORAS', default=24, cast=int),
+    # Segundos que uma repetição espera pela requisição original em execução
+    'ESPERA_MAXIMA': 10,
+    # Segundos após os quais uma chave ainda em execução é considerada abandonada
+    'TEMPO_ABANDONO': 60,
+}
+
+# Política de arquivamento (manage.py arquivar_produtos): produtos com estes
+# status e sem atualização há IDADE_DIAS saem da tabela ativa, em lotes.
+ARQUIVAMENTO = {
+    'STATUS': ['reprovado'],
+    'IDADE_DIAS': config('ARQUIVAMENTO_IDADE_DIAS', default=365, cast=int),
+    'TAMANHO_LOTE': 500,
+}
+
+# Manutenção do SQLite (manage.py manutencao_db): integridade, vacuum incremental,
+# ANALYZE e checkpoint do WAL em passos curtos, dentro de TEMPO_MAXIMO segundos.
+MANUTENCAO_DB = {
+    'TEMPO_MAXIMO': config('MANUTENCAO_DB_TEMPO_MAXIMO', default=60.0, cast=float),
+    # Pausa entre os passos, para as escritas da API obterem o lock
+    'PAUSA_ENTRE_PASSOS': 0.05,
+    'PAGINAS_POR_PASSO': 256,
+    # Linhas lidas por índice no ANALYZE (PRAGMA analysis_limit)
+    'LIMITE_ANALISE': 1000,
+    'CHECKPOINT': config('MANUTENCAO_DB_CHECKPOINT', default='PASSIVE'),
+}
+
+# Django REST Framework
+# Além de JSON, a API negocia CBOR para consumidores serviço-a-serviço.
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'apps.produtos.renderers.CBORRenderer',
+    ],
+}
@@ -14,10 +14,18 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
+
+from apps.produtos.estaticos import servir_estatico
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('apps.produtos.urls')),
 ]
+
+if settings.SERVIR_ESTATICOS:
+    urlpatterns += [
+        re_path(r'^%s(?P<caminho>.+)$' % settings.STATIC_URL.lstrip('/'), servir_estatico),
+    ]
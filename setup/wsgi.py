@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'setup.settings')
 
 application = get_wsgi_application()
+
+# Prepara URLs, templates, banco e caches antes de o worker aceitar tráfego
+from apps.produtos.inicializacao import aquecer_se_ativo  # noqa: E402
+
+aquecer_se_ativo()